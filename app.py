@@ -1,67 +1,74 @@
 import sys
-from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QLabel, QLineEdit, QPushButton, QTextEdit, QAction, QMainWindow
-from PyQt5.QtCore import QDateTime,QObject,QTimer
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout, QLabel, QLineEdit, QPushButton, QTextEdit, QComboBox, QAction, QMainWindow, QPlainTextEdit, QMessageBox
+from PyQt5.QtCore import QDateTime,QLocale,QObject,QTimer
 from PyQt5.QtCore import QThread, pyqtSignal, Qt
-from PyQt5.QtGui import QMouseEvent,QIntValidator
-import threading
+from PyQt5.QtGui import QMouseEvent,QDoubleValidator
 import time
-import requests
-import json
-from datetime import datetime
-import random
-from zee_utils import EnvDataQueue
-from zee_utils import JSONtoCSV
-from zee_widgets import LineChartWidget, ClickableLineEdit
+from zee_utils import SENSOR_FIELDS, SENSOR_SCHEMA, format_value, format_alert
+from zee_utils.collector import Collector, build_arg_parser, collector_options, positive_float
+from zee_utils.collector_process import CollectorProcess
+from zee_utils.metrics import METRICS, stage_timer
+import zee_widgets
+from zee_widgets import ClickableLineEdit, SmallMultiplesWidget, StripChartWidget
+
+_UI_UPDATE_SECONDS = stage_timer("ui_update")
+_CHART_SECONDS = stage_timer("chart_draw")
+
+FIELDS_PER_ROW = 4
 
 
 # 设计一个线程后台拉取数据，每隔固定时间根据当前激活的lineEdit来刷新canvas
+# 拉取、缓冲、存储和告警都由 Collector 在后台线程中完成，结果通过信号排队送回 GUI 线程
+# 传入 devices 时进入多站点模式，由 FleetPoller 按各站点的周期并发轮询
+# use_process=True 时 Collector 运行在独立的采集进程中，环形缓冲区在共享内存里，
+# 不发出 data_updated，界面直接读取缓冲区中最新的样本
 class SensorThread(QObject):
-    data_updated = pyqtSignal(dict)
+    data_updated = pyqtSignal(object)  # SensorSample
+    alert_raised = pyqtSignal(object)
 
-    def __init__(self, parent=None):
+    def __init__(self, collector_options=None, parent=None, use_process=False):
         super().__init__(parent)
-        self.url = "http://192.168.2.222:33200/sensor/getAllSensor"
-        self.update_interval = 1  # 默认更新周期为1秒
+        self.update_interval = 1  # 默认更新周期为1秒，可以小于 1 秒
         self.is_running = False
-        self.timer = QTimer()
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        # 使用时间戳作为文件名的一部分
-        csv_filename = f"./env-data/env_data_{timestamp}.csv"
-        self.json_to_csv = JSONtoCSV(csv_filename=csv_filename)
+        self.use_process = use_process
+        # 已发出和界面已处理的样本数，两者之差即排队等待界面处理的信号数
+        self.emitted = 0
+        self.handled = 0
+        if use_process:
+            self.collector = CollectorProcess(on_alert=self.alert_raised.emit, **(collector_options or {}))
+        else:
+            self.collector = Collector(on_data=self.emit_data, on_alert=self.alert_raised.emit,
+                                       **(collector_options or {}))
+        self.devices = self.collector.devices
+        METRICS.gauge("env_ui_queue_depth", "等待界面处理的样本数", fn=lambda: self.emitted - self.handled)
+
+    def emit_data(self, json_sensor_data):
+        self.emitted += 1
+        self.data_updated.emit(json_sensor_data)
 
     def set_update_interval(self, interval):
         self.update_interval = interval
+        self.collector.set_interval(interval)
 
-    def get_sensor_data(self):
-        try:
-            response = requests.get(self.url, timeout=5)
-            if response.status_code == 200:
-                json_data = response.json()
-                json_sensor_data = json_data['data']['sensor']
-                
-                timestamp = datetime.now().timestamp()  # 获取当前时间的时间戳
-                # 将时间戳转换为 datetime 对象
-                dt = datetime.fromtimestamp(timestamp)
-                # 将 datetime 对象格式化为字符串（精确到毫秒）
-                formatted_time = dt.strftime("%Y-%m-%d %H:%M:%S.%f")  # 格式化为 "年-月-日 时:分:秒.毫秒" 的格式
-                # 将时间戳添加到 json_sensor_data 中
-                json_sensor_data['timestamp'] = formatted_time
-                self.data_updated.emit(json_sensor_data)
-                self.json_to_csv.add_data(json_sensor_data)
-            else:
-                print("请求失败，状态码：", response.status_code)
-
-        except requests.RequestException as e:
-            print("请求发生异常:", e)
+    def get_buffer(self, device_id):
+        return self.collector.get_buffer(device_id)
+
+    # 滚动统计，界面读取
+    def get_stats(self, device_id):
+        return self.collector.get_stats(device_id)
 
     def start_collection(self):
+        self.collector.start()
         self.is_running = True
-        self.timer.timeout.connect(self.get_sensor_data)
-        self.timer.start(self.update_interval * 1000)  # 根据设置的秒数转换为毫秒
 
     def stop_collection(self):
         self.is_running = False
-        self.timer.stop()
+        self.collector.stop()
+
+    # 停止采集并把各存储队列中剩余的样本写完
+    def close(self):
+        self.is_running = False
+        self.collector.close()
 
 
 class DataDisplayThread(QObject):
@@ -70,48 +77,135 @@ class DataDisplayThread(QObject):
     def __init__(self, lineChartWgt, parent=None):
         super().__init__(parent)
         self.lineChart = lineChartWgt
-        self.update_interval = 1  # 默认更新周期为1秒
+        self.update_interval = 0.1  # 图表刷新周期0.1秒，数据没有变化的帧会被跳过
         self.is_running = False
         self.timer = QTimer()
-        self.datalist = []
-        self.dataQueue = EnvDataQueue(10)
+        self.window = 600  # 图表显示的样本个数，滚轮缩放
+        self.offset = 0  # 窗口结束处距离最新样本的个数，Shift+滚轮平移
+        self.dataQueue = None
+        self.timer.timeout.connect(self.update_env_data_graph)
+        self.lineChart.zoom_requested.connect(self.zoom)
+        self.lineChart.scroll_requested.connect(self.scroll)
         
-    def setList(self, myqueue, title = "HS Data"):
-        self.dataQueue = myqueue
+    def setList(self, channel, title = "HS Data"):
+        self.dataQueue = channel
+        self.offset = 0
         self.lineChart.setTitle(title)
         pass
 
     def update_env_data_graph(self):
-        self.lineChart.update_data(self.dataQueue.get_data_list())
-        pass
+        if self.dataQueue is None:
+            return
+        start = time.perf_counter()
+        # 窗口较长时按绘图区宽度抽稀，保留峰值
+        end = self.dataQueue.version - self.offset
+        x, y = self.dataQueue.get_decimated(self.window, self.lineChart.plot_width(), end)
+        self.lineChart.update_data(y, (self.dataQueue.version, self.window, self.offset), x, self.window - 1)
+        _CHART_SECONDS.observe(time.perf_counter() - start)
+
+    def zoom(self, factor):
+        self.window = int(min(max(self.window * factor, 10), self.dataQueue.ring_buffer.capacity if self.dataQueue else 10))
+        self.update_env_data_graph()
+
+    def scroll(self, fraction):
+        if self.dataQueue is None:
+            return
+        max_offset = max(len(self.dataQueue.ring_buffer) - self.window, 0)
+        self.offset = int(min(max(self.offset + fraction * self.window, 0), max_offset))
+        self.update_env_data_graph()
 
     def start_display(self):
         self.is_running = True
-        self.timer.timeout.connect(self.update_env_data_graph)
-        self.timer.start(self.update_interval * 1000)  # 根据设置的秒数转换为毫秒
+        self.timer.start(int(self.update_interval * 1000))  # 根据设置的秒数转换为毫秒
 
     def stop_display(self):
         self.is_running = False
         self.timer.stop()
 
 
+# 多通道小图：所有字段共用同一个窗口和偏移，每帧对每个字段抽稀后更新对应的小图
+class MultiplesDisplayThread(DataDisplayThread):
+    def setList(self, channel, title = "HS Data"):
+        self.dataQueue = channel
+        self.offset = 0
+        self.lineChart.select(channel.field)
+
+    def update_env_data_graph(self):
+        if self.dataQueue is None:
+            return
+        start = time.perf_counter()
+        ring_buffer = self.dataQueue.ring_buffer
+        end = ring_buffer.version - self.offset
+        version = (ring_buffer.version, self.window, self.offset)
+        for field, panel in self.lineChart.panels.items():
+            x, y = ring_buffer.channel(field).get_decimated(self.window, panel.plot_width(), end)
+            panel.update_data(y, version, x, self.window - 1)
+        _CHART_SECONDS.observe(time.perf_counter() - start)
+
+
+# 诊断面板：各阶段耗时分位数、失败/丢弃计数和队列长度，每秒刷新
+class DiagnosticsWindow(QWidget):
+    def __init__(self, parent=None):
+        super().__init__(parent, Qt.Window)
+        self.setWindowTitle("诊断")
+        self.resize(720, 480)
+        self.text = QPlainTextEdit()
+        self.text.setReadOnly(True)
+        self.text.setStyleSheet("font-family: monospace")
+        layout = QVBoxLayout()
+        layout.addWidget(self.text)
+        self.setLayout(layout)
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.refresh)
+
+    def refresh(self):
+        self.text.setPlainText(METRICS.summary())
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start(1000)
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+
 class InputTextWindow(QMainWindow):
     current_time = ""
     lastLineEdit = None
 
-    def __init__(self):
+    def __init__(self, collector_options=None, display_rate=5, chart="matplotlib", collector_process=False):
         super().__init__()
+        self.chart = chart
 
+        collector_options = collector_options or {}
+        devices = collector_options.get("devices")
+        self.devices = devices
+        # 多站点模式下界面只显示当前选中的站点
+        self.current_device = devices[0].device_id if devices else None
         self.init_ui()
-        self.sensor_thread = SensorThread()
+        self.sensor_thread = SensorThread(collector_options, use_process=collector_process)
         self.sensor_thread.data_updated.connect(self.update_line_edits)
-        self.updateLineChartThread = DataDisplayThread(self.line_chart)
-        # 创建多个队列
-        self.noise_queue = EnvDataQueue(10)
-        self.temperature_queue = EnvDataQueue(10)
-        self.humidity_queue = EnvDataQueue(10)
-        self.pm25_queue = EnvDataQueue(10)
-        
+        self.sensor_thread.alert_raised.connect(self.on_alert)
+        # 每个站点一个环形缓冲区，保存全部 21 个字段的历史，由采集线程写入
+        self.current_buffer = self.sensor_thread.get_buffer(self.current_device)
+        if chart == "multiples":
+            self.updateLineChartThread = MultiplesDisplayThread(self.line_chart)
+            self.on_click(self.field_line_edits[SENSOR_FIELDS[0]])
+        else:
+            self.updateLineChartThread = DataDisplayThread(self.line_chart)
+        self.stats_timer = QTimer()
+        self.stats_timer.timeout.connect(self.update_stats_label)
+        self.stats_timer.start(1000)
+        # 数值按 display_rate（次/秒）刷新，与采集频率无关：期间到达的样本只保留最新一个，
+        # 刷新时只对文本有变化的控件调用 setText
+        self.pending_record = None
+        self.shown_version = None
+        self.field_texts = dict.fromkeys(self.field_line_edits, "")
+        self.display_timer = QTimer()
+        self.display_timer.timeout.connect(self.flush_line_edits)
+        self.display_timer.start(max(int(1000 / display_rate), 1))
 
     def init_ui(self):
         """初始化界面"""
@@ -126,12 +220,16 @@ class InputTextWindow(QMainWindow):
         self.tool_menu = self.menubar.addMenu("工具")
         # create a action
         self.setting_action = QAction("设置", self)
+        self.diagnostics_action = QAction("诊断", self)
         self.exit_action = QAction("退出", self)
 
         self.tool_menu.addAction(self.setting_action)
+        self.tool_menu.addAction(self.diagnostics_action)
         self.tool_menu.addAction(self.exit_action)
 
         # 连接菜单项的信号和槽函数
+        self.diagnostics_window = DiagnosticsWindow(self)
+        self.diagnostics_action.triggered.connect(self.diagnostics_window.show)
         self.exit_action.triggered.connect(self.close) 
 
         layout = QVBoxLayout()
@@ -142,12 +240,21 @@ class InputTextWindow(QMainWindow):
         hLayout.addWidget(self.label)
         self.freqLineEdit = QLineEdit()
         self.freqLineEdit.setText("1")
-        self.freqLineEdit.setValidator(QIntValidator())  # 限制只能输入整数
+        validator = QDoubleValidator(0.001, 86400, 3)  # 采集周期（秒），最小 1 毫秒
+        validator.setLocale(QLocale.c())  # 小数点固定为 "."
+        self.freqLineEdit.setValidator(validator)
         hLayout.addWidget(self.freqLineEdit)
         self.submit_button = QPushButton("开始读取")
         self.submit_button.clicked.connect(self.start_collection)
         self.submit_button.setStyleSheet("background-color: red; color: white")
         hLayout.addWidget(self.submit_button)
+        if self.devices:
+            self.freqLineEdit.setEnabled(False)  # 多站点模式下使用各站点配置的周期
+            self.deviceComboBox = QComboBox()
+            for device in self.devices:
+                self.deviceComboBox.addItem(device.device_id)
+            self.deviceComboBox.currentTextChanged.connect(self.on_device_changed)
+            hLayout.addWidget(self.deviceComboBox)
        
         layout.addLayout(hLayout)
         
@@ -188,200 +295,41 @@ class InputTextWindow(QMainWindow):
         # }
         # according the above json, the sensor part
 
-        # row 1
+        # 传感器网格按 SENSOR_SCHEMA 生成：每行 FIELDS_PER_ROW 个字段，每个字段占名称、数值、单位三列
         gridLayout = QGridLayout()
         gridLayout.setSpacing(1)   
         # q: what is setSpacing in QGridLayout?
         # a: setSpacing is a function that sets the spacing between widgets in the layout to spacing.     
-        self.noiseLabel = QLabel("噪声")
-        gridLayout.addWidget(self.noiseLabel, 0, 0)
-        self.noiseLineEdit = ClickableLineEdit()
-        self.noiseLineEdit.setReadOnly(True)
-        self.noiseLineEdit.setObjectName("noise")
-        self.noiseLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        self.noiseLineEdit.clicked.connect(self.on_click)
-        gridLayout.addWidget(self.noiseLineEdit, 0, 1)
-        self.noiseUnitLabel = QLabel("dB")
-        gridLayout.addWidget(self.noiseUnitLabel, 0, 2)
-
-        self.temperatureLabel = QLabel("温度")
-        gridLayout.addWidget(self.temperatureLabel, 0, 3)
-        self.temperatureLineEdit = ClickableLineEdit()
-        self.temperatureLineEdit.setReadOnly(True)
-        self.temperatureLineEdit.setObjectName("temperature")
-        self.temperatureLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        self.temperatureLineEdit.clicked.connect(self.on_click)
-        gridLayout.addWidget(self.temperatureLineEdit, 0, 4)
-        self.temperatureUnitLabel = QLabel("℃")
-        gridLayout.addWidget(self.temperatureUnitLabel, 0, 5)
-
-        self.humidityLabel = QLabel("湿度")
-        gridLayout.addWidget(self.humidityLabel, 0, 6)
-        self.humidityLineEdit = ClickableLineEdit()
-        self.humidityLineEdit.setReadOnly(True)
-        self.humidityLineEdit.setObjectName("humidity")
-        self.humidityLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        self.humidityLineEdit.clicked.connect(self.on_click)
-        gridLayout.addWidget(self.humidityLineEdit, 0, 7)
-        self.humidityUnitLabel = QLabel("%")
-        gridLayout.addWidget(self.humidityUnitLabel, 0, 8)
-
-        self.windspeedLabel = QLabel("风速")
-        gridLayout.addWidget(self.windspeedLabel, 0, 9)
-        self.windspeedLineEdit = ClickableLineEdit()
-        self.windspeedLineEdit.setReadOnly(True)
-        self.windspeedLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.windspeedLineEdit, 0, 10)
-        self.windspeedUnitLabel = QLabel("m/s")
-        gridLayout.addWidget(self.windspeedUnitLabel, 0, 11)
-
-        # row 2
-        self.Wind_DirectionLabel = QLabel("风向")
-        gridLayout.addWidget(self.Wind_DirectionLabel, 1, 0)
-        self.Wind_DirectionLineEdit = ClickableLineEdit()
-        self.Wind_DirectionLineEdit.setReadOnly(True)
-        self.Wind_DirectionLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.Wind_DirectionLineEdit, 1, 1)
-        self.Wind_DirectionUnitLabel = QLabel("°")
-        gridLayout.addWidget(self.Wind_DirectionUnitLabel, 1, 2)
-        self.RainfallLabel = QLabel("降雨量")
-        gridLayout.addWidget(self.RainfallLabel, 1, 3)
-        self.RainfallLineEdit = ClickableLineEdit()
-        self.RainfallLineEdit.setReadOnly(True)
-        self.RainfallLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.RainfallLineEdit, 1, 4)
-        self.RainfallUnitLabel = QLabel("mm")
-        gridLayout.addWidget(self.RainfallUnitLabel, 1, 5)
-        self.RadiationLabel = QLabel("辐射")
-        gridLayout.addWidget(self.RadiationLabel, 1, 6)
-        self.RadiationLineEdit = ClickableLineEdit()
-        self.RadiationLineEdit.setReadOnly(True)
-        self.RadiationLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.RadiationLineEdit, 1, 7)
-        self.RadiationUnitLabel = QLabel("W/m2")
-        gridLayout.addWidget(self.RadiationUnitLabel, 1, 8)
-        self.IlluminationLabel = QLabel("光照")
-        gridLayout.addWidget(self.IlluminationLabel, 1, 9)
-        self.IlluminationLineEdit = ClickableLineEdit()
-        self.IlluminationLineEdit.setReadOnly(True)
-        self.IlluminationLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.IlluminationLineEdit, 1, 10)
-        self.IlluminationUnitLabel = QLabel("Lux")
-        gridLayout.addWidget(self.IlluminationUnitLabel, 1, 11)
-
-        # row 3
-        self.AirPressureLabel = QLabel("气压")
-        gridLayout.addWidget(self.AirPressureLabel, 2, 0)
-        self.AirPressureLineEdit = ClickableLineEdit()
-        self.AirPressureLineEdit.setReadOnly(True)
-        self.AirPressureLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.AirPressureLineEdit, 2, 1)
-        self.AirPressureUnitLabel = QLabel("hPa")
-        gridLayout.addWidget(self.AirPressureUnitLabel, 2, 2)
-        self.PM2_5Label = QLabel("PM2.5")
-        gridLayout.addWidget(self.PM2_5Label, 2, 3)
-        self.PM2_5LineEdit = ClickableLineEdit()
-        self.PM2_5LineEdit.setReadOnly(True)
-        self.PM2_5LineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.PM2_5LineEdit, 2, 4)
-        self.PM2_5UnitLabel = QLabel("μg/m3")
-        gridLayout.addWidget(self.PM2_5UnitLabel, 2, 5)
-        self.PM10Label = QLabel("PM10")
-        gridLayout.addWidget(self.PM10Label, 2, 6)
-        self.PM10LineEdit = ClickableLineEdit()
-        self.PM10LineEdit.setReadOnly(True)
-        self.PM10LineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.PM10LineEdit, 2, 7)
-        self.PM10UnitLabel = QLabel("μg/m3")
-        gridLayout.addWidget(self.PM10UnitLabel, 2, 8)
-        self.Ultraviolet_RayLabel = QLabel("紫外线")
-        gridLayout.addWidget(self.Ultraviolet_RayLabel, 2, 9)
-        self.Ultraviolet_RayLineEdit = ClickableLineEdit()
-        self.Ultraviolet_RayLineEdit.setReadOnly(True)
-        self.Ultraviolet_RayLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.Ultraviolet_RayLineEdit, 2, 10)
-        self.Ultraviolet_RayUnitLabel = QLabel("μg/m3")
-        gridLayout.addWidget(self.Ultraviolet_RayUnitLabel, 2, 11)
-
-        # row 4
-        self.COLabel = QLabel("CO")
-        gridLayout.addWidget(self.COLabel, 3, 0)
-        self.COLineEdit = ClickableLineEdit()   
-        self.COLineEdit.setReadOnly(True)
-        self.COLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.COLineEdit, 3, 1)
-        self.COUnitLabel = QLabel("μg/m3")
-        gridLayout.addWidget(self.COUnitLabel, 3, 2)
-        self.SO2Label = QLabel("SO2")
-        gridLayout.addWidget(self.SO2Label, 3, 3)
-        self.SO2LineEdit = ClickableLineEdit()
-        self.SO2LineEdit.setReadOnly(True)
-        self.SO2LineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.SO2LineEdit, 3, 4)
-        self.SO2UnitLabel = QLabel("μg/m3")
-        gridLayout.addWidget(self.SO2UnitLabel, 3, 5)
-        self.NO2Label = QLabel("NO2")
-        gridLayout.addWidget(self.NO2Label, 3, 6)
-        self.NO2LineEdit = ClickableLineEdit()
-        self.NO2LineEdit.setReadOnly(True)
-        self.NO2LineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.NO2LineEdit, 3, 7)
-        self.NO2UnitLabel = QLabel("μg/m3")
-        gridLayout.addWidget(self.NO2UnitLabel, 3, 8)
-        self.O3Label = QLabel("O3")
-        gridLayout.addWidget(self.O3Label, 3, 9)
-        self.O3LineEdit = ClickableLineEdit()
-        self.O3LineEdit.setReadOnly(True)
-        self.O3LineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.O3LineEdit, 3, 10)
-        self.O3UnitLabel = QLabel("μg/m3")
-        gridLayout.addWidget(self.O3UnitLabel, 3, 11)
-
-        # row 5
-        self.TVOCLabel = QLabel("TVOC")
-        gridLayout.addWidget(self.TVOCLabel, 4, 0)
-        self.TVOCLineEdit = ClickableLineEdit()
-        self.TVOCLineEdit.setReadOnly(True)
-        self.TVOCLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.TVOCLineEdit, 4, 1)
-        self.TVOCUnitLabel = QLabel("μg/m3")
-        gridLayout.addWidget(self.TVOCUnitLabel, 4, 2)
-        self.PersonTotalLabel = QLabel("人数")
-        gridLayout.addWidget(self.PersonTotalLabel, 4, 3)
-        self.PersonTotalLineEdit = ClickableLineEdit()
-        self.PersonTotalLineEdit.setReadOnly(True)
-        self.PersonTotalLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.PersonTotalLineEdit, 4, 4)
-        self.PersonTotalUnitLabel = QLabel("人")
-        gridLayout.addWidget(self.PersonTotalUnitLabel, 4, 5)
-        self.CarTotalLabel = QLabel("车辆数")
-        gridLayout.addWidget(self.CarTotalLabel, 4, 6)
-        self.CarTotalLineEdit = ClickableLineEdit()
-        self.CarTotalLineEdit.setReadOnly(True)
-        self.CarTotalLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.CarTotalLineEdit, 4, 7)
-        self.CarTotalUnitLabel = QLabel("辆")
-        gridLayout.addWidget(self.CarTotalUnitLabel, 4, 8)
-        self.EVCarTotalLabel = QLabel("新能源车辆数")
-        gridLayout.addWidget(self.EVCarTotalLabel, 4, 9)
-        self.EVCarTotalLineEdit = ClickableLineEdit()
-        self.EVCarTotalLineEdit.setReadOnly(True)
-        self.EVCarTotalLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.EVCarTotalLineEdit, 4, 10)
-        self.EVCarTotalUnitLabel = QLabel("辆")
-        gridLayout.addWidget(self.EVCarTotalUnitLabel, 4, 11)
-
-        # row 6
-        self.GasCarTotalLabel = QLabel("燃油车辆数")
-        gridLayout.addWidget(self.GasCarTotalLabel, 5, 0)
-        self.GasCarTotalLineEdit = ClickableLineEdit()
-        self.GasCarTotalLineEdit.setReadOnly(True)
-        self.GasCarTotalLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
-        gridLayout.addWidget(self.GasCarTotalLineEdit, 5, 1)
-        self.GasCarTotalUnitLabel = QLabel("辆")
-        gridLayout.addWidget(self.GasCarTotalUnitLabel, 5, 2)
-
-        self.line_chart = LineChartWidget()
+        # 字段名与显示控件的对应关系，点击任意一个都可以切换图表
+        self.field_line_edits = {}
+        for i, field in enumerate(SENSOR_SCHEMA):
+            row, column = divmod(i, FIELDS_PER_ROW)
+            column *= 3
+            gridLayout.addWidget(QLabel(field.label), row, column)
+            line_edit = ClickableLineEdit()
+            line_edit.setReadOnly(True)
+            line_edit.setStyleSheet("background-color: #ccccd9; color: black")
+            line_edit.setObjectName(field.name)
+            line_edit.clicked.connect(self.on_click)
+            gridLayout.addWidget(line_edit, row, column + 1)
+            gridLayout.addWidget(QLabel(field.unit), row, column + 2)
+            self.field_line_edits[field.name] = line_edit
+
+        # 当前选中字段的滚动统计，显示在网格最后一行的空位
+        self.statsLabel = QLabel()
+        self.statsLabel.setStyleSheet("font-family: monospace")
+        row, column = divmod(len(SENSOR_SCHEMA), FIELDS_PER_ROW)
+        gridLayout.addWidget(self.statsLabel, row, column * 3, 1, (FIELDS_PER_ROW - column) * 3)
+
+        # 图表：matplotlib（默认）、qpainter（原生绘制的单通道曲线）或 multiples（全部字段的小图）
+        # 后两种不加载 matplotlib
+        if self.chart == "multiples":
+            self.line_chart = SmallMultiplesWidget(SENSOR_FIELDS)
+            self.line_chart.field_selected.connect(lambda field: self.on_click(self.field_line_edits[field]))
+        elif self.chart == "qpainter":
+            self.line_chart = StripChartWidget()
+        else:
+            self.line_chart = zee_widgets.LineChartWidget()
         layout.addLayout(gridLayout)
         layout.addWidget(self.line_chart)
         # self.setLayout(layout)
@@ -393,42 +341,49 @@ class InputTextWindow(QMainWindow):
         # 将容器窗口设置为中央部件
         self.setCentralWidget(container)
 
-    def display_noise_activity(self, input_obj):
-        print("执行噪声逻辑")
-        print(self.noise_queue.get_data_list())
-        self.updateLineChartThread.setList(self.noise_queue, 'Noise Data')
-
-
-    def display_temperature_activity(self, input_obj):
-        print("执行温度逻辑")
-        print(self.temperature_queue.get_data_list())
-        self.updateLineChartThread.setList(self.temperature_queue, 'Temperature Data')
-
-    def display_humidity_activity(self, input_obj):
-        print("执行湿度逻辑")
-
-    def display_func_select(self, string):
-        logic_map = {
-            "noise": self.display_noise_activity,
-            "temperature": self.display_temperature_activity,
-            "humidity": self.display_humidity_activity,
-        }        
-        logic_function = logic_map.get(string, self.display_noise_activity)
-        return logic_function
-
+    def on_device_changed(self, device_id):
+        self.current_device = device_id
+        self.pending_record = None
+        self.shown_version = None
+        self.current_buffer = self.sensor_thread.get_buffer(device_id)
+        if self.lastLineEdit != None:
+            self.display_channel_activity(self.lastLineEdit.objectName())
+
+    def display_channel_activity(self, field):
+        self.updateLineChartThread.setList(self.current_buffer.channel(field), field + ' Data')
+
+    def update_stats_label(self):
+        field = self.lastLineEdit.objectName() if self.lastLineEdit != None else "Noise"
+        stats = self.sensor_thread.get_stats(self.current_device).stats(field)
+        lines = ["%-6s %8s %8s %8s %8s %8s %8s" % (field[:6], "min", "max", "mean", "std", "p50", "p95")]
+        for seconds, values in stats.items():
+            name = "%dmin" % (seconds // 60) if seconds < 3600 else "%dh" % (seconds // 3600)
+            lines.append("%-6s %8.4g %8.4g %8.4g %8.4g %8.4g %8.4g" % (
+                name, values["min"], values["max"], values["mean"], values["std"], values["p50"], values["p95"]))
+        self.statsLabel.setText("\n".join(lines))
+
+    # 采集进程已经退出或启动失败时，命令会抛出异常，在这里提示而不是抛出 Qt 槽函数
     def start_collection(self):
+        try:
+            self._toggle_collection()
+        except (EOFError, OSError, RuntimeError) as e:
+            print("采集控制命令失败:", e)
+            QMessageBox.warning(self, "采集失败", "采集控制命令失败：%s" % (str(e) or type(e).__name__))
+
+    def _toggle_collection(self):
         if self.sensor_thread.is_running:
-            self.sensor_thread.stop_collection()
-            self.freqLineEdit.setEnabled(True)
+            # 先切换界面状态：停止命令失败时（采集进程已经退出）界面同样回到停止状态
+            self.freqLineEdit.setEnabled(not self.devices)
             self.submit_button.setText("开始读取")
             # q: set background color of submit_button to red only
             # a: use setStyleShee
             self.submit_button.setStyleSheet("background-color: red; color: white")
             self.updateLineChartThread.stop_display()
+            self.sensor_thread.stop_collection()
         else:
             oriText = self.freqLineEdit.text()
             if oriText.strip() != "":
-                interval = int(oriText)
+                interval = float(oriText)
                 if interval > 0:
                     self.sensor_thread.set_update_interval(interval)
                     self.sensor_thread.start_collection()
@@ -438,47 +393,61 @@ class InputTextWindow(QMainWindow):
                     self.updateLineChartThread.start_display()
 
     def update_line_edits(self, json_data):
-        self.noiseLineEdit.setText(json_data.get("Noise"))
-        self.temperatureLineEdit.setText(json_data.get("Temperature"))
-        self.humidityLineEdit.setText(json_data.get("Humidity"))
-        self.windspeedLineEdit.setText(json_data.get("Wind_Speed"))
-        self.Wind_DirectionLineEdit.setText(json_data.get("Wind_Direction"))
-        self.RainfallLineEdit.setText(json_data.get("Rainfall"))
-        self.RadiationLineEdit.setText(json_data.get("Radiation"))
-        self.IlluminationLineEdit.setText(json_data.get("Illumination"))
-        self.AirPressureLineEdit.setText(json_data.get("AirPressure"))
-        self.PM2_5LineEdit.setText(json_data.get("PM2.5"))
-        self.PM10LineEdit.setText(json_data.get("PM10"))
-        self.Ultraviolet_RayLineEdit.setText(json_data.get("Ultraviolet_Ray"))
-        self.COLineEdit.setText(json_data.get("CO"))
-        self.SO2LineEdit.setText(json_data.get("SO2"))
-        self.NO2LineEdit.setText(json_data.get("NO2"))
-        self.O3LineEdit.setText(json_data.get("O3"))
-        self.TVOCLineEdit.setText(json_data.get("TVOC"))
-        self.PersonTotalLineEdit.setText(json_data.get("People_Number"))
-        self.CarTotalLineEdit.setText(json_data.get("Car_Sum"))
-        self.EVCarTotalLineEdit.setText(json_data.get("Car_Number_green"))
-        self.GasCarTotalLineEdit.setText(json_data.get("Car_Number_Notgreen"))
-
-        # push data to queue
-        self.noise_queue.push_data(float(json_data.get("Noise")))
-        self.temperature_queue.push_data(float(json_data.get("Temperature")))
-        self.humidity_queue.push_data(float(json_data.get("Humidity")))
-        self.pm25_queue.push_data(json_data.get("PM2.5"))
-
+        self.sensor_thread.handled += 1
+        if json_data.device_id != self.current_device:
+            return
+        self.pending_record = json_data
+
+    def flush_line_edits(self):
+        json_data = self.pending_record
+        if json_data is None and self.sensor_thread.use_process:
+            # 采集进程模式：没有逐个样本的信号，缓冲区有新数据时读取最新的样本
+            version = self.current_buffer.version
+            if version != self.shown_version:
+                self.shown_version = version
+                json_data = self.current_buffer.latest_sample()
+        if json_data is None:
+            return
+        self.pending_record = None
+        start = time.perf_counter()
+        field_texts = self.field_texts
+        for field, line_edit in self.field_line_edits.items():
+            text = format_value(json_data.get(field))
+            if text != field_texts[field]:
+                field_texts[field] = text
+                line_edit.setText(text)
+        _UI_UPDATE_SECONDS.observe(time.perf_counter() - start)
 
     # 点击事件，用于切换显示的数据样式                 
     def on_click(self, line_edit):
         print("LineEdit click:", line_edit.objectName())
-        self.display_func_select(line_edit.objectName())(self.line_chart)
+        self.display_channel_activity(line_edit.objectName())
         line_edit.setStyleSheet("background-color: #ccccd9; color: red")
         if self.lastLineEdit != None:
             self.lastLineEdit.setStyleSheet("background-color: #ccccd9; color: black")
         self.lastLineEdit = line_edit
+
+    def on_alert(self, alert):
+        self.statusBar().showMessage(format_alert(alert))
+
+    def closeEvent(self, event):
+        self.stats_timer.stop()
+        self.display_timer.stop()
+        self.diagnostics_window.close()
+        self.updateLineChartThread.stop_display()
+        self.sensor_thread.close()
+        super().closeEvent(event)
                 
 def main():
-    app = QApplication(sys.argv)
-    window = InputTextWindow()
+    parser = build_arg_parser("ENV-DATA-ACQUIRER")
+    parser.add_argument("--display-rate", type=positive_float, default=5, help="界面数值刷新频率（次/秒）")
+    parser.add_argument("--chart", choices=["matplotlib", "qpainter", "multiples"], default="matplotlib",
+                        help="图表实现：matplotlib、原生 QPainter 曲线或全部字段的小图")
+    parser.add_argument("--collector-process", action="store_true",
+                        help="在独立进程中采集和存储，通过共享内存把数据交给界面，采样不受界面重绘影响")
+    args, qt_args = parser.parse_known_args()
+    app = QApplication(sys.argv[:1] + qt_args)
+    window = InputTextWindow(collector_options(args), args.display_rate, args.chart, args.collector_process)
     window.show()
     sys.exit(app.exec_())
 
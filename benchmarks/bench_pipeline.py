@@ -0,0 +1,417 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from zee_utils.collector import Collector
+from zee_utils.mock_gateway import MockGateway
+from zee_utils.sensor_fields import SENSOR_FIELDS, parse_sensor
+
+# 指标名 -> 是否越大越好，用于和基线比较
+METRICS = {
+    "poll_samples_per_s": True,
+    "e2e_latency_p50_ms": False,
+    "e2e_latency_p95_ms": False,
+    "e2e_latency_p99_ms": False,
+    "csv_bytes_per_s": True,
+    "csv_rows_per_s": True,
+    "chart_frame_p50_ms": False,
+    "chart_frame_p95_ms": False,
+    "chart_full_redraw_ms": False,
+    "strip_frame_p50_ms": False,
+    "strip_frame_p95_ms": False,
+    "multiples_frame_p50_ms": False,
+    "multiples_frame_p95_ms": False,
+    "loaded_thread_rate": True,
+    "loaded_thread_gap_max_ms": False,
+    "loaded_process_rate": True,
+    "loaded_process_gap_max_ms": False,
+    "push_samples_per_s": True,
+    "push_latency_p50_ms": False,
+    "push_latency_p99_ms": False,
+    "analytics_rows_per_s": True,
+}
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else float('nan')
+
+
+# 无界面采集吞吐：N 台模拟设备，周期为 0（连续轮询），包含解析、缓冲、统计和 CSV 存储
+def bench_poll(gateway, seconds, workers):
+    from zee_utils.fleet_poller import DeviceConfig
+    devices = [DeviceConfig(item["deviceId"], item["url"], interval=0, timeout=5)
+               for item in gateway.device_list()]
+    count = [0]
+
+    def on_data(sample):
+        count[0] += 1
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        collector = Collector(devices=devices, data_dir=data_dir, max_workers=workers, on_data=on_data)
+        collector.start()
+        time.sleep(seconds)
+        collector.close()
+    return {"poll_samples_per_s": count[0] / seconds}
+
+
+# 端到端延迟：从轮询线程拿到网关响应（解析完成）到 GUI 线程收到样本
+# 样本的 timestamp_ns 是计划采样时间，包含了请求本身的耗时，所以另外记录收到响应的时间
+def bench_e2e(gateway, seconds, interval):
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication
+    from zee_utils.fleet_poller import DeviceConfig
+    import app
+
+    qt_app = QApplication.instance() or QApplication([])
+    devices = [DeviceConfig(item["deviceId"], item["url"], interval=interval, timeout=5)
+               for item in gateway.device_list()]
+    latencies = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        window = app.InputTextWindow({"devices": devices, "data_dir": data_dir, "history_size": 10000})
+        window.show()
+
+        received = {}
+        fetcher = window.sensor_thread.collector.fetcher
+        on_response = fetcher.on_data
+
+        def on_fetched(sample):
+            received[id(sample)] = time.time_ns()
+            on_response(sample)
+
+        def on_data(sample):
+            received_ns = received.pop(id(sample), None)
+            if received_ns is not None:
+                latencies.append((time.time_ns() - received_ns) / 1e6)
+
+        fetcher.on_data = on_fetched
+        # 在 update_line_edits 之后连接，测到的时间包含界面的样本处理
+        window.sensor_thread.data_updated.connect(on_data)
+        window.start_collection()
+        QTimer.singleShot(int(seconds * 1000), qt_app.quit)
+        qt_app.exec_()
+        window.close()
+    return {
+        "e2e_latency_p50_ms": percentile(latencies, 50),
+        "e2e_latency_p95_ms": percentile(latencies, 95),
+        "e2e_latency_p99_ms": percentile(latencies, 99),
+    }
+
+
+# CSV 写入吞吐：add_data 入队到 close 写完
+def bench_csv(rows):
+    from zee_utils.env_json_to_csv import JSONtoCSV
+    gateway_device = MockGateway(port=0).devices[0]
+    samples = []
+    for i in range(1000):
+        samples.append(parse_sensor(gateway_device.sample()["data"]["sensor"], 1715140800000000000 + i * 1000))
+    with tempfile.TemporaryDirectory() as data_dir:
+        json_to_csv = JSONtoCSV(os.path.join(data_dir, "bench.csv"), flush_interval=0.1)
+        start = time.perf_counter()
+        for i in range(rows):
+            json_to_csv.add_data(samples[i % len(samples)])
+        json_to_csv.close()
+        elapsed = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join(data_dir, name)) for name in os.listdir(data_dir))
+    return {"csv_bytes_per_s": size / elapsed, "csv_rows_per_s": rows / elapsed}
+
+
+# 离线分析吞吐：4 个站点目录共 rows 行 CSV，单进程完成解析、分组汇总和相关性
+def bench_analytics(rows):
+    from zee_utils.env_analytics import ENV_FIELDS, TRAFFIC_FIELDS, analyze
+    from zee_utils.env_json_to_csv import JSONtoCSV
+    gateway_device = MockGateway(port=0).devices[0]
+    samples = [parse_sensor(gateway_device.sample()["data"]["sensor"]) for _ in range(1000)]
+    with tempfile.TemporaryDirectory() as data_dir:
+        for device in range(4):
+            json_to_csv = JSONtoCSV(os.path.join(data_dir, "S%d" % device, "env_data_2024-05-01_00-00-00.csv"))
+            for i in range(rows // 4):
+                sample = samples[i % len(samples)]
+                json_to_csv.add_data(type(sample)(sample.layout, sample.values, 1714492800000000000 + i * 10 ** 9))
+            json_to_csv.close()
+        start = time.perf_counter()
+        result = analyze(data_dir, correlate=TRAFFIC_FIELDS + ENV_FIELDS, workers=1)
+        elapsed = time.perf_counter() - start
+    return {"analytics_rows_per_s": result.rows / elapsed}
+
+
+# 一天的数据（86400 点），另外多生成 frames 个样本供每帧追加
+def day_buffer(frames):
+    from zee_utils.env_ring_buffer import EnvRingBuffer
+    ring_buffer = EnvRingBuffer(86400)
+    values = np.random.default_rng(0).normal(50, 10, (86400 + frames, len(SENSOR_FIELDS))).astype(np.float32)
+    for i in range(86400):
+        ring_buffer.append(values[i], i)
+    return ring_buffer, values
+
+
+# 图表帧时间：一天的数据，每帧追加一个样本后抽稀重绘
+def bench_chart(frames):
+    from PyQt5.QtWidgets import QApplication
+    from zee_widgets import LineChartWidget
+
+    qt_app = QApplication.instance() or QApplication([])
+    chart = LineChartWidget()
+    chart.resize(900, 400)
+    chart.show()
+    qt_app.processEvents()
+    ring_buffer, values = day_buffer(frames)
+    channel = ring_buffer.channel("PM2.5")
+    start = time.perf_counter()
+    chart.plot_data()
+    full_redraw = (time.perf_counter() - start) * 1000
+    frame_times = []
+    for i in range(frames):
+        ring_buffer.append(values[86400 + i], 86400 + i)
+        start = time.perf_counter()
+        x, y = channel.get_decimated(86400, chart.plot_width())
+        chart.update_data(y, channel.version, x, 86400 - 1)
+        frame_times.append((time.perf_counter() - start) * 1000)
+    chart.close()
+    return {
+        "chart_frame_p50_ms": percentile(frame_times, 50),
+        "chart_frame_p95_ms": percentile(frame_times, 95),
+        "chart_full_redraw_ms": full_redraw,
+    }
+
+
+# QPainter 曲线的帧时间：单通道，以及全部 21 个字段的小图；repaint() 同步完成绘制
+def bench_strip(frames):
+    from PyQt5.QtWidgets import QApplication
+    from zee_widgets import SmallMultiplesWidget, StripChartWidget
+
+    qt_app = QApplication.instance() or QApplication([])
+    ring_buffer, values = day_buffer(frames)
+    chart = StripChartWidget()
+    chart.resize(900, 400)
+    multiples = SmallMultiplesWidget(SENSOR_FIELDS)
+    multiples.resize(900, 800)
+    chart.show()
+    multiples.show()
+    qt_app.processEvents()
+    channel = ring_buffer.channel("PM2.5")
+    strip_times = []
+    multiples_times = []
+    for i in range(frames):
+        ring_buffer.append(values[86400 + i], 86400 + i)
+        start = time.perf_counter()
+        x, y = channel.get_decimated(86400, chart.plot_width())
+        chart.update_data(y, channel.version, x, 86400 - 1)
+        chart.repaint()
+        strip_times.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        for field, panel in multiples.panels.items():
+            x, y = ring_buffer.channel(field).get_decimated(86400, panel.plot_width())
+            panel.update_data(y, ring_buffer.version, x, 86400 - 1)
+        multiples.repaint()
+        multiples_times.append((time.perf_counter() - start) * 1000)
+    chart.close()
+    multiples.close()
+    return {
+        "strip_frame_p50_ms": percentile(strip_times, 50),
+        "strip_frame_p95_ms": percentile(strip_times, 95),
+        "multiples_frame_p50_ms": percentile(multiples_times, 50),
+        "multiples_frame_p95_ms": percentile(multiples_times, 95),
+    }
+
+
+# 界面负载下的采样稳定性：主线程不停地完整重绘 matplotlib 图表，
+# 分别在线程模式（Collector）和进程模式（CollectorProcess）下以 interval 采样，
+# 统计实际样本数与计划样本数之比，以及相邻样本计划时间的最大间隔（错过的节拍会表现为间隔变大）
+# 模拟网关放在单独的进程里，否则它也要和重绘抢 GIL
+# port 为 0 时使用系统分配的空闲端口；网关或采集在 startup_timeout 秒内没有启动时报错
+def bench_loaded(seconds, interval, port=0, startup_timeout=10):
+    import socket
+    import subprocess
+    from PyQt5.QtWidgets import QApplication
+    from zee_utils.collector_process import CollectorProcess
+    from zee_widgets import LineChartWidget
+
+    qt_app = QApplication.instance() or QApplication([])
+    if port == 0:
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+    chart = LineChartWidget()
+    chart.resize(900, 400)
+    chart.show()
+    chart.data = np.random.default_rng(0).normal(50, 10, 86400).tolist()
+    gateway = subprocess.Popen([sys.executable, "-m", "zee_utils.mock_gateway", "--port", str(port)],
+                               cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               stdout=subprocess.DEVNULL)
+    url = "http://127.0.0.1:%d/sensor/getAllSensor" % port
+    results = {}
+    try:
+        deadline = time.monotonic() + startup_timeout
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if gateway.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("模拟网关没有在 %.0f 秒内启动（退出码 %s）" % (startup_timeout, gateway.poll()))
+                time.sleep(0.05)
+        for mode, collector_class in (("thread", Collector), ("process", CollectorProcess)):
+            with tempfile.TemporaryDirectory() as data_dir:
+                collector = collector_class(url=url, interval=interval, data_dir=data_dir, history_size=10000)
+                try:
+                    ring_buffer = collector.get_buffer(None)
+                    collector.start()
+                    # 等采集进程启动后再计时
+                    deadline = time.monotonic() + startup_timeout
+                    while ring_buffer.total == 0:
+                        if gateway.poll() is not None or time.monotonic() > deadline:
+                            raise RuntimeError("%s 模式 %.0f 秒内没有采集到样本（网关退出码 %s）"
+                                               % (mode, startup_timeout, gateway.poll()))
+                        time.sleep(0.01)
+                    first = ring_buffer.total
+                    deadline = time.perf_counter() + seconds
+                    while time.perf_counter() < deadline:
+                        chart.plot_data()
+                        qt_app.processEvents()
+                    timestamps = np.array(ring_buffer.timestamps(ring_buffer.total - first + 1))
+                finally:
+                    collector.close()
+            results["loaded_%s_rate" % mode] = (len(timestamps) - 1) * interval / seconds
+            results["loaded_%s_gap_max_ms" % mode] = float(np.diff(timestamps).max() / 1e6) if len(timestamps) > 1 \
+                else float('nan')
+    finally:
+        chart.close()
+        gateway.terminate()
+        gateway.wait()
+    return results
+
+
+# 推送接收：单独的进程以 rate 条/秒向 UDP 端口推送，统计 GUI 线程收到的速率，
+# 以及从发送方生成样本到 GUI 线程收到的延迟
+def bench_push(seconds, rate, port=33298, startup_timeout=10):
+    import subprocess
+    from PyQt5.QtCore import QTimer
+    from PyQt5.QtWidgets import QApplication
+    import app
+
+    qt_app = QApplication.instance() or QApplication([])
+    url = "udp://127.0.0.1:%d" % port
+    latencies = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        window = app.InputTextWindow({"listen": url, "poll": False, "data_dir": data_dir, "history_size": 10000})
+        window.show()
+
+        def on_data(sample):
+            latencies.append((time.time_ns() - sample.timestamp_ns) / 1e6)
+
+        window.sensor_thread.data_updated.connect(on_data)
+        window.start_collection()
+        publisher = subprocess.Popen([sys.executable, "-m", "zee_utils.mock_gateway", "--publish", url,
+                                      "--rate", str(rate), "--devices", "10", "--duration", str(seconds)],
+                                     cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     stdout=subprocess.DEVNULL)
+        # 发送进程启动需要时间，从收到第一个样本开始计时；发送进程退出或超时仍没有样本时报错
+        deadline = time.monotonic() + startup_timeout
+        while not latencies:
+            qt_app.processEvents()
+            if publisher.poll() is not None or time.monotonic() > deadline:
+                publisher.kill()
+                publisher.wait()
+                window.close()
+                raise RuntimeError("%.0f 秒内没有收到推送样本（发送进程退出码 %s）"
+                                   % (startup_timeout, publisher.returncode))
+            time.sleep(0.001)
+        start = time.perf_counter()
+        QTimer.singleShot(int(seconds * 1000), qt_app.quit)
+        qt_app.exec_()
+        elapsed = time.perf_counter() - start
+        publisher.wait()
+        window.close()
+    return {
+        "push_samples_per_s": len(latencies) / elapsed,
+        "push_latency_p50_ms": percentile(latencies, 50),
+        "push_latency_p99_ms": percentile(latencies, 99),
+    }
+
+
+# 与基线比较，变差超过 tolerance 的指标视为回退
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, higher_is_better in METRICS.items():
+        if name not in results or name not in baseline:
+            continue
+        old, new = baseline[name], results[name]
+        if higher_is_better:
+            regressed = new < old * (1 - tolerance)
+        else:
+            regressed = new > old * (1 + tolerance)
+        if regressed:
+            regressions.append("%s: %.3f -> %.3f" % (name, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="采集流水线性能测试（使用本地模拟网关和离屏 Qt）")
+    parser.add_argument("--devices", type=int, default=10, help="模拟设备数量")
+    parser.add_argument("--latency", type=float, default=0.005, help="模拟网关响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.002, help="模拟网关延迟抖动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟网关错误率")
+    parser.add_argument("--seconds", type=float, default=3, help="吞吐和延迟测试的时长")
+    parser.add_argument("--workers", type=int, default=8, help="并发请求数")
+    parser.add_argument("--interval", type=float, default=0.1, help="延迟测试中每台设备的采集周期（秒）")
+    parser.add_argument("--push-rate", type=float, default=2000, help="推送测试的发送速率（条/秒）")
+    parser.add_argument("--csv-rows", type=int, default=200000)
+    parser.add_argument("--analytics-rows", type=int, default=400000)
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--only", choices=["poll", "e2e", "csv", "chart", "strip", "loaded", "push", "analytics"],
+                        action="append",
+                        help="只运行指定的测试，可重复")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与基线 JSON 比较，出现回退时返回非零")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的变差比例")
+    args = parser.parse_args()
+
+    selected = set(args.only or ["poll", "e2e", "csv", "chart", "strip", "loaded", "push", "analytics"])
+    gateway = MockGateway(port=0, device_count=args.devices, latency=args.latency, jitter=args.jitter,
+                          error_rate=args.error_rate, seed=1).start()
+    results = {}
+    try:
+        if "poll" in selected:
+            results.update(bench_poll(gateway, args.seconds, args.workers))
+        if "e2e" in selected:
+            results.update(bench_e2e(gateway, args.seconds, args.interval))
+        if "csv" in selected:
+            results.update(bench_csv(args.csv_rows))
+        if "chart" in selected:
+            results.update(bench_chart(args.frames))
+        if "strip" in selected:
+            results.update(bench_strip(args.frames))
+        if "loaded" in selected:
+            results.update(bench_loaded(args.seconds, args.interval))
+        if "push" in selected:
+            results.update(bench_push(args.seconds, args.push_rate))
+        if "analytics" in selected:
+            results.update(bench_analytics(args.analytics_rows))
+    finally:
+        gateway.stop()
+
+    for name, value in results.items():
+        print("%-24s %14.3f" % (name, value))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print("性能回退:", line)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,61 @@
-from .env_data_queue import EnvDataQueue
-from .env_json_to_csv import JSONtoCSV
\ No newline at end of file
+import importlib
+
+# 按需导入：只有用到某个名字时才加载对应模块，无界面采集不会加载用不到的依赖
+_EXPORTS = {
+    "JSONtoCSV": ".env_json_to_csv",
+    "SensorFetcher": ".sensor_fetcher",
+    "ChangeDetector": ".sensor_fetcher",
+    "PushListener": ".push_listener",
+    "parse_push_message": ".push_listener",
+    "DeviceConfig": ".fleet_poller",
+    "FleetPoller": ".fleet_poller",
+    "load_devices": ".fleet_poller",
+    "SENSOR_FIELDS": ".sensor_fields",
+    "SENSOR_SCHEMA": ".sensor_fields",
+    "SensorField": ".sensor_fields",
+    "compile_parser": ".sensor_fields",
+    "parse_sensor": ".sensor_fields",
+    "format_value": ".sensor_fields",
+    "EnvRingBuffer": ".env_ring_buffer",
+    "EnvChannel": ".env_ring_buffer",
+    "EnvArchive": ".env_archive",
+    "EnvArchiveReader": ".env_archive",
+    "SensorSample": ".sensor_sample",
+    "timestamp_to_ns": ".sensor_sample",
+    "ns_to_timestamp": ".sensor_sample",
+    "RollingStatsEngine": ".rolling_stats",
+    "RollupEngine": ".env_rollup",
+    "RollupReader": ".env_rollup",
+    "RetentionManager": ".env_rollup",
+    "AnalyticsResult": ".env_analytics",
+    "analyze": ".env_analytics",
+    "read_data_csv": ".env_analytics",
+    "DeviceRecorder": ".device_recorder",
+    "SampleJournal": ".sample_journal",
+    "Alert": ".alert_engine",
+    "AlertRule": ".alert_engine",
+    "AlertEngine": ".alert_engine",
+    "AlertLog": ".alert_engine",
+    "WebhookNotifier": ".alert_engine",
+    "load_rules": ".alert_engine",
+    "format_alert": ".alert_engine",
+    "Collector": ".collector",
+    "CollectorProcess": ".collector_process",
+    "SharedRingBuffer": ".shared_ring_buffer",
+    "SamplingScheduler": ".sampling_scheduler",
+    "METRICS": ".metrics",
+    "MetricsRegistry": ".metrics",
+    "MetricsServer": ".metrics",
+    "MetricsFileWriter": ".metrics",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
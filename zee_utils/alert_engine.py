@@ -0,0 +1,224 @@
+import argparse
+import json
+import logging
+import os
+import threading
+from collections import deque, namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+
+from .sensor_fields import SENSOR_FIELDS
+from .sensor_sample import ns_to_timestamp, record_values
+
+# state 为 "raised"（触发）或 "cleared"（恢复）
+Alert = namedtuple('Alert', ['device_id', 'rule', 'field', 'state', 'value', 'timestamp_ns'])
+
+
+# 单条告警规则
+# kind: "threshold" 比较当前值，"rate" 比较变化率（每秒）
+# op: ">" 或 "<"；value 为触发阈值，clear 为恢复阈值（滞回），默认与 value 相同，
+# 必须在 value 的恢复一侧（">" 时不大于 value，"<" 时不小于 value），否则每个样本都会在触发和恢复之间来回切换
+# sustain: 条件需要持续满足的秒数
+class AlertRule:
+    def __init__(self, name, field, value, op=">", kind="threshold", clear=None, sustain=0):
+        if op not in (">", "<"):
+            raise ValueError("不支持的比较运算符: %s" % op)
+        if kind not in ("threshold", "rate"):
+            raise ValueError("不支持的规则类型: %s" % kind)
+        clear = value if clear is None else clear
+        if (op == ">" and clear > value) or (op == "<" and clear < value):
+            side = "不大于" if op == ">" else "不小于"
+            raise ValueError("规则 %s 的恢复阈值 %s 应%s触发阈值 %s" % (name, clear, side, value))
+        self.name = name
+        self.field = field
+        self.value = value
+        self.op = op
+        self.kind = kind
+        self.clear = clear
+        self.sustain = sustain
+
+
+# 从 JSON 文件读取规则，格式：
+# [{"name": "pm25_high", "field": "PM2.5", "op": ">", "value": 75, "clear": 60, "sustain": 30},
+#  {"name": "pm25_rise", "field": "PM2.5", "kind": "rate", "op": ">", "value": 5}, ...]
+def load_rules(path):
+    with open(path, encoding='utf-8') as f:
+        items = json.load(f)
+    return [AlertRule(item['name'], item['field'], item['value'], op=item.get('op', '>'),
+                      kind=item.get('kind', 'threshold'), clear=item.get('clear'),
+                      sustain=item.get('sustain', 0)) for item in items]
+
+
+# 告警引擎：规则编译成 NumPy 数组，每个样本对所有规则做一次向量化计算
+# 每个站点保存一行状态（是否处于告警中、条件开始满足的时间、上一个样本），
+# 只在状态切换时产生告警，同一告警不会重复发送
+class AlertEngine:
+    def __init__(self, rules, fields=SENSOR_FIELDS):
+        self.rules = list(rules)
+        self.fields = tuple(fields)
+        field_index = {name: i for i, name in enumerate(self.fields)}
+        self.rule_fields = np.array([field_index[rule.field] for rule in self.rules], dtype=np.intp)
+        # 统一成“大于”比较：op 为 "<" 时两边同时取负
+        self.sign = np.array([1.0 if rule.op == ">" else -1.0 for rule in self.rules])
+        self.trip = self.sign * np.array([rule.value for rule in self.rules], dtype=float)
+        self.clear = self.sign * np.array([rule.clear for rule in self.rules], dtype=float)
+        self.is_rate = np.array([rule.kind == "rate" for rule in self.rules])
+        self.sustain_ns = np.array([int(rule.sustain * 1000000000) for rule in self.rules], dtype=np.int64)
+        self.device_rows = {}
+        rule_count = len(self.rules)
+        self.active = np.zeros((0, rule_count), dtype=bool)
+        self.pending_since = np.zeros((0, rule_count), dtype=np.int64)
+        self.last_values = np.zeros((0, len(self.fields)))
+        self.last_timestamp = np.zeros(0, dtype=np.int64)
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def _row(self, device_id):
+        row = self.device_rows.get(device_id)
+        if row is None:
+            row = len(self.device_rows)
+            self.device_rows[device_id] = row
+            rule_count = len(self.rules)
+            self.active = np.vstack([self.active, np.zeros((1, rule_count), dtype=bool)])
+            self.pending_since = np.vstack([self.pending_since, np.full((1, rule_count), -1, dtype=np.int64)])
+            self.last_values = np.vstack([self.last_values, np.full((1, len(self.fields)), np.nan)])
+            self.last_timestamp = np.append(self.last_timestamp, 0)
+        return row
+
+    # values 按 fields 顺序排列（缺失为 NaN），返回本次产生的告警列表
+    def evaluate(self, device_id, timestamp_ns, values):
+        if not self.rules:
+            return []
+        with self.lock:
+            row = self._row(device_id)
+            values = np.asarray(values, dtype=float)
+            current = values[self.rule_fields]
+            previous = self.last_values[row, self.rule_fields]
+            elapsed = (timestamp_ns - self.last_timestamp[row]) / 1e9
+            rate = (current - previous) / elapsed if elapsed > 0 else np.full(len(current), np.nan)
+            metric = self.sign * np.where(self.is_rate, rate, current)
+            # 比较时 NaN 既不触发也不恢复
+            tripped = metric > self.trip
+            cleared = metric < self.clear
+
+            active = self.active[row]
+            pending = self.pending_since[row]
+            pending = np.where(tripped, np.where(pending < 0, timestamp_ns, pending), -1)
+            raised = tripped & ~active & (timestamp_ns - pending >= self.sustain_ns)
+            resolved = active & cleared
+            self.active[row] = (active | raised) & ~resolved
+            self.pending_since[row] = pending
+            self.last_values[row] = values
+            self.last_timestamp[row] = timestamp_ns
+
+            if not raised.any() and not resolved.any():
+                return []
+            alerts = []
+            for i in np.flatnonzero(raised | resolved):
+                rule = self.rules[i]
+                alerts.append(Alert(device_id, rule.name, rule.field, "raised" if raised[i] else "cleared",
+                                    float(current[i]), timestamp_ns))
+        for alert in alerts:
+            for listener in self.listeners:
+                listener(alert)
+        return alerts
+
+    def evaluate_record(self, device_id, timestamp_ns, record):
+        if not self.rules:
+            return []
+        return self.evaluate(device_id, timestamp_ns, record_values(record, self.fields))
+
+
+def format_alert(alert):
+    action = "告警" if alert.state == "raised" else "恢复"
+    return "%s [%s] %s %s %s=%g" % (ns_to_timestamp(alert.timestamp_ns), alert.device_id or "-",
+                                     action, alert.rule, alert.field, alert.value)
+
+
+def alert_to_json(alert):
+    return {
+        "deviceId": alert.device_id,
+        "rule": alert.rule,
+        "field": alert.field,
+        "state": alert.state,
+        "value": alert.value,
+        "timestamp": ns_to_timestamp(alert.timestamp_ns),
+    }
+
+
+# 告警写入日志文件
+class AlertLog:
+    def __init__(self, log_filename):
+        parent_directory = os.path.dirname(log_filename)
+        if parent_directory:
+            os.makedirs(parent_directory, exist_ok=True)
+        self.logger = logging.getLogger("env_alerts.%s" % log_filename)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        if not self.logger.handlers:
+            handler = logging.FileHandler(log_filename, encoding='utf-8')
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(handler)
+
+    def __call__(self, alert):
+        self.logger.info(format_alert(alert))
+
+
+# 告警以 JSON POST 到 webhook；在后台线程发送，不阻塞采集
+class WebhookNotifier:
+    def __init__(self, url, timeout=2):
+        self.url = url
+        self.timeout = timeout
+        self.queue = deque()
+        self.failed = 0
+        self.session = requests.Session()
+        self._event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="WebhookNotifier", daemon=True)
+        self._thread.start()
+
+    def __call__(self, alert):
+        self.queue.append(alert)
+        self._event.set()
+
+    def _run(self):
+        while True:
+            self._event.wait()
+            self._event.clear()
+            while self.queue:
+                alert = self.queue.popleft()
+                try:
+                    self.session.post(self.url, json=alert_to_json(alert), timeout=self.timeout)
+                except requests.RequestException as e:
+                    self.failed += 1
+                    print("告警发送失败:", e)
+
+
+# 本地 webhook 替身，打印收到的告警，用于测试
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        print("收到告警:", body.decode('utf-8'))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地告警 webhook 替身")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=33300)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), _WebhookHandler)
+    print("webhook 替身监听 http://%s:%d/alert" % (args.host, args.port))
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
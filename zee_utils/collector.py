@@ -0,0 +1,278 @@
+import argparse
+import math
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+
+from .alert_engine import AlertEngine, AlertLog, WebhookNotifier, format_alert, load_rules
+from .device_recorder import DeviceRecorder
+from .env_ring_buffer import EnvRingBuffer
+from .env_rollup import RetentionManager
+from .fleet_poller import FleetPoller, load_devices
+from .metrics import METRICS, MetricsFileWriter, MetricsServer, stage_timer
+from .push_listener import PushListener
+from .sample_journal import JOURNAL_DIR
+from .sampling_scheduler import OVERRUN_POLICIES
+from .sensor_fetcher import SensorFetcher
+
+DEFAULT_URL = "http://192.168.2.222:33200/sensor/getAllSensor"
+
+_BUFFER_SECONDS = stage_timer("buffer")
+_RECORD_SECONDS = stage_timer("record")
+_ALERT_SECONDS = stage_timer("alerts")
+_DISPATCH_SECONDS = stage_timer("dispatch")
+_OUT_OF_ORDER = METRICS.counter("env_samples_out_of_order_total", "时间戳早于同一站点上一个样本、被调整为上一个样本时间的样本数")
+
+
+# 采集流水线：拉取 -> 环形缓冲区 -> 存储/统计 -> 告警，不依赖 Qt 和 matplotlib
+# 界面（app.py 的 SensorThread）和无界面采集进程共用这一套
+# on_data / on_alert 在采集线程中被调用
+class Collector:
+    def __init__(self, devices=None, url=DEFAULT_URL, interval=1, data_dir="./env-data", sink="csv",
+                 csv_options=None, history_size=86400, alert_rules=None, alert_webhook=None,
+                 metrics_port=None, metrics_file=None, overrun="skip", rollups=True, raw_retention_days=None,
+                 suppress_unchanged=False, heartbeat=60, listen=None, poll=True, journal_options=None, buffers=None,
+                 max_workers=8, on_data=None, on_alert=None):
+        self.devices = devices
+        self.url = url
+        self.data_dir = data_dir
+        self.sink = sink  # 存储方式：csv、archive 或 both
+        self.csv_options = csv_options or {}
+        self.history_size = history_size
+        self.rollups = rollups
+        self.journal_options = journal_options
+        self.on_data = on_data
+        self.start_timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        self.recorders = {}
+        # 轮询和推送可以同时写同一个站点：每个站点一把锁，环形缓冲区、存储和告警仍然只有一个写入方
+        self.ingest_locks = {}
+        self.last_timestamps = {}  # deviceId -> 上一个样本的时间戳（纳秒）
+        # 可以传入预先创建的环形缓冲区 {deviceId: 缓冲区}，采集进程模式下为共享内存
+        self.buffers = dict(buffers or {})
+        self.lock = threading.Lock()
+        # 告警：规则为空时不做计算；告警同时发到回调、日志文件和可选的 webhook
+        self.alert_engine = AlertEngine(alert_rules or [])
+        if on_alert is not None:
+            self.alert_engine.add_listener(on_alert)
+        if alert_rules:
+            self.alert_engine.add_listener(AlertLog(f"{data_dir}/alerts.log"))
+        if alert_webhook:
+            self.alert_engine.add_listener(WebhookNotifier(alert_webhook))
+        # 指标：可选的本地 /metrics 接口和定期写出的指标文件
+        self.metrics_server = MetricsServer(port=metrics_port).start() if metrics_port is not None else None
+        self.metrics_writer = MetricsFileWriter(metrics_file).start() if metrics_file else None
+        # 原始数据保留期：默认永久保留
+        self.retention = RetentionManager(data_dir, raw_retention_days).start() if raw_retention_days else None
+        # 快照未变化时可以整条流水线都跳过，只按 heartbeat 补发心跳行
+        change_options = {"suppress_unchanged": suppress_unchanged, "heartbeat": heartbeat}
+        # 数据来源：轮询网关和/或接收推送，可以同时使用；poll=False 时只接收推送
+        if not poll and not listen:
+            raise ValueError("关闭轮询时必须指定推送监听地址")
+        if not poll:
+            self.fetcher = None
+        elif devices:
+            self.fetcher = FleetPoller(devices, max_workers=max_workers, on_data=self.on_sensor_data, overrun=overrun,
+                                       **change_options)
+        else:
+            self.fetcher = SensorFetcher(url, interval=interval, on_data=self.on_sensor_data, overrun=overrun,
+                                         **change_options)
+        device_ids = [device.device_id for device in devices] if devices else None
+        self.listener = PushListener(listen, device_ids, on_data=self.on_sensor_data) if listen else None
+        self.sources = [source for source in (self.fetcher, self.listener) if source is not None]
+        # 上次异常退出时留下的写前日志：启动时就回放，不等站点的下一个样本
+        device_ids = [device.device_id for device in devices] if devices else [None]
+        for device_id in device_ids:
+            data_dir = self.data_dir if device_id is None else f"{self.data_dir}/{device_id}"
+            if os.path.isdir(f"{data_dir}/{JOURNAL_DIR}"):
+                self.get_recorder(device_id)
+
+    def set_interval(self, interval):
+        # 多站点模式下各站点使用自己的周期
+        if not self.devices and self.fetcher is not None:
+            self.fetcher.set_interval(interval)
+
+    # 单站点写入 data_dir，多站点每个站点单独一个目录 data_dir/<deviceId>/
+    def get_recorder(self, device_id):
+        with self.lock:
+            recorder = self.recorders.get(device_id)
+            if recorder is None:
+                data_dir = self.data_dir if device_id is None else f"{self.data_dir}/{device_id}"
+                recorder = DeviceRecorder(data_dir, self.start_timestamp, self.sink, self.csv_options,
+                                          rollups=self.rollups, journal_options=self.journal_options,
+                                          device_id=device_id)
+                self.recorders[device_id] = recorder
+            return recorder
+
+    def get_ingest_lock(self, device_id):
+        with self.lock:
+            ingest_lock = self.ingest_locks.get(device_id)
+            if ingest_lock is None:
+                ingest_lock = self.ingest_locks[device_id] = threading.Lock()
+            return ingest_lock
+
+    # 每个站点一个环形缓冲区，写入时持有该站点的 ingest 锁
+    def get_buffer(self, device_id):
+        with self.lock:
+            ring_buffer = self.buffers.get(device_id)
+            if ring_buffer is None:
+                ring_buffer = EnvRingBuffer(self.history_size)
+                self.buffers[device_id] = ring_buffer
+            return ring_buffer
+
+    def get_stats(self, device_id):
+        return self.get_recorder(device_id).stats
+
+    # 在采集线程（轮询或推送接收）中被调用，json_sensor_data 为 SensorSample
+    # 同一站点的样本串行处理；时间戳早于上一个样本的（轮询和推送交替到达、发送方时钟回拨）调整为上一个样本的时间，
+    # 环形缓冲区的 count_since、归档的时间索引和滚动统计都假设时间单调不减
+    def on_sensor_data(self, json_sensor_data):
+        device_id = json_sensor_data.device_id
+        timestamp_ns = json_sensor_data.timestamp_ns
+        ring_buffer = self.get_buffer(device_id)
+        recorder = self.get_recorder(device_id)
+        with self.get_ingest_lock(device_id):
+            last_ns = self.last_timestamps.get(device_id)
+            if last_ns is not None and timestamp_ns < last_ns:
+                _OUT_OF_ORDER.inc()
+                timestamp_ns = json_sensor_data.timestamp_ns = last_ns
+            self.last_timestamps[device_id] = timestamp_ns
+            start = time.perf_counter()
+            ring_buffer.append_record(json_sensor_data, timestamp_ns)
+            buffered = time.perf_counter()
+            recorder.record(json_sensor_data, timestamp_ns)
+            recorded = time.perf_counter()
+            self.alert_engine.evaluate_record(device_id, timestamp_ns, json_sensor_data)
+            evaluated = time.perf_counter()
+        if self.on_data is not None:
+            self.on_data(json_sensor_data)
+        _BUFFER_SECONDS.observe(buffered - start)
+        _RECORD_SECONDS.observe(recorded - buffered)
+        _ALERT_SECONDS.observe(evaluated - recorded)
+        _DISPATCH_SECONDS.observe(time.perf_counter() - evaluated)
+
+    def start(self):
+        for source in self.sources:
+            source.start()
+
+    def stop(self):
+        for source in self.sources:
+            source.stop(wait=False)
+
+    # 停止采集并把各存储队列中剩余的样本写完
+    def close(self):
+        for source in self.sources:
+            source.close()
+        with self.lock:
+            for recorder in self.recorders.values():
+                recorder.close()
+        if self.retention is not None:
+            self.retention.close()
+        if self.metrics_writer is not None:
+            self.metrics_writer.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+
+
+# argparse 的参数类型：正整数、正数
+def positive_int(text):
+    value = int(text)
+    if value <= 0:
+        raise argparse.ArgumentTypeError("必须是正整数: %s" % text)
+    return value
+
+
+def positive_float(text):
+    value = float(text)
+    # NaN 和 inf 同样拒绝
+    if not 0 < value < math.inf:
+        raise argparse.ArgumentTypeError("必须是正数: %s" % text)
+    return value
+
+
+def build_arg_parser(description="ENV-DATA-COLLECTOR"):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--devices", help="多站点模式：站点列表 JSON 文件")
+    parser.add_argument("--max-workers", type=positive_int, default=8, help="多站点模式同时进行的请求数")
+    parser.add_argument("--url", default=DEFAULT_URL, help="单站点模式的网关地址")
+    parser.add_argument("--interval", type=float, default=1, help="单站点模式的采集周期（秒），可以小于 1 秒")
+    parser.add_argument("--overrun", choices=OVERRUN_POLICIES, default="skip",
+                        help="请求超过采集周期时：skip 跳过错过的节拍，coalesce 合并成一次立即采样，catch_up 逐个补采")
+    parser.add_argument("--suppress-unchanged", action="store_true",
+                        help="网关快照与上次相同时不存储、不告警、不刷新界面（支持 ETag/Last-Modified 时用条件请求）")
+    parser.add_argument("--heartbeat", type=float, default=60,
+                        help="快照一直未变化时每隔多少秒仍写一行心跳，0 为不写")
+    parser.add_argument("--listen",
+                        help="接收推送的样本（每行一个 JSON），例如 udp://0.0.0.0:33210 或 tcp://0.0.0.0:33210")
+    parser.add_argument("--no-poll", dest="poll", action="store_false", help="不轮询网关，只接收 --listen 的推送")
+    parser.add_argument("--data-dir", default="./env-data", help="数据目录")
+    parser.add_argument("--history", type=int, default=86400, help="每个站点在内存中保留的样本数")
+    parser.add_argument("--sink", choices=["csv", "archive", "both"], default="csv",
+                        help="存储方式：CSV、二进制列式归档或两者都写")
+    parser.add_argument("--csv-flush", type=float, default=1.0, help="CSV 写盘间隔（秒）")
+    parser.add_argument("--csv-max-mb", type=float, default=64, help="单个 CSV 文件的最大大小（MB），超过后滚动")
+    parser.add_argument("--no-rollups", dest="rollups", action="store_false",
+                        help="不维护 rollup/ 下的 1m/1h/1d 聚合层级")
+    parser.add_argument("--raw-retention-days", type=float,
+                        help="原始数据（归档、CSV、统计快照）保留天数，至少 1 天，默认永久保留；聚合层级不受影响")
+    parser.add_argument("--journal", action="store_true",
+                        help="样本同时写入 journal/ 下的写前日志，崩溃或断电后启动时回放还没有落盘的样本")
+    parser.add_argument("--journal-commit-interval", type=float, default=0.5,
+                        help="日志组提交间隔（秒），每个间隔一次 fsync，断电时最多丢失这么长时间的样本")
+    parser.add_argument("--journal-checkpoint-interval", type=float, default=30,
+                        help="每隔多少秒让存储落盘并删除已经落盘的日志分段")
+    parser.add_argument("--alert-rules", help="告警规则 JSON 文件")
+    parser.add_argument("--alert-webhook", help="告警 webhook 地址，例如 http://127.0.0.1:33300/alert")
+    parser.add_argument("--metrics-port", type=int, help="在 http://127.0.0.1:<端口>/metrics 提供 Prometheus 格式的指标")
+    parser.add_argument("--metrics-file", help="每 10 秒把指标写入该文件（Prometheus 文本格式）")
+    return parser
+
+
+# 根据命令行参数生成 Collector 的参数
+def collector_options(args):
+    return {
+        "devices": load_devices(args.devices) if args.devices else None,
+        "url": args.url,
+        "max_workers": args.max_workers,
+        "interval": args.interval,
+        "overrun": args.overrun,
+        "suppress_unchanged": args.suppress_unchanged,
+        "heartbeat": args.heartbeat,
+        "listen": args.listen,
+        "poll": args.poll,
+        "data_dir": args.data_dir,
+        "sink": args.sink,
+        "csv_options": {
+            "flush_interval": args.csv_flush,
+            "max_bytes": int(args.csv_max_mb * 1024 * 1024),
+        },
+        "history_size": args.history,
+        "rollups": args.rollups,
+        "raw_retention_days": args.raw_retention_days,
+        "journal_options": {
+            "commit_interval": args.journal_commit_interval,
+            "checkpoint_interval": args.journal_checkpoint_interval,
+        } if args.journal else None,
+        "alert_rules": load_rules(args.alert_rules) if args.alert_rules else None,
+        "alert_webhook": args.alert_webhook,
+        "metrics_port": args.metrics_port,
+        "metrics_file": args.metrics_file,
+    }
+
+
+# 无界面采集：python -m zee_utils.collector [参数]，Ctrl+C 或 SIGTERM 退出
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    collector = Collector(on_alert=lambda alert: print(format_alert(alert)), **collector_options(args))
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop_event.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    collector.start()
+    print("采集中，数据写入 %s，按 Ctrl+C 退出" % args.data_dir)
+    stop_event.wait()
+    collector.close()
+
+
+if __name__ == '__main__':
+    main()
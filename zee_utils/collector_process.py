@@ -0,0 +1,197 @@
+import multiprocessing
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from .collector import Collector
+from .shared_ring_buffer import SharedRingBuffer
+
+
+# 采集进程入口：连接界面进程创建的共享环形缓冲区并运行 Collector，
+# 从 conn 接收控制命令，告警放进 alerts 队列；界面进程退出（管道断开）时同样收尾
+# 启动或执行命令时的异常作为回复送回界面进程，由 call() 重新抛出；启动失败后每个命令都回复同一个异常
+def _collector_main(options, buffer_names, conn, alerts):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由界面进程处理
+    buffers = {}
+    collector = None
+    error = None
+    try:
+        try:
+            for device_id, name in buffer_names.items():
+                buffers[device_id] = SharedRingBuffer.attach(name, writable=True)
+            collector = Collector(buffers=buffers, on_alert=alerts.put, **options)
+        except Exception as e:
+            print("采集进程启动失败:")
+            traceback.print_exc()
+            # 异常对象不一定能序列化，只送回描述
+            error = RuntimeError("采集进程启动失败: %r" % e)
+        while True:
+            try:
+                command, *args = conn.recv()
+            except EOFError:
+                break
+            if command == "close":
+                break
+            if error is not None:
+                conn.send(error)
+                continue
+            result = None
+            try:
+                if command == "start":
+                    collector.start()
+                elif command == "stop":
+                    collector.stop()
+                elif command == "interval":
+                    collector.set_interval(*args)
+                elif command == "stats":
+                    result = collector.get_stats(args[0]).stats(args[1])
+            except Exception as e:
+                traceback.print_exc()
+                result = RuntimeError("采集进程执行命令 %s 失败: %r" % (command, e))
+            conn.send(result)
+    finally:
+        if collector is not None:
+            collector.close()
+        for ring_buffer in buffers.values():
+            ring_buffer.close()
+        alerts.put(None)
+        try:
+            conn.send(None)
+        except OSError:
+            pass
+
+
+# 采集进程中某个站点的滚动统计，stats() 返回后台查询到的最近结果，不等待管道
+class _RemoteStats:
+    def __init__(self, process, device_id):
+        self.process = process
+        self.device_id = device_id
+
+    def stats(self, field):
+        return self.process.cached_stats(self.device_id, field)
+
+
+# 在独立进程中运行 Collector：拉取、存储、统计和告警不与界面共用 GIL，
+# matplotlib 重绘或 Qt 布局再慢也不会推迟采样
+# 每个站点的环形缓冲区由本进程创建在共享内存中，采集进程写入，本进程只读映射，不序列化也不复制
+# 接口与 Collector 相同（start/stop/set_interval/get_buffer/get_stats/close），但没有 on_data 回调：
+# 界面按自己的节奏读取缓冲区的 version 和 latest_sample()
+# 滚动统计由后台线程通过管道查询（最多等待 stats_timeout 秒），界面拿到的是上一次查询的结果；告警经队列送回，on_alert 在本进程的接收线程中调用
+# 命令等待回复最多 call_timeout 秒，close() 最多等待 close_timeout 秒，采集进程卡住或已经退出时不会挂住界面
+class CollectorProcess:
+    def __init__(self, devices=None, history_size=86400, on_alert=None, close_timeout=30, call_timeout=10,
+                 stats_timeout=1, **options):
+        self.devices = devices
+        self.on_alert = on_alert
+        self.close_timeout = close_timeout
+        self.call_timeout = call_timeout
+        self.stats_timeout = stats_timeout
+        self._stale_replies = 0  # 超时之后仍可能到达的回复，下次调用前先取走
+        self._stats_cache = {}  # (device_id, field) -> 最近一次查询到的统计
+        self._stats_future = None
+        self._stats_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="CollectorStats")
+        device_ids = [device.device_id for device in devices] if devices else [None]
+        self.buffers = {device_id: SharedRingBuffer.create(history_size) for device_id in device_ids}
+        # spawn：不把界面进程中的 Qt 状态和线程 fork 进采集进程
+        context = multiprocessing.get_context("spawn")
+        self.conn, child_conn = context.Pipe()
+        self.alerts = context.Queue()
+        options = dict(options, devices=devices, history_size=history_size)
+        buffer_names = {device_id: ring_buffer.name for device_id, ring_buffer in self.buffers.items()}
+        self.process = context.Process(target=_collector_main, args=(options, buffer_names, child_conn, self.alerts),
+                                       name="EnvCollector", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.lock = threading.Lock()
+        self._closed = False
+        self._alert_thread = threading.Thread(target=self._receive_alerts, name="CollectorAlerts", daemon=True)
+        self._alert_thread.start()
+
+    def _receive_alerts(self):
+        while True:
+            alert = self.alerts.get()
+            if alert is None:
+                return
+            if self.on_alert is not None:
+                self.on_alert(alert)
+
+    # 发送命令并等待回复，timeout 秒内没有回复时抛出 TimeoutError；采集进程已经退出时抛出 EOFError 或 OSError，
+    # 采集进程启动失败或执行命令出错时抛出 RuntimeError
+    def call(self, *command, timeout=None):
+        timeout = self.call_timeout if timeout is None else timeout
+        with self.lock:
+            while self._stale_replies:
+                if not self.conn.poll(timeout):
+                    raise TimeoutError("采集进程 %s 秒内没有响应" % timeout)
+                self.conn.recv()
+                self._stale_replies -= 1
+            self.conn.send(command)
+            if not self.conn.poll(timeout):
+                self._stale_replies += 1
+                raise TimeoutError("采集进程 %s 秒内没有响应命令 %s" % (timeout, command[0]))
+            result = self.conn.recv()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def is_alive(self):
+        return self.process.is_alive()
+
+    def start(self):
+        # 采集进程启动时可能还在回放写前日志
+        self.call("start", timeout=max(self.call_timeout, self.close_timeout))
+
+    def stop(self):
+        self.call("stop")
+
+    def set_interval(self, interval):
+        if not self.devices:
+            self.call("interval", interval)
+
+    def get_buffer(self, device_id):
+        return self.buffers[device_id]
+
+    def get_stats(self, device_id):
+        return _RemoteStats(self, device_id)
+
+    # 返回上一次查询到的统计（还没有时为空字典），上一次查询已经完成时在后台发起新的查询
+    # 只在界面线程调用
+    def cached_stats(self, device_id, field):
+        key = (device_id, field)
+        if not self._closed and (self._stats_future is None or self._stats_future.done()):
+            self._stats_future = self._stats_executor.submit(self._fetch_stats, key)
+        return self._stats_cache.get(key, {})
+
+    def _fetch_stats(self, key):
+        try:
+            self._stats_cache[key] = self.call("stats", *key, timeout=self.stats_timeout)
+        except (EOFError, OSError, RuntimeError):
+            # 包括 TimeoutError，下次再查
+            pass
+
+    # 采集进程写完各存储队列后退出，再释放共享内存；close_timeout 秒内没有退出时终止它
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        deadline = time.monotonic() + self.close_timeout
+        self._stats_executor.shutdown(wait=True)
+        try:
+            self.call("close", timeout=self.close_timeout)
+        except (EOFError, OSError, RuntimeError):
+            # 包括 TimeoutError
+            pass
+        self.process.join(max(deadline - time.monotonic(), 0))
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.alerts.put(None)
+        self._alert_thread.join()
+        self.conn.close()
+        for ring_buffer in self.buffers.values():
+            ring_buffer.close()
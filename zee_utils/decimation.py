@@ -0,0 +1,131 @@
+import numpy as np
+
+
+# 将 y 按 bucket_size 分桶，offset 是 y[0] 的绝对序号
+def _minmax_buckets(y, bucket_size, offset):
+    count = len(y) // bucket_size
+    head = y[:count * bucket_size].reshape(count, bucket_size)
+    index_min, value_min = _bucket_argmin(head)
+    index_max, value_max = _bucket_argmax(head)
+    starts = np.arange(count) * bucket_size + offset
+    x = np.concatenate([starts + index_min, starts + index_max])
+    values = np.concatenate([value_min, value_max])
+    tail = y[count * bucket_size:]
+    if len(tail):
+        tail_start = count * bucket_size + offset
+        tail_min, tail_max = _bucket_argmin(tail[None, :]), _bucket_argmax(tail[None, :])
+        x = np.concatenate([x, tail_start + tail_min[0], tail_start + tail_max[0]])
+        values = np.concatenate([values, tail_min[1], tail_max[1]])
+    order = np.argsort(x, kind='stable')
+    return x[order], values[order]
+
+
+# 全部为 NaN 的桶结果为 NaN，图上表现为断开
+def _bucket_argmin(buckets):
+    filled = np.where(np.isnan(buckets), np.inf, buckets)
+    index = filled.argmin(axis=1)
+    values = filled[np.arange(len(filled)), index]
+    return index, np.where(np.isinf(values) & (values > 0), np.nan, values)
+
+
+def _bucket_argmax(buckets):
+    filled = np.where(np.isnan(buckets), -np.inf, buckets)
+    index = filled.argmax(axis=1)
+    values = filled[np.arange(len(filled)), index]
+    return index, np.where(np.isinf(values) & (values < 0), np.nan, values)
+
+
+# 环形缓冲区上的分级 min-max 抽稀
+# 桶大小取 2 的幂并按样本绝对序号对齐，已经写满的桶不会再变化，
+# 因此每一级的结果可以缓存下来，新数据到来时只计算新增的桶；缩放时各级缓存互相独立
+class MinMaxDecimator:
+    def __init__(self, ring_buffer):
+        self.ring_buffer = ring_buffer
+        # (字段, 桶大小) -> [首个桶的序号, 最小值下标, 最小值, 最大值下标, 最大值]
+        self.levels = {}
+
+    @staticmethod
+    def bucket_size_for(n, width):
+        points = max(width // 2, 1)
+        size = 1
+        while size * points < n:
+            size *= 2
+        return size
+
+    # 取绝对序号 [end - n, end) 的数据，抽稀到大约 width 个点
+    # 返回 (x, y)，x 为相对于窗口起点的偏移
+    def decimate(self, field, n, width, end=None):
+        ring_buffer = self.ring_buffer
+        total = ring_buffer.total
+        end = total if end is None else min(end, total)
+        start = max(end - n, total - len(ring_buffer), 0)
+        size = self.bucket_size_for(end - start, width)
+        if size == 1:
+            y = ring_buffer.range(field, start, end)
+            return np.arange(len(y)) + (start - (end - n)), y
+
+        first_full = -(-start // size)
+        last_full = end // size
+        level = self._update_level(field, size, first_full, last_full)
+        parts_x = []
+        parts_y = []
+        # 窗口起点没有对齐的部分
+        head_end = min(first_full * size, end)
+        if head_end > start:
+            x, y = _minmax_buckets(ring_buffer.range(field, start, head_end), size, start)
+            parts_x.append(x)
+            parts_y.append(y)
+        if last_full > first_full:
+            lo = first_full - level[0]
+            hi = last_full - level[0]
+            x = np.empty(2 * (hi - lo), dtype=np.int64)
+            y = np.empty(2 * (hi - lo), dtype=float)
+            index_min, value_min, index_max, value_max = level[1][lo:hi], level[2][lo:hi], level[3][lo:hi], level[4][lo:hi]
+            min_first = index_min <= index_max
+            x[0::2] = np.where(min_first, index_min, index_max)
+            x[1::2] = np.where(min_first, index_max, index_min)
+            y[0::2] = np.where(min_first, value_min, value_max)
+            y[1::2] = np.where(min_first, value_max, value_min)
+            parts_x.append(x)
+            parts_y.append(y)
+        # 最后一个还没写满的桶每次重新计算
+        tail_start = max(last_full * size, start)
+        if end > tail_start:
+            x, y = _minmax_buckets(ring_buffer.range(field, tail_start, end), size, tail_start)
+            parts_x.append(x)
+            parts_y.append(y)
+        if not parts_x:
+            return np.arange(0), np.arange(0, dtype=float)
+        x = np.concatenate(parts_x) - (end - n)
+        return x, np.concatenate(parts_y)
+
+    # 保证缓存覆盖 [first, last) 号桶（只包含已写满的桶），返回该级缓存
+    def _update_level(self, field, size, first, last):
+        key = (field, size)
+        level = self.levels.get(key)
+        oldest = -(-(self.ring_buffer.total - len(self.ring_buffer)) // size)
+        if level is None or level[0] > first:
+            level = [max(first, oldest)] + [np.empty(0, dtype=np.int64), np.empty(0),
+                                            np.empty(0, dtype=np.int64), np.empty(0)]
+            self.levels[key] = level
+        # 丢弃已经被环形缓冲区覆盖的桶
+        if oldest > level[0]:
+            drop = oldest - level[0]
+            for i in range(1, 5):
+                level[i] = level[i][drop:]
+            level[0] = oldest
+        cached_end = level[0] + len(level[1])
+        if last > cached_end:
+            y = self.ring_buffer.range(field, cached_end * size, last * size)
+            buckets = np.asarray(y, dtype=float).reshape(last - cached_end, size)
+            starts = np.arange(cached_end, last, dtype=np.int64) * size
+            index_min, value_min = _bucket_argmin(buckets)
+            index_max, value_max = _bucket_argmax(buckets)
+            level[1] = np.concatenate([level[1], starts + index_min])
+            level[2] = np.concatenate([level[2], value_min])
+            level[3] = np.concatenate([level[3], starts + index_max])
+            level[4] = np.concatenate([level[4], value_max])
+        return level
+
+    def clear(self):
+        self.levels.clear()
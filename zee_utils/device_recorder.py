@@ -0,0 +1,130 @@
+import glob
+import os
+import time
+
+from .env_archive import EnvArchive, EnvArchiveReader
+from .env_json_to_csv import JSONtoCSV, tail_timestamps
+from .env_rollup import ROLLUP_DIR, RollupEngine
+from .rolling_stats import RollingStatsEngine
+from .sample_journal import JOURNAL_DIR, SampleJournal
+from .sensor_fields import SENSOR_SCHEMA
+from .sensor_sample import SampleLayout, ns_to_timestamp, record_timestamp_ns
+
+
+# 一个站点的存储与统计：样本写入 CSV 和/或二进制归档，同时更新滚动统计，
+# 每隔 stats_interval 秒把统计快照写入 env_stats_<时间>.csv / stats-archive/
+# rollups=True 时同时增量维护 rollup/ 下的 1m/1h/1d 聚合层级，与存储方式无关
+# journal_options 不为 None 时样本同时写入 journal/ 下的写前日志（参数见 SampleJournal）；
+# journal/ 中有上次没有落盘的样本时，无论是否启用日志，创建时都先回放到存储
+# device_id 为多站点模式下的站点 ID；样本 CSV 的表头固定，多站点时有 deviceId 列，
+# jitter_ms 列一直都有（推送的样本没有这一项，写为空），不随第一个样本的来源变化
+class DeviceRecorder:
+    def __init__(self, data_dir, start_timestamp, sink="csv", csv_options=None, stats_interval=60, rollups=True,
+                 journal_options=None, device_id=None):
+        self.data_dir = data_dir
+        self.csv_header = SampleLayout(SENSOR_SCHEMA).columns(device_id is not None, True)
+        self.sink = sink  # 存储方式：csv、archive 或 both
+        csv_options = csv_options or {}
+        self.csv_options = csv_options
+        flush_interval = csv_options.get("flush_interval", 1.0)
+        self.stats = RollingStatsEngine()
+        self.stats_interval_ns = int(stats_interval * 1000000000)
+        self.last_stats_ns = None
+        self.sinks = []
+        self.stats_sinks = []
+        if sink in ("csv", "both"):
+            self.sinks.append(JSONtoCSV(f"{data_dir}/env_data_{start_timestamp}.csv", header=self.csv_header,
+                                        **csv_options))
+            self.stats_sinks.append(JSONtoCSV(f"{data_dir}/env_stats_{start_timestamp}.csv", **csv_options))
+        if sink in ("archive", "both"):
+            self.sinks.append(EnvArchive(f"{data_dir}/archive", flush_interval=flush_interval))
+            self.stats_sinks.append(EnvArchive(f"{data_dir}/stats-archive", fields=self.stats.snapshot_fields(),
+                                               flush_interval=flush_interval))
+        self.rollups = RollupEngine(f"{data_dir}/{ROLLUP_DIR}", flush_interval=flush_interval) if rollups else None
+        self.journal = None
+        journal_dir = f"{data_dir}/{JOURNAL_DIR}"
+        if journal_options is not None or os.path.isdir(journal_dir):
+            journal = SampleJournal(journal_dir, sync=self.sync, **(journal_options or {}))
+            self._replay(journal)
+            if journal_options is not None:
+                self.journal = journal.start()
+            elif self.rollups is not None:
+                # 只回放不继续记日志：聚合层级回到没有检查点的恢复方式
+                self.rollups.discard_checkpoint()
+
+    # 回放写入原始数据存储和聚合层级；聚合层级已经从检查点恢复到 last_ns，只补上之后的样本
+    # 滚动统计只覆盖最近的窗口，不回放
+    # 回放之后立即做一次聚合检查点，之后日志中的样本都晚于它
+    def _replay(self, journal):
+        samples, last = journal.recover()
+        if samples:
+            first_ns = min(json_sensor_data.timestamp_ns for json_sensor_data in samples)
+            for sink in self.sinks:
+                self._replay_into(sink, samples, first_ns)
+            if self.rollups is not None:
+                covered_ns = self.rollups.last_ns
+                for json_sensor_data in samples:
+                    if covered_ns is None or json_sensor_data.timestamp_ns > covered_ns:
+                        self.rollups.update(json_sensor_data, json_sensor_data.timestamp_ns)
+            print("从 %s 回放 %d 个样本" % (journal.journal_dir, len(samples)))
+        if self.rollups is not None:
+            self.rollups.checkpoint()
+        journal.discard_through(last)
+
+    # 崩溃前存储可能已经写入了其中一部分，跳过已经存在的时间戳，回放不产生重复行
+    # CSV 回放到以第一个样本的时间命名的单独文件，文件名的时间不晚于其中任何一行
+    def _replay_into(self, sink, samples, first_ns):
+        if isinstance(sink, JSONtoCSV):
+            written = set()
+            for path in glob.glob(f"{self.data_dir}/env_data_*.csv"):
+                # 最后修改早于这些样本的文件不会包含它们，留出一小时的余量应对设备时钟偏差
+                if os.path.getmtime(path) * 1000000000 >= first_ns - 3600 * 1000000000:
+                    written.update(tail_timestamps(path, len(samples)))
+            pending = [json_sensor_data for json_sensor_data in samples if json_sensor_data.timestamp not in written]
+            replay_timestamp = time.strftime("%Y-%m-%d_%H-%M-%S", time.localtime(first_ns // 1000000000))
+            target = JSONtoCSV(f"{self.data_dir}/env_data_{replay_timestamp}.csv", header=self.csv_header,
+                               **self.csv_options)
+        else:
+            written = set(EnvArchiveReader(sink.archive_dir).query(first_ns, fields=())[0].tolist())
+            pending = [json_sensor_data for json_sensor_data in samples if json_sensor_data.timestamp_ns not in written]
+            target = sink
+        for json_sensor_data in pending:
+            target.add_data(json_sensor_data)
+        target.sync()
+        if target is not sink:
+            target.close()
+
+    def record(self, json_sensor_data, timestamp_ns=None):
+        if timestamp_ns is None:
+            timestamp_ns = record_timestamp_ns(json_sensor_data)
+        self.stats.update(json_sensor_data, timestamp_ns)
+        if self.rollups is not None:
+            self.rollups.update(json_sensor_data, timestamp_ns)
+        for sink in self.sinks:
+            sink.add_data(json_sensor_data)
+        # 先交给存储和聚合层级再写日志：检查点切换分段时，旧分段中的样本都已经在存储的队列和聚合的桶里
+        if self.journal is not None:
+            self.journal.append(json_sensor_data, timestamp_ns)
+        if self.last_stats_ns is None:
+            self.last_stats_ns = timestamp_ns
+        elif timestamp_ns - self.last_stats_ns >= self.stats_interval_ns:
+            self.last_stats_ns = timestamp_ns
+            row = self.stats.snapshot()
+            row['timestamp'] = ns_to_timestamp(timestamp_ns)
+            for sink in self.stats_sinks:
+                sink.add_data(row)
+
+    # 原始数据存储落盘，保存聚合层级未关闭的桶；写前日志做检查点时调用
+    def sync(self):
+        for sink in self.sinks:
+            sink.sync()
+        if self.rollups is not None:
+            self.rollups.checkpoint()
+
+    def close(self):
+        for sink in self.sinks + self.stats_sinks:
+            sink.close()
+        if self.journal is not None:
+            self.journal.close()
+        if self.rollups is not None:
+            self.rollups.close()
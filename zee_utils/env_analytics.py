@@ -0,0 +1,400 @@
+import argparse
+import csv
+import glob
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from numpy.lib import recfunctions
+
+from .sensor_fields import SENSOR_FIELDS
+
+# 分组周期：按 CSV 中的本地时间划分
+GROUP_PERIODS = ("hour", "day", "week", "month", "all")
+GROUP_STATS = ("count", "mean", "std", "min", "max")
+# 默认的相关性分析：交通字段与污染、噪声字段
+TRAFFIC_FIELDS = ("Car_Sum", "Car_Number_green", "People_Number")
+ENV_FIELDS = ("PM2.5", "NO2", "Noise")
+
+DATA_FILE_PATTERN = "env_data_*.csv"
+_FILE_START = re.compile(r"env_data_(\d{4}-\d{2}-\d{2})_(\d{2})-(\d{2})-(\d{2})")
+
+
+# 数据目录下的原始 CSV：单站点在 data_dir 下，多站点在 data_dir/<deviceId>/ 下
+# 返回 [(站点, 路径)]，单站点的站点为 None
+def find_data_files(data_dir):
+    files = [(None, path) for path in sorted(glob.glob(os.path.join(data_dir, DATA_FILE_PATTERN)))]
+    for path in sorted(glob.glob(os.path.join(data_dir, "*", DATA_FILE_PATTERN))):
+        files.append((os.path.basename(os.path.dirname(path)), path))
+    return files
+
+
+# 文件名中的开始时间（采集启动时间），滚动出的 .1.csv 等分片只会更晚
+def file_start_time(path):
+    match = _FILE_START.search(os.path.basename(path))
+    if match is None:
+        return None
+    return np.datetime64("%sT%s:%s:%s" % match.groups(), "us")
+
+
+# "2024-05-01 00:00:00" -> datetime64，与 CSV 中的时间一样是本地时间
+def parse_time(value):
+    return np.datetime64(value.strip().replace(" ", "T"), "us")
+
+
+# 读取一个 env_data_*.csv：一次 np.loadtxt 按列解析，不逐行构造 Python 对象
+# 返回 (时间戳 datetime64[us], 数值 float64[行, 字段], deviceId 列或 None)，文件中没有的字段为 NaN
+# 最后一行没有换行时（正在写入或异常退出）丢弃；其他格式问题退回逐行解析并跳过坏行
+def read_data_csv(path, fields=SENSOR_FIELDS):
+    with open(path, 'rb') as f:
+        data = f.read()
+    header_end = data.find(b"\n")
+    body = data[header_end + 1:data.rfind(b"\n") + 1] if header_end >= 0 else b""
+    if not body:
+        return np.empty(0, "datetime64[us]"), np.empty((0, len(fields))), None
+    header = data[:header_end].decode('utf-8').rstrip("\r").split(",")
+    columns = {name: i for i, name in enumerate(header)}
+    if "timestamp" not in columns:
+        raise ValueError("%s 没有 timestamp 列" % path)
+    present = [name for name in fields if name in columns]
+    has_device = "deviceId" in columns
+    dtype = [(name, np.float64) for name in present] + [("timestamp", "S32")]
+    usecols = [columns[name] for name in present] + [columns["timestamp"]]
+    if has_device:
+        dtype.append(("deviceId", "S64"))
+        usecols.append(columns["deviceId"])
+    try:
+        try:
+            table = np.loadtxt(body.splitlines(), delimiter=",", usecols=usecols, dtype=dtype, ndmin=1)
+        except ValueError:
+            # 缺失值写成空字段，换成 nan 后再整块解析一次
+            body = body.replace(b"\r\n", b"\n").replace(b",,", b",nan,").replace(b",,", b",nan,")
+            body = body.replace(b",\n", b",nan\n").replace(b"\n,", b"\nnan,")
+            if body.startswith(b","):
+                body = b"nan" + body
+            table = np.loadtxt(body.split(b"\n"), delimiter=",", usecols=usecols, dtype=dtype, ndmin=1)
+        timestamps = table["timestamp"].astype("datetime64[us]")
+    except ValueError:
+        table = _read_rows(data[header_end + 1:], len(header), usecols, dtype, len(present))
+        timestamps = table["timestamp"].astype("datetime64[us]")
+    values = np.full((len(table), len(fields)), np.nan)
+    if present:
+        index = [list(fields).index(name) for name in present]
+        values[:, index] = recfunctions.structured_to_unstructured(table[present], dtype=np.float64)
+    device_ids = table["deviceId"].astype(str) if has_device else None
+    return timestamps, values, device_ids
+
+
+# 逐行解析，只在整块解析失败时使用：列数不对、数值或时间无法解析的行跳过
+def _read_rows(body, column_count, usecols, dtype, numeric_count):
+    rows = []
+    for row in csv.reader(body.decode('utf-8', 'replace').splitlines()):
+        if len(row) != column_count:
+            continue
+        try:
+            values = [float(row[i]) if row[i] else np.nan for i in usecols[:numeric_count]]
+            np.datetime64(row[usecols[numeric_count]].replace(" ", "T"), "us")
+        except ValueError:
+            continue
+        rows.append(tuple(values) + tuple(row[i] for i in usecols[numeric_count:]))
+    return np.array(rows, dtype=dtype)
+
+
+# 时间戳所在周期的起点，作为分组键（datetime64）
+def period_starts(timestamps, group_by):
+    if group_by == "hour":
+        return timestamps.astype("datetime64[h]")
+    if group_by == "day":
+        return timestamps.astype("datetime64[D]")
+    if group_by == "week":
+        # 周一为一周的开始，1970-01-01 是周四
+        days = timestamps.astype("datetime64[D]").astype(np.int64)
+        return (days - (days + 3) % 7).astype("datetime64[D]")
+    if group_by == "month":
+        return timestamps.astype("datetime64[M]")
+    return np.zeros(len(timestamps), dtype="datetime64[D]")
+
+
+def period_label(period, group_by):
+    if group_by == "all":
+        return ""
+    if group_by == "hour":
+        return str(period).replace("T", " ") + ":00"
+    return str(period)
+
+
+# 每组每个字段的 count/mean/m2/min/max（5 x 字段数），m2 为离差平方和
+# group_index 为各行所属的组（0..group_count-1），组内用 reduceat 一次算完所有字段
+def group_moments(group_index, group_count, values):
+    if len(group_index) > 1 and np.any(group_index[1:] < group_index[:-1]):
+        order = np.argsort(group_index, kind='stable')
+        group_index, values = group_index[order], values[order]
+    starts = np.searchsorted(group_index, np.arange(group_count))
+    valid = ~np.isnan(values)
+    count = np.add.reduceat(valid, starts, axis=0).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0) / count
+        deviation = np.where(valid, values - mean[group_index], 0.0)
+    m2 = np.add.reduceat(deviation * deviation, starts, axis=0)
+    low = np.fmin.reduceat(values, starts, axis=0)
+    high = np.fmax.reduceat(values, starts, axis=0)
+    return [np.stack(moments) for moments in zip(count, mean, m2, low, high)]
+
+
+# 合并两组 count/mean/m2/min/max（Chan 的并行方差合并）
+def merge_moments(a, b):
+    count_a, mean_a, m2_a = a[0], a[1], a[2]
+    count_b, mean_b, m2_b = b[0], b[1], b[2]
+    count = count_a + count_b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        delta = np.where(count_b > 0, mean_b, 0.0) - np.where(count_a > 0, mean_a, 0.0)
+        mean = np.where(count_a > 0, mean_a, 0.0) + delta * np.where(count > 0, count_b / count, 0.0)
+        m2 = (np.where(count_a > 0, m2_a, 0.0) + np.where(count_b > 0, m2_b, 0.0)
+              + delta * delta * np.where(count > 0, count_a * count_b / count, 0.0))
+    mean = np.where(count > 0, mean, np.nan)
+    return np.stack([count, mean, m2, np.fmin(a[3], b[3]), np.fmax(a[4], b[4])])
+
+
+# 两两相关所需的矩阵（字段数 x 字段数）：[i, j] 只用字段 i 和 j 都有值的行，
+# n 为行数，mean[i, j] 为字段 i 在这些行上的均值，m2[i, j] 为字段 i 的离差平方和，c 为 i 与 j 的协离差和
+# 先减去各字段的均值再求和，避免大数相减损失精度
+def pair_moments(values):
+    valid = ~np.isnan(values)
+    mask = valid.astype(np.float64)
+    shift = np.where(valid, values, 0.0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    shifted = np.where(valid, values - shift, 0.0)
+    n = mask.T @ mask
+    total = shifted.T @ mask
+    squares = (shifted * shifted).T @ mask
+    products = shifted.T @ shifted
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, total / n, 0.0)
+    return np.stack([n, mean + shift[:, None], squares - mean * total, products - mean * total.T])
+
+
+def merge_pair_moments(a, b):
+    n_a, mean_a, m2_a, c_a = a
+    n_b, mean_b, m2_b, c_b = b
+    n = n_a + n_b
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = np.where(n > 0, n_a * n_b / n, 0.0)
+        delta = np.where(n_b > 0, mean_b, 0.0) - np.where(n_a > 0, mean_a, 0.0)
+        mean = np.where(n_a > 0, mean_a, 0.0) + delta * np.where(n > 0, n_b / n, 0.0)
+    return np.stack([n, mean, m2_a + m2_b + delta * delta * weight, c_a + c_b + delta * delta.T * weight])
+
+
+# 扫描结果：按 (站点, 周期) 和 (站点, 小时) 分组的矩，以及各站点的两两相关矩阵
+# 每个文件单独得到一个结果，再用 merge() 合并，合并与文件的顺序无关
+class AnalyticsResult:
+    def __init__(self, fields=SENSOR_FIELDS, group_by="day", correlate=None):
+        self.fields = tuple(fields)
+        self.group_by = group_by
+        self.correlate = tuple(correlate) if correlate else ()
+        self.groups = {}  # (站点, 周期起点) -> 5 x 字段数
+        self.hours = {}  # (站点, 小时) -> 5 x 字段数
+        self.pairs = {}  # 站点 -> 4 x 相关字段数 x 相关字段数
+        self.rows = 0
+        self.files = 0
+
+    @staticmethod
+    def _merge_into(target, key, moments, merge):
+        existing = target.get(key)
+        target[key] = moments if existing is None else merge(existing, moments)
+
+    # 只对原始数据按整点小时做一次分组，周期和一天中的小时都由小时的矩合并得到
+    def add(self, device, timestamps, values):
+        if len(timestamps) == 0:
+            return
+        self.rows += len(timestamps)
+        hours, inverse = np.unique(timestamps.astype("datetime64[h]"), return_inverse=True)
+        hour_moments = group_moments(inverse, len(hours), values)
+        periods = period_starts(hours, self.group_by)
+        # CSV 中是本地时间，按 UTC 解释后取小时即为本地的小时
+        hours_of_day = hours.astype(np.int64) % 24
+        for period, hour_of_day, moments in zip(periods, hours_of_day, hour_moments):
+            self._merge_into(self.groups, (device, period), moments, merge_moments)
+            self._merge_into(self.hours, (device, int(hour_of_day)), moments, merge_moments)
+        if self.correlate:
+            index = [self.fields.index(name) for name in self.correlate]
+            self._merge_into(self.pairs, device, pair_moments(values[:, index]), merge_pair_moments)
+
+    def merge(self, other):
+        for key, moments in other.groups.items():
+            self._merge_into(self.groups, key, moments, merge_moments)
+        for key, moments in other.hours.items():
+            self._merge_into(self.hours, key, moments, merge_moments)
+        for key, moments in other.pairs.items():
+            self._merge_into(self.pairs, key, moments, merge_pair_moments)
+        self.rows += other.rows
+        self.files += other.files
+        return self
+
+    def _stat_columns(self):
+        return ["%s_%s" % (name, stat) for name in self.fields for stat in GROUP_STATS]
+
+    @staticmethod
+    def _stat_values(moments):
+        count, mean, m2, low, high = moments
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.where(count > 1, np.sqrt(np.maximum(m2, 0.0) / (count - 1)), np.where(count == 1, 0.0, np.nan))
+        return [value for stats in zip(count.astype(np.int64), mean, std, low, high) for value in stats]
+
+    # 分组汇总：表头 deviceId, period, <字段>_count/_mean/_std/_min/_max
+    def aggregates(self):
+        header = ["deviceId", "period"] + self._stat_columns()
+        rows = [[device or "", period_label(period, self.group_by)] + self._stat_values(self.groups[device, period])
+                for device, period in sorted(self.groups, key=lambda key: (key[0] or "", key[1]))]
+        return header, rows
+
+    # 按一天中的小时（本地时间 0-23）汇总，得到日变化曲线
+    def hourly_profile(self):
+        header = ["deviceId", "hour"] + self._stat_columns()
+        rows = [[device or "", hour] + self._stat_values(self.hours[device, hour])
+                for device, hour in sorted(self.hours, key=lambda key: (key[0] or "", key[1]))]
+        return header, rows
+
+    # x_fields 与 y_fields 两两的皮尔逊相关系数，每个站点一组；多个站点时另给出全部站点合并的结果（站点为 *）
+    def correlations(self, x_fields=TRAFFIC_FIELDS, y_fields=ENV_FIELDS):
+        pairs = dict(sorted(self.pairs.items(), key=lambda item: item[0] or ""))
+        if len(pairs) > 1:
+            combined = None
+            for moments in pairs.values():
+                combined = moments if combined is None else merge_pair_moments(combined, moments)
+            pairs["*"] = combined
+        rows = []
+        for device, (n, mean, m2, c) in pairs.items():
+            for x in x_fields:
+                i = self.correlate.index(x)
+                for y in y_fields:
+                    j = self.correlate.index(y)
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        r = c[i, j] / np.sqrt(m2[i, j] * m2[j, i])
+                    rows.append([device or "", x, y, float(r) if n[i, j] > 2 else np.nan, int(n[i, j])])
+        return ["deviceId", "x", "y", "r", "n"], rows
+
+
+# 进程池中执行：读取一个文件并得到它的 AnalyticsResult
+def scan_file(device, path, fields=SENSOR_FIELDS, group_by="day", correlate=None, start=None, end=None,
+              devices=None):
+    result = AnalyticsResult(fields, group_by, correlate)
+    timestamps, values, device_ids = read_data_csv(path, fields)
+    if start is not None or end is not None:
+        keep = np.ones(len(timestamps), dtype=bool)
+        if start is not None:
+            keep &= timestamps >= start
+        if end is not None:
+            keep &= timestamps < end
+        timestamps, values = timestamps[keep], values[keep]
+        device_ids = device_ids[keep] if device_ids is not None else None
+    if device_ids is None or device is not None:
+        # 站点目录下的文件都属于该站点
+        if devices is None or device in devices:
+            result.add(device, timestamps, values)
+    else:
+        for device_id in np.unique(device_ids):
+            if devices is None or device_id in devices:
+                rows = device_ids == device_id
+                result.add(str(device_id), timestamps[rows], values[rows])
+    result.files = 1
+    return result
+
+
+# 扫描数据目录下的原始 CSV 并合并结果；workers 个进程并行，每个文件一个任务，workers=1 时在当前进程中完成
+# start/end 为本地时间（datetime64 或 "2024-05-01 00:00:00"），按文件名和修改时间先跳过范围外的文件
+# correlate 为需要计算相关性的字段，None 为不计算
+def analyze(data_dir, fields=SENSOR_FIELDS, group_by="day", correlate=None, start=None, end=None, devices=None,
+            workers=None):
+    if group_by not in GROUP_PERIODS:
+        raise ValueError("分组周期应为 %s 之一: %s" % (", ".join(GROUP_PERIODS), group_by))
+    fields = tuple(fields)
+    start = parse_time(start) if isinstance(start, str) else start
+    end = parse_time(end) if isinstance(end, str) else end
+    devices = set(devices) if devices else None
+    tasks = []
+    for device, path in find_data_files(data_dir):
+        if devices is not None and device is not None and device not in devices:
+            continue
+        file_start = file_start_time(path)
+        if end is not None and file_start is not None and file_start >= end:
+            continue
+        # 最后修改时间早于 start 的文件不会有范围内的数据；修改时间按 UTC 解释，留出一天的余量覆盖时区差
+        modified = np.datetime64(int(os.path.getmtime(path) * 1e6), "us")
+        if start is not None and modified < start - np.timedelta64(1, "D"):
+            continue
+        tasks.append((device, path, fields, group_by, correlate, start, end, devices))
+    result = AnalyticsResult(fields, group_by, correlate)
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    if workers <= 1:
+        for task in tasks:
+            result.merge(scan_file(*task))
+        return result
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(scan_file, *task) for task in tasks]
+        for future in as_completed(futures):
+            result.merge(future.result())
+    return result
+
+
+def _format(value):
+    if isinstance(value, (float, np.floating)):
+        return "" if value != value else "%.6g" % value
+    return value
+
+
+def write_table(header, rows, csv_filename=None):
+    f = open(csv_filename, 'w', newline='') if csv_filename else sys.stdout
+    try:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows([_format(value) for value in row] for row in rows)
+    finally:
+        if csv_filename:
+            f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="环境数据离线分析：并行扫描 env_data_*.csv")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summary_parser = subparsers.add_parser("summary", help="按站点和周期汇总 count/mean/std/min/max")
+    summary_parser.add_argument("--group-by", choices=GROUP_PERIODS, default="day", help="汇总周期，按本地时间划分")
+    profile_parser = subparsers.add_parser("profile", help="按一天中的小时汇总（日变化曲线）")
+    corr_parser = subparsers.add_parser("corr", help="字段之间的皮尔逊相关系数")
+    corr_parser.add_argument("--x", default=",".join(TRAFFIC_FIELDS), help="逗号分隔的字段列表")
+    corr_parser.add_argument("--y", default=",".join(ENV_FIELDS), help="逗号分隔的字段列表")
+    for sub_parser in (summary_parser, profile_parser, corr_parser):
+        sub_parser.add_argument("data_dir", help="数据目录，例如 env-data")
+        sub_parser.add_argument("--start", help="开始时间（本地时间），例如 2024-05-01 00:00:00")
+        sub_parser.add_argument("--end", help="结束时间（不包含）")
+        sub_parser.add_argument("--devices", help="逗号分隔的站点列表，默认全部")
+        sub_parser.add_argument("--workers", type=int, help="并行进程数，默认为 CPU 核数")
+        sub_parser.add_argument("-o", "--output", help="结果写入 CSV 文件，默认输出到标准输出")
+    summary_parser.add_argument("--fields", help="逗号分隔的字段列表，默认全部")
+    profile_parser.add_argument("--fields", help="逗号分隔的字段列表，默认全部")
+    args = parser.parse_args()
+
+    correlate = None
+    fields = args.fields.split(",") if getattr(args, "fields", None) else SENSOR_FIELDS
+    if args.command == "corr":
+        x_fields, y_fields = args.x.split(","), args.y.split(",")
+        correlate = fields = tuple(dict.fromkeys(x_fields + y_fields))
+    unknown = [name for name in fields if name not in SENSOR_FIELDS]
+    if unknown:
+        parser.error("未知字段: %s" % ", ".join(unknown))
+    started = time.perf_counter()
+    result = analyze(args.data_dir, fields, getattr(args, "group_by", "day"), correlate, args.start, args.end,
+                     args.devices.split(",") if args.devices else None, args.workers)
+    elapsed = time.perf_counter() - started
+    if args.command == "summary":
+        write_table(*result.aggregates(), args.output)
+    elif args.command == "profile":
+        write_table(*result.hourly_profile(), args.output)
+    else:
+        write_table(*result.correlations(x_fields, y_fields), args.output)
+    print("扫描 %d 个文件 %d 行，耗时 %.2f 秒" % (result.files, result.rows, elapsed), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
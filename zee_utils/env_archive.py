@@ -0,0 +1,357 @@
+import argparse
+import atexit
+import csv
+import json
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+from .metrics import METRICS, stage_timer
+from .sensor_fields import SENSOR_FIELDS
+from .sensor_sample import ns_to_timestamp, record_timestamp_ns, record_values, timestamp_to_ns
+
+TIMESTAMP_FILE = "timestamp.i64"
+INDEX_FILE = "index.i64"
+META_FILE = "fields.json"
+
+_FLUSH_SECONDS = stage_timer("archive_flush")
+_ROWS_WRITTEN = METRICS.counter("env_rows_written_total", "写入存储的行数", sink="archive")
+_WRITE_ERRORS = METRICS.counter("env_write_errors_total", "写盘失败次数（失败的样本留在队列中重试）", sink="archive")
+
+
+# 只追加的二进制列式归档，与 JSONtoCSV 并列的另一种存储方式
+# 每天一个分段目录，每列一个定长文件（时间戳 int64 纳秒，传感器字段 float32），可以直接 memmap；
+# index.i64 是稀疏时间索引，每 block_rows 行记录一次 (时间戳, 行号)，
+# 按时间范围查询时只读取涉及到的块，不需要解析任何文本
+# 写入方式与 JSONtoCSV 相同：add_data 只入队，后台线程按 flush_interval 批量追加
+# 写盘失败（比如磁盘满）时没有写完的样本放回队列，分段截回失败之前，写入线程退避后重试
+class EnvArchive:
+    def __init__(self, archive_dir, fields=SENSOR_FIELDS, block_rows=1024, flush_interval=1.0):
+        self.archive_dir = archive_dir
+        self.fields = tuple(fields)
+        self.block_rows = block_rows
+        self.flush_interval = flush_interval
+        self.queue = deque()
+        self._segment = None
+        self._segment_rows = 0
+        self._unsynced = set()  # 上次 sync 之后写过的分段
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._closed = False
+        METRICS.gauge("env_queue_depth", "等待写盘的样本数", fn=self.queue.__len__, queue=archive_dir)
+        atexit.register(self.close)
+
+    def add_data(self, json_data):
+        self.queue.append(json_data)
+        if self._thread is None and not self._closed:
+            self._start()
+
+    def _start(self):
+        with self._write_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="EnvArchive", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        delay = self.flush_interval
+        while not self._stop_event.wait(delay):
+            try:
+                self.flush()
+                delay = self.flush_interval
+            except OSError as e:
+                delay = min(max(delay, 0.1) * 2, 60)
+                print("写入 %s 失败，%.1f 秒后重试:" % (self.archive_dir, delay), e)
+
+    def _open_segment(self, segment):
+        path = os.path.join(self.archive_dir, segment)
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                if tuple(json.load(f)['fields']) != self.fields:
+                    raise ValueError("归档分段 %s 的字段与当前配置不一致" % path)
+        else:
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'fields': list(self.fields), 'block_rows': self.block_rows}, f)
+        self._segment = segment
+        self._segment_rows = self._repair(path)
+
+    # 上次写入中途崩溃时各列长度可能不一致，截断到最短的列再继续追加
+    def _repair(self, path):
+        rows = _segment_rows(path)
+        for name in self.fields:
+            column_path = os.path.join(path, name + ".f32")
+            if os.path.exists(column_path):
+                rows = min(rows, os.path.getsize(column_path) // 4)
+            else:
+                rows = 0
+        _truncate_segment(path, self.fields, rows)
+        return rows
+
+    # 把队列中的样本按天分段追加到各列文件
+    def flush(self):
+        with self._write_lock:
+            if not self.queue:
+                return
+            started = time.perf_counter()
+            records = []
+            while self.queue:
+                records.append(self.queue.popleft())
+            timestamps = np.asarray([record_timestamp_ns(json_data) for json_data in records], dtype=np.int64)
+            # 样本的数值数组直接转换，字典记录中的 None 转为 NaN
+            columns = np.asarray([record_values(json_data, self.fields) for json_data in records],
+                                 dtype=np.float32).reshape(len(records), len(self.fields))
+            written = np.zeros(len(records), dtype=bool)
+            try:
+                self._write_columns(timestamps, columns, written)
+            except OSError:
+                _WRITE_ERRORS.inc()
+                self.queue.extendleft(reversed([json_data for json_data, done in zip(records, written) if not done]))
+                raise
+            _ROWS_WRITTEN.inc(len(timestamps))
+            _FLUSH_SECONDS.observe(time.perf_counter() - started)
+
+    # 直接追加已经按列排好的数据（时间戳升序，columns 形状为 行数 × 字段数），离线重建时使用
+    def write_columns(self, timestamps, columns):
+        with self._write_lock:
+            self._write_columns(np.asarray(timestamps, dtype=np.int64),
+                                np.asarray(columns, dtype=np.float32).reshape(len(timestamps), len(self.fields)))
+
+    # written 不为 None 时标记已经写入的行，失败时只有其余的行需要重试
+    def _write_columns(self, timestamps, columns, written=None):
+        if len(timestamps) == 0:
+            return
+        segments = [datetime.fromtimestamp(ts // 1000000000).strftime("%Y-%m-%d") for ts in timestamps[[0, -1]]]
+        if segments[0] == segments[1]:
+            self._append(segments[0], timestamps, columns)
+            if written is not None:
+                written[:] = True
+            return
+        # 跨天的批次逐行拆分
+        names = np.array([datetime.fromtimestamp(ts // 1000000000).strftime("%Y-%m-%d") for ts in timestamps])
+        for segment in dict.fromkeys(names):
+            mask = names == segment
+            self._append(segment, timestamps[mask], columns[mask])
+            if written is not None:
+                written[mask] = True
+
+    def _append(self, segment, timestamps, columns):
+        if segment != self._segment:
+            self._open_segment(segment)
+        path = os.path.join(self.archive_dir, segment)
+        first_row = self._segment_rows
+        try:
+            # 先写数据列，最后写时间戳列；中途崩溃时以最短的列为准
+            for i, name in enumerate(self.fields):
+                with open(os.path.join(path, name + ".f32"), 'ab') as f:
+                    f.write(np.ascontiguousarray(columns[:, i]).tobytes())
+            rows = np.arange(first_row, first_row + len(timestamps))
+            marks = rows % self.block_rows == 0
+            if marks.any():
+                index = np.column_stack([timestamps[marks], rows[marks]]).astype(np.int64)
+                with open(os.path.join(path, INDEX_FILE), 'ab') as f:
+                    f.write(index.tobytes())
+            with open(os.path.join(path, TIMESTAMP_FILE), 'ab') as f:
+                f.write(timestamps.tobytes())
+        except OSError:
+            # 部分列已经追加：各列截回这一批之前，下次写入时重新打开分段并检查一遍
+            self._segment = None
+            try:
+                _truncate_segment(path, self.fields, first_row)
+            except OSError:
+                pass
+            raise
+        self._segment_rows += len(timestamps)
+        self._unsynced.add(segment)
+
+    # 写完队列并 fsync 写过的各列文件，写前日志做检查点时调用
+    def sync(self):
+        self.flush()
+        with self._write_lock:
+            for segment in self._unsynced:
+                path = os.path.join(self.archive_dir, segment)
+                for name in os.listdir(path):
+                    fd = os.open(os.path.join(path, name), os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+            self._unsynced.clear()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+        METRICS.unregister("env_queue_depth", queue=self.archive_dir)
+        atexit.unregister(self.close)
+
+
+def _segment_rows(path):
+    ts_path = os.path.join(path, TIMESTAMP_FILE)
+    if not os.path.exists(ts_path):
+        return 0
+    return os.path.getsize(ts_path) // 8
+
+
+# 把分段的各列文件和稀疏索引截断到前 rows 行
+def _truncate_segment(path, fields, rows):
+    for name in fields:
+        column_path = os.path.join(path, name + ".f32")
+        if os.path.exists(column_path) and os.path.getsize(column_path) != rows * 4:
+            os.truncate(column_path, rows * 4)
+    ts_path = os.path.join(path, TIMESTAMP_FILE)
+    if os.path.exists(ts_path) and os.path.getsize(ts_path) != rows * 8:
+        os.truncate(ts_path, rows * 8)
+    index_path = os.path.join(path, INDEX_FILE)
+    if os.path.exists(index_path):
+        index = np.fromfile(index_path, dtype=np.int64)
+        index = index[:len(index) // 2 * 2].reshape(-1, 2)
+        keep = int(np.searchsorted(index[:, 1], rows, side='left'))
+        if keep != len(index) or os.path.getsize(index_path) != keep * 16:
+            os.truncate(index_path, keep * 16)
+
+
+# 归档当前写到的位置：(最后一个分段, 其中的行数)，没有数据时为 (None, 0)
+def archive_position(archive_dir):
+    segments = EnvArchiveReader(archive_dir).segments()
+    if not segments:
+        return None, 0
+    return segments[-1], _segment_rows(os.path.join(archive_dir, segments[-1]))
+
+
+# 把归档退回到 archive_position 返回的位置：删除之后的分段，截断最后一个分段，写入方还没有打开分段时调用
+def truncate_archive(archive_dir, segment, rows):
+    reader = EnvArchiveReader(archive_dir)
+    for existing in reader.segments():
+        if segment is None or existing > segment:
+            shutil.rmtree(os.path.join(archive_dir, existing))
+        elif existing == segment:
+            _truncate_segment(os.path.join(archive_dir, existing), reader.fields(existing), rows)
+
+
+# 归档读取：按时间范围查询，只 memmap 涉及到的分段和块
+class EnvArchiveReader:
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+
+    def segments(self):
+        if not os.path.isdir(self.archive_dir):
+            return []
+        return sorted(name for name in os.listdir(self.archive_dir)
+                      if os.path.exists(os.path.join(self.archive_dir, name, META_FILE)))
+
+    def fields(self, segment):
+        with open(os.path.join(self.archive_dir, segment, META_FILE), encoding='utf-8') as f:
+            return tuple(json.load(f)['fields'])
+
+    # 分段中第一行和最后一行的时间戳，空分段返回 None
+    def time_range(self, segment):
+        rows = _segment_rows(os.path.join(self.archive_dir, segment))
+        if rows == 0:
+            return None
+        timestamps = np.memmap(os.path.join(self.archive_dir, segment, TIMESTAMP_FILE), dtype=np.int64, mode='r',
+                               shape=(rows,))
+        return int(timestamps[0]), int(timestamps[-1])
+
+    # 返回 (时间戳数组, {字段: 数组})，时间范围为 [start_ns, end_ns)
+    def query(self, start_ns=None, end_ns=None, fields=None):
+        timestamps = []
+        columns = {}
+        for segment in self.segments():
+            result = self._query_segment(segment, start_ns, end_ns, fields)
+            if result is None:
+                continue
+            timestamps.append(result[0])
+            for name, values in result[1].items():
+                columns.setdefault(name, []).append(values)
+        if not timestamps:
+            return np.empty(0, dtype=np.int64), {name: np.empty(0, dtype=np.float32) for name in (fields or ())}
+        return np.concatenate(timestamps), {name: np.concatenate(parts) for name, parts in columns.items()}
+
+    def _query_segment(self, segment, start_ns, end_ns, fields):
+        path = os.path.join(self.archive_dir, segment)
+        segment_fields = self.fields(segment)
+        fields = segment_fields if fields is None else fields
+        row_count = _segment_rows(path)
+        for name in segment_fields:
+            row_count = min(row_count, os.path.getsize(os.path.join(path, name + ".f32")) // 4)
+        if row_count == 0:
+            return None
+        timestamps = np.memmap(os.path.join(path, TIMESTAMP_FILE), dtype=np.int64, mode='r', shape=(row_count,))
+        lo, hi = 0, row_count
+        index_path = os.path.join(path, INDEX_FILE)
+        if os.path.exists(index_path) and os.path.getsize(index_path) >= 16:
+            index = np.fromfile(index_path, dtype=np.int64).reshape(-1, 2)
+            # 先在稀疏索引上定位块，再在块内二分
+            if start_ns is not None:
+                block = max(int(np.searchsorted(index[:, 0], start_ns, side='right')) - 1, 0)
+                lo = int(index[block, 1])
+            if end_ns is not None:
+                block = int(np.searchsorted(index[:, 0], end_ns, side='left'))
+                if block < len(index):
+                    hi = min(int(index[block, 1]) + 1, row_count)
+        if start_ns is not None:
+            lo += int(np.searchsorted(timestamps[lo:hi], start_ns, side='left'))
+        if end_ns is not None:
+            hi = lo + int(np.searchsorted(timestamps[lo:hi], end_ns, side='left'))
+        if hi <= lo:
+            return None
+        columns = {}
+        for name in fields:
+            if name not in segment_fields:
+                columns[name] = np.full(hi - lo, np.nan, dtype=np.float32)
+                continue
+            column = np.memmap(os.path.join(path, name + ".f32"), dtype=np.float32, mode='r', shape=(row_count,))
+            columns[name] = np.array(column[lo:hi])
+        return np.array(timestamps[lo:hi]), columns
+
+
+# 归档转 CSV，表头与 JSONtoCSV 一致（字段在前，timestamp 在最后）
+def export_csv(archive_dir, csv_filename, start_ns=None, end_ns=None, fields=None):
+    timestamps, columns = EnvArchiveReader(archive_dir).query(start_ns, end_ns, fields)
+    names = list(columns.keys())
+    parent_directory = os.path.dirname(csv_filename)
+    if parent_directory:
+        os.makedirs(parent_directory, exist_ok=True)
+    with open(csv_filename, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(names + ['timestamp'])
+        # float32 转字符串时取最短表示，例如 45.6 而不是 45.599998474121094
+        texts = [np.where(np.isfinite(columns[name]), columns[name].astype(str), '') for name in names]
+        stamps = [ns_to_timestamp(ts) for ts in timestamps]
+        writer.writerows(zip(*texts, stamps))
+    return len(timestamps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="环境数据二进制归档工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="导出为 CSV")
+    export_parser.add_argument("archive_dir")
+    export_parser.add_argument("csv_filename")
+    export_parser.add_argument("--start", help="开始时间，例如 2024-05-08 00:00:00")
+    export_parser.add_argument("--end", help="结束时间（不包含）")
+    export_parser.add_argument("--fields", help="逗号分隔的字段列表，默认全部")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        start_ns = timestamp_to_ns(args.start) if args.start else None
+        end_ns = timestamp_to_ns(args.end) if args.end else None
+        fields = args.fields.split(",") if args.fields else None
+        count = export_csv(args.archive_dir, args.csv_filename, start_ns, end_ns, fields)
+        print("导出 %d 行到 %s" % (count, args.csv_filename))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,222 @@
+import atexit
 import csv
-import json
-from queue import Queue
 import os
+import threading
+import time
+from collections import deque
+from datetime import date
+
+from .metrics import METRICS, stage_timer
+from .sensor_sample import SensorSample
+
+_WRITE_SECONDS = stage_timer("csv_write")
+_ROWS_WRITTEN = METRICS.counter("env_rows_written_total", "写入存储的行数", sink="csv")
+_WRITE_ERRORS = METRICS.counter("env_write_errors_total", "写盘失败次数（失败的样本留在队列中重试）", sink="csv")
+
+
+# 续写已有文件前截掉没有写完的最后一行（崩溃或断电时写到一半），否则下一行会接在它后面错位
+def _repair_tail(path):
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return
+    if size == 0:
+        return
+    with open(path, 'rb+') as f:
+        f.seek(max(size - 65536, 0))
+        tail = f.read()
+        if tail.endswith(b"\n"):
+            return
+        end = tail.rfind(b"\n")
+        f.truncate(0 if end < 0 else size - len(tail) + end + 1)
+
+
+# 文件末尾最多 max_rows 行的 timestamp 列，从文件尾部读取，不解析整个文件
+def tail_timestamps(path, max_rows, max_row_bytes=1024):
+    with open(path, newline='') as f:
+        header = next(csv.reader(f), None)
+    if not header or 'timestamp' not in header:
+        return []
+    column = header.index('timestamp')
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        start = max(size - max_rows * max_row_bytes, 0)
+        f.seek(start)
+        lines = f.read().decode('utf-8', 'replace').splitlines()
+    # 第一行是表头，或者只读到了一半
+    rows = csv.reader(lines[1:])
+    return [row[column] for row in rows if len(row) == len(header)][-max_rows:]
+
+
+# CSV 写入线程：采集线程只把样本放进 deque（append/popleft 是线程安全的，不需要加锁），
+# 写入线程按 flush_interval 批量写盘，文件一直保持打开并使用大缓冲区
+# 文件超过 max_bytes 或跨天时滚动到新文件：env_data_<时间>.csv -> env_data_<时间>.1.csv -> ...
+# close() 会写完队列中剩余的样本，程序退出时也会自动调用
+# header 为固定表头，None 时取新文件第一行的键；续写已有文件时沿用它的表头
+# 写盘失败（比如磁盘满）时样本放回队列，写入线程继续运行，下一个周期重试
 class JSONtoCSV:
-    def __init__(self, csv_filename):
+    def __init__(self, csv_filename, flush_interval=1.0, max_bytes=64 * 1024 * 1024,
+                 rotate_daily=True, buffer_size=1024 * 1024, header=None):
         self.csv_filename = csv_filename
-        self.queue = Queue(maxsize=10)
+        self.fixed_header = None if header is None else list(header)
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.buffer_size = buffer_size
+        self.queue = deque()
+        self.current_filename = None
+        self.part = 0
+        self.header = None
+        self._file = None
+        self._writer = None
+        self._file_date = None
+        self._write_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._closed = False
+        METRICS.gauge("env_queue_depth", "等待写盘的样本数", fn=self.queue.__len__, queue=csv_filename)
+        atexit.register(self.close)
 
     def add_data(self, json_data):
-        self.queue.put(json_data)
-        if self.queue.full():
-            self.write_to_csv()
+        self.queue.append(json_data)
+        if self._thread is None and not self._closed:
+            self._start()
 
-    def write_to_csv(self):
+    def _start(self):
+        with self._write_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="JSONtoCSV", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.write_to_csv()
+            except OSError as e:
+                print("写入 %s 失败，稍后重试:" % self.csv_filename, e)
+
+    def _next_filename(self):
+        if self.part == 0:
+            return self.csv_filename
+        root, ext = os.path.splitext(self.csv_filename)
+        return "%s.%d%s" % (root, self.part, ext)
+
+    def _open(self):
+        self.current_filename = self._next_filename()
+        self.part += 1
         # 创建父目录（如果不存在）
-        parent_directory = os.path.dirname(self.csv_filename)
-        if not os.path.exists(parent_directory):
-            os.makedirs(parent_directory)
-        with open(self.csv_filename, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            if csvfile.tell() == 0:  # Check if file is empty
-                # Write the header row
-                header = list(self.queue.queue[0].keys())
-                writer.writerow(header)
-
-            while not self.queue.empty():
-                json_data = self.queue.get()
-                values = [float(value) if isinstance(value, str) and value.replace('.', '', 1).isdigit() else value
-                          for value in json_data.values()]
-                writer.writerow(values)
+        parent_directory = os.path.dirname(self.current_filename)
+        if parent_directory:
+            os.makedirs(parent_directory, exist_ok=True)
+        _repair_tail(self.current_filename)
+        self._file = open(self.current_filename, 'a', newline='', buffering=self.buffer_size)
+        self._writer = csv.writer(self._file)
+        self._file_date = date.today()
+        self.header = None
+        if self._file.tell() != 0:
+            # 续写已有文件时沿用它的表头
+            with open(self.current_filename, newline='') as f:
+                self.header = next(csv.reader(f), None)
+
+    # 写入失败后丢弃打开的文件，截回失败这一批之前的大小，下次重新打开同一个文件续写
+    def _abandon_file(self, size):
+        file, filename = self._file, self.current_filename
+        self._file = None
+        self._writer = None
+        if file is None:
+            return
+        self.part -= 1
+        try:
+            file.close()
+        except OSError:
+            pass
+        if size is not None:
+            try:
+                os.truncate(filename, size)
+            except OSError:
+                pass
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+            self._writer = None
+
+    def _should_rotate(self):
+        if self._file is None:
+            return False
+        if self.rotate_daily and date.today() != self._file_date:
+            return True
+        return self.max_bytes is not None and self._file.tell() >= self.max_bytes
+
+    # 把队列中的样本全部写入文件，写入线程定时调用，也可以手动调用强制落盘
+    def write_to_csv(self):
+        with self._write_lock:
+            if not self.queue:
+                return
+            started = time.perf_counter()
+            rows = []
+            while self.queue:
+                rows.append(self.queue.popleft())
+            start = 0
+            written_size = None  # 已经写入的批次之后文件的大小
+            try:
+                if self._should_rotate():
+                    self._close_file()
+                if self._file is None:
+                    self._open()
+                while start < len(rows):
+                    # 每批最多写 1000 行再检查一次是否需要滚动
+                    if start and self._should_rotate():
+                        self._close_file()
+                        self._open()
+                    written_size = self._file.tell()
+                    if self.header is None:
+                        # Write the header row
+                        self.header = self.fixed_header or list(rows[start].keys())
+                        self._writer.writerow(self.header)
+                    batch = rows[start:start + 1000]
+                    self._writer.writerows(self._format_row(json_data) for json_data in batch)
+                    self._file.flush()
+                    start += len(batch)
+            except OSError:
+                # 没有写完的样本放回队列前面；文件截回这一批之前，不留半行也不重复
+                _WRITE_ERRORS.inc()
+                self.queue.extendleft(reversed(rows[start:]))
+                self._abandon_file(written_size)
+                raise
+            _ROWS_WRITTEN.inc(len(rows))
+            _WRITE_SECONDS.observe(time.perf_counter() - started)
+
+    # 样本的列与表头一致时直接导出整行，时间戳在这里才格式化
+    def _format_row(self, json_data):
+        if isinstance(json_data, SensorSample) and json_data.keys() == self.header:
+            return json_data.row()
+        values = []
+        for key in self.header:
+            value = json_data.get(key)
+            values.append('' if value is None else value)
+        return values
+
+    # 写完队列并 fsync，写前日志做检查点时调用
+    def sync(self):
+        self.write_to_csv()
+        with self._write_lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
 
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.write_to_csv()
+        with self._write_lock:
+            self._close_file()
+        METRICS.unregister("env_queue_depth", queue=self.csv_filename)
+        atexit.unregister(self.close)
@@ -0,0 +1,119 @@
+import numpy as np
+
+from .decimation import MinMaxDecimator
+from .sensor_fields import SENSOR_FIELDS, parse_sensor
+from .sensor_sample import record_values
+
+
+# 预分配的列式环形缓冲区：每个传感器字段一列，外加一列时间戳（纳秒）
+# 每个样本同时写入位置 i 和 i + capacity（镜像），
+# 因此任意长度不超过 capacity 的最近窗口都是一段连续内存，可以零拷贝返回视图
+# 只允许一个线程写入，读取方拿到的视图在被覆盖前始终有效
+class EnvRingBuffer:
+    def __init__(self, capacity, fields=SENSOR_FIELDS, dtype=np.float32):
+        self.capacity = capacity
+        self.fields = tuple(fields)
+        self.field_index = {name: i for i, name in enumerate(self.fields)}
+        self._data = np.full((len(self.fields), 2 * capacity), np.nan, dtype=dtype)
+        self._timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        # 写入的样本总数，同时作为数据版本号
+        self._count = 0
+        self.decimator = MinMaxDecimator(self)
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def total(self):
+        return self._count
+
+    @property
+    def version(self):
+        return self._count
+
+    # values 按 fields 的顺序排列，O(1)
+    def append(self, values, timestamp_ns):
+        pos = self._count % self.capacity
+        self._data[:, pos] = values
+        self._data[:, pos + self.capacity] = values
+        self._timestamps[pos] = timestamp_ns
+        self._timestamps[pos + self.capacity] = timestamp_ns
+        self._count += 1
+
+    # 追加一个 SensorSample（字段顺序相同时直接使用其数值数组）或字典记录，缺失的字段记为 NaN
+    def append_record(self, record, timestamp_ns):
+        self.append(record_values(record, self.fields), timestamp_ns)
+
+    # 绝对序号 [start, end) 对应的镜像区间
+    def _slice(self, start, end):
+        oldest = self._count - len(self)
+        start = max(start, oldest)
+        end = min(end, self._count)
+        if end <= start:
+            return slice(0, 0)
+        end_pos = (end - 1) % self.capacity + 1 + self.capacity
+        return slice(end_pos - (end - start), end_pos)
+
+    def _last(self, n):
+        n = len(self) if n is None else min(n, len(self))
+        return self._slice(self._count - n, self._count)
+
+    # 最近 n 个样本的只读视图
+    def window(self, field, n=None):
+        view = self._data[self.field_index[field], self._last(n)]
+        view.flags.writeable = False
+        return view
+
+    def timestamps(self, n=None):
+        view = self._timestamps[self._last(n)]
+        view.flags.writeable = False
+        return view
+
+    # 所有字段最近 n 个样本，形状 (字段数, n)
+    def columns(self, n=None):
+        view = self._data[:, self._last(n)]
+        view.flags.writeable = False
+        return view
+
+    # 按绝对序号取区间，超出保留范围的部分会被截掉
+    def range(self, field, start, end):
+        view = self._data[self.field_index[field], self._slice(start, end)]
+        view.flags.writeable = False
+        return view
+
+    # 时间戳不早于 since_ns 的样本个数，可以配合 window 取时间窗口
+    def count_since(self, since_ns):
+        timestamps = self.timestamps()
+        return len(timestamps) - int(np.searchsorted(timestamps, since_ns, side='left'))
+
+    # 最新一个样本还原成 SensorSample，float32 取最短表示（45.6 而不是 45.599998），没有样本时返回 None
+    def latest_sample(self):
+        if len(self) == 0:
+            return None
+        last = self._last(1)
+        texts = self._data[:, last][:, 0].astype(str)
+        return parse_sensor(dict(zip(self.fields, texts)), int(self._timestamps[last][0]))
+
+    def channel(self, field):
+        return EnvChannel(self, field)
+
+
+# 单个字段的只读通道，给图表线程使用
+class EnvChannel:
+    def __init__(self, ring_buffer, field):
+        self.ring_buffer = ring_buffer
+        self.field = field
+
+    @property
+    def version(self):
+        return self.ring_buffer.version
+
+    def get_data(self, n=None):
+        return self.ring_buffer.window(self.field, n)
+
+    def get_data_list(self, n=None):
+        return self.get_data(n).tolist()
+
+    # 抽稀到大约 width 个点，返回 (x, y)；end 为窗口结束处的绝对序号，默认最新
+    def get_decimated(self, n, width, end=None):
+        return self.ring_buffer.decimator.decimate(self.field, n, width, end)
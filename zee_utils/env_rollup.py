@@ -0,0 +1,578 @@
+import argparse
+import csv
+import glob
+import os
+import shutil
+import threading
+import time
+import traceback
+from array import array
+
+import numpy as np
+
+from .env_analytics import read_data_csv
+from .env_archive import EnvArchive, EnvArchiveReader, archive_position, truncate_archive
+from .metrics import METRICS, stage_timer
+from .sample_journal import JOURNAL_DIR
+from .sensor_fields import SENSOR_FIELDS, SensorField
+from .sensor_sample import SampleLayout, SensorSample, ns_to_timestamp, record_values, timestamp_to_ns
+
+# 聚合层级（名称, 桶宽秒数），由细到粗，每一层由下一层关闭的桶合并而来
+ROLLUP_TIERS = (("1m", 60), ("1h", 3600), ("1d", 86400))
+ROLLUP_STATS = ("min", "max", "mean", "count")
+ROLLUP_DIR = "rollup"
+# 启用写前日志时每次检查点保存的未关闭桶和各层归档的位置，正常退出时删除
+OPEN_BUCKETS_FILE = "open_buckets.npz"
+# 原始数据：DeviceRecorder 写入的归档目录、统计快照归档和 CSV 文件（第一种是原始样本）
+RAW_ARCHIVE_DIRS = ("archive", "stats-archive")
+RAW_CSV_PATTERNS = ("env_data_*.csv", "env_stats_*.csv")
+
+_RETENTION_SECONDS = stage_timer("retention")
+_REMOVED = METRICS.counter("env_retention_removed_total", "超过保留期后删除的原始数据分段和文件数")
+
+
+# 聚合列：每个字段依次为 <字段>_min、_max、_mean、_count
+def rollup_fields(fields=SENSOR_FIELDS):
+    return tuple("%s_%s" % (name, stat) for name in fields for stat in ROLLUP_STATS)
+
+
+def rollup_schema(fields=SENSOR_FIELDS):
+    return tuple(SensorField("%s_%s" % (name, stat), int if stat == "count" else float, "", "%s_%s" % (name, stat))
+                 for name in fields for stat in ROLLUP_STATS)
+
+
+# 时间戳所在桶的起点（纳秒），按本地时间对齐，1d 的桶从本地零点开始
+def bucket_start_ns(timestamp_ns, seconds):
+    second = int(timestamp_ns) // 1000000000
+    offset = time.localtime(second).tm_gmtoff
+    return ((second + offset) // seconds * seconds - offset) * 1000000000
+
+
+# bucket_start_ns 的数组版本，本地时间偏移按小时查一次
+def bucket_starts_ns(timestamps, seconds):
+    seconds_array = np.asarray(timestamps, dtype=np.int64) // 1000000000
+    hours, inverse = np.unique(seconds_array // 3600, return_inverse=True)
+    offsets = np.array([time.localtime(int(hour) * 3600).tm_gmtoff for hour in hours], dtype=np.int64)[inverse]
+    return ((seconds_array + offsets) // seconds * seconds - offsets) * 1000000000
+
+
+# count/sum/min/max 转成按 ROLLUP_STATS 排列的行，没有样本的字段 min/max/mean 为 NaN
+def _stats_rows(count, total, low, high):
+    empty = count == 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(empty, np.nan, total / count)
+    stats = np.stack([np.where(empty, np.nan, low), np.where(empty, np.nan, high), mean, count], axis=-1)
+    return stats.reshape(count.shape[:-1] + (-1,))
+
+
+# _stats_rows 的逆变换：聚合行 -> (count, sum, min, max)，用于合并
+def _split_rows(rows):
+    stats = np.asarray(rows, dtype=np.float64).reshape(np.shape(rows)[:-1] + (-1, len(ROLLUP_STATS)))
+    count = np.nan_to_num(stats[..., 3])
+    present = count > 0
+    total = np.where(present, stats[..., 2] * count, 0.0)
+    low = np.where(present, stats[..., 0], np.inf)
+    high = np.where(present, stats[..., 1], -np.inf)
+    return count, total, low, high
+
+
+# CSV 中的本地时间（datetime64，没有时区）转成纳秒时间戳，时区偏移按小时查一次
+def local_datetimes_to_ns(datetimes):
+    datetimes = np.asarray(datetimes, dtype="datetime64[us]")
+    hours, inverse = np.unique(datetimes.astype("datetime64[h]"), return_inverse=True)
+    hour_ns = np.array([int(time.mktime(hour.astype(object).timetuple())) * 1000000000 for hour in hours],
+                       dtype=np.int64)[inverse]
+    return hour_ns + (datetimes - datetimes.astype("datetime64[h]")).astype(np.int64) * 1000
+
+
+# 聚合行合并到更粗的桶：starts 升序，rows 为 行数 × 聚合列，返回 (粗桶起点, 聚合行)
+def coarsen_rows(starts, rows, seconds):
+    coarse = bucket_starts_ns(starts, seconds)
+    edges = np.flatnonzero(np.concatenate(([True], coarse[1:] != coarse[:-1])))
+    count, total, low, high = _split_rows(rows)
+    return coarse[edges], _stats_rows(np.add.reduceat(count, edges, axis=0), np.add.reduceat(total, edges, axis=0),
+                                      np.minimum.reduceat(low, edges, axis=0),
+                                      np.maximum.reduceat(high, edges, axis=0))
+
+
+# 按桶分组一次算出所有聚合行：timestamps 升序，values 形状为 行数 × 字段数，缺失值为 NaN
+# 返回 (桶起点数组, 聚合行)，用于从原始数据重建
+def rollup_columns(timestamps, values, seconds):
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=np.int64), np.empty((0, values.shape[1] * len(ROLLUP_STATS)))
+    starts = bucket_starts_ns(timestamps, seconds)
+    edges = np.flatnonzero(np.concatenate(([True], starts[1:] != starts[:-1])))
+    values = np.asarray(values, dtype=np.float64)
+    finite = ~np.isnan(values)
+    count = np.add.reduceat(finite.astype(np.float64), edges, axis=0)
+    total = np.add.reduceat(np.where(finite, values, 0.0), edges, axis=0)
+    low = np.fmin.reduceat(np.where(finite, values, np.inf), edges, axis=0)
+    high = np.fmax.reduceat(np.where(finite, values, -np.inf), edges, axis=0)
+    return starts[edges], _stats_rows(count, total, low, high)
+
+
+# 同一时间戳有多行时（重启前后写出的同一分钟）合并成一行，rows 为 行数 × 聚合列
+def _merge_duplicates(timestamps, rows):
+    if len(timestamps) < 2:
+        return timestamps, rows
+    edges = np.flatnonzero(np.concatenate(([True], timestamps[1:] != timestamps[:-1])))
+    if len(edges) == len(timestamps):
+        return timestamps, rows
+    count, total, low, high = _split_rows(rows)
+    return timestamps[edges], _stats_rows(np.add.reduceat(count, edges, axis=0),
+                                          np.add.reduceat(total, edges, axis=0),
+                                          np.minimum.reduceat(low, edges, axis=0),
+                                          np.maximum.reduceat(high, edges, axis=0))
+
+
+# 一个未关闭的桶中各字段的 count/sum/min/max，可以逐个样本加入，也可以合并下一层的桶
+class _Bucket:
+    def __init__(self, width):
+        self.count = np.zeros(width)
+        self.total = np.zeros(width)
+        self.low = np.full(width, np.inf)
+        self.high = np.full(width, -np.inf)
+        self.start_ns = None
+        self.end_ns = None
+
+    def clear(self):
+        self.count.fill(0)
+        self.total.fill(0)
+        self.low.fill(np.inf)
+        self.high.fill(-np.inf)
+
+    def add(self, values):
+        finite = ~np.isnan(values)
+        self.count += finite
+        self.total += np.where(finite, values, 0.0)
+        np.fmin(self.low, values, out=self.low)
+        np.fmax(self.high, values, out=self.high)
+
+    def merge(self, count, total, low, high):
+        self.count += count
+        self.total += total
+        np.minimum(self.low, low, out=self.low)
+        np.maximum(self.high, high, out=self.high)
+
+    def row(self):
+        return _stats_rows(self.count, self.total, self.low, self.high)
+
+
+# 增量聚合：每个样本只加入最细一层的当前桶，每个样本的开销是常数；
+# 桶关闭时写出一行并合并进上一层的当前桶，1h、1d 不需要重新扫描原始数据
+# 每层写入 rollup_dir/<层级>/ 下的一个 EnvArchive，时间戳为桶的起点
+# 启动时从已写入的下层数据恢复上层未关闭的桶；close() 会写出未满的最细一层的桶，
+# 因此重启前后同一分钟可能有两行，RollupReader 读取时会合并
+# 启用写前日志时 checkpoint() 把未关闭的桶和各层归档的位置保存到 OPEN_BUCKETS_FILE，
+# 异常退出后从中恢复：归档退回到保存时的位置，last_ns 之后的样本由日志回放补上
+class RollupEngine:
+    def __init__(self, rollup_dir, fields=SENSOR_FIELDS, tiers=ROLLUP_TIERS, flush_interval=1.0):
+        self.rollup_dir = rollup_dir
+        self.fields = tuple(fields)
+        self.tiers = tuple(tiers)
+        self.columns = rollup_fields(self.fields)
+        self.layout = SampleLayout(rollup_schema(self.fields))
+        self.buckets = [_Bucket(len(self.fields)) for _ in self.tiers]
+        self.archives = [EnvArchive(os.path.join(rollup_dir, name), fields=self.columns, flush_interval=flush_interval)
+                         for name, _ in self.tiers]
+        self.lock = threading.Lock()
+        self.last_ns = None  # 已经计入聚合的最后一个样本的时间戳
+        if not self._restore():
+            self._recover()
+
+    # 上层未关闭的桶 = 下层已经写入、落在该桶范围内的行；各层的当前桶由最后写入的最细一层的行推出
+    def _recover(self):
+        finest = EnvArchiveReader(os.path.join(self.rollup_dir, self.tiers[0][0]))
+        segments = finest.segments()
+        time_range = finest.time_range(segments[-1]) if segments else None
+        if time_range is None:
+            return
+        # 已经写出的最细一层的桶视为完整
+        self.last_ns = bucket_start_ns(time_range[1], self.tiers[0][1]) + self.tiers[0][1] * 1000000000 - 1
+        for level in range(1, len(self.tiers)):
+            start_ns = bucket_start_ns(time_range[1], self.tiers[level][1])
+            lower = EnvArchiveReader(os.path.join(self.rollup_dir, self.tiers[level - 1][0]))
+            timestamps, columns = lower.query(start_ns, None, self.columns)
+            if len(timestamps) == 0:
+                continue
+            rows = np.column_stack([columns[name] for name in self.columns])
+            count, total, low, high = _split_rows(rows)
+            bucket = self.buckets[level]
+            self._open(level, start_ns)
+            bucket.merge(count.sum(axis=0), total.sum(axis=0), low.min(axis=0), high.max(axis=0))
+
+    # record 为 SensorSample 或字典记录
+    def update(self, record, timestamp_ns):
+        values = np.asarray(record_values(record, self.fields), dtype=np.float64)
+        with self.lock:
+            self._advance(0, timestamp_ns)
+            self.buckets[0].add(values)
+            if self.last_ns is None or timestamp_ns > self.last_ns:
+                self.last_ns = timestamp_ns
+
+    # 保存未关闭的桶：先把已经关闭的桶写入归档并记下各层归档的位置，再原子替换快照文件
+    # 写前日志做检查点时调用，之后日志中 last_ns 之前的样本可以删除
+    def checkpoint(self):
+        with self.lock:
+            positions = []
+            for archive in self.archives:
+                archive.flush()
+                positions.append(archive_position(archive.archive_dir))
+            starts = [-1 if bucket.start_ns is None else bucket.start_ns for bucket in self.buckets]
+            state = {
+                "fields": np.array(self.fields), "tiers": np.array([name for name, _ in self.tiers]),
+                "count": np.stack([bucket.count for bucket in self.buckets]),
+                "total": np.stack([bucket.total for bucket in self.buckets]),
+                "low": np.stack([bucket.low for bucket in self.buckets]),
+                "high": np.stack([bucket.high for bucket in self.buckets]),
+                "starts": np.array(starts, dtype=np.int64),
+                "segments": np.array([segment or "" for segment, _ in positions]),
+                "rows": np.array([rows for _, rows in positions], dtype=np.int64),
+                "last_ns": np.int64(-1 if self.last_ns is None else self.last_ns),
+            }
+        for archive in self.archives:
+            archive.sync()
+        os.makedirs(self.rollup_dir, exist_ok=True)
+        path = os.path.join(self.rollup_dir, OPEN_BUCKETS_FILE)
+        with open(path + ".tmp", 'wb') as f:
+            np.savez(f, **state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        fd = os.open(self.rollup_dir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    # 不再做检查点时删除快照，之后按 _recover 的方式恢复
+    def discard_checkpoint(self):
+        try:
+            os.remove(os.path.join(self.rollup_dir, OPEN_BUCKETS_FILE))
+        except FileNotFoundError:
+            pass
+
+    # 从上次检查点恢复：各层归档退回到保存时的位置（之后写出的行会在日志回放时重新生成），
+    # 再载入未关闭的桶；没有快照或字段、层级不一致时返回 False
+    def _restore(self):
+        path = os.path.join(self.rollup_dir, OPEN_BUCKETS_FILE)
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as state:
+            if tuple(state["fields"].tolist()) != self.fields or \
+                    tuple(state["tiers"].tolist()) != tuple(name for name, _ in self.tiers):
+                return False
+            for level, archive in enumerate(self.archives):
+                truncate_archive(archive.archive_dir, str(state["segments"][level]) or None,
+                                 int(state["rows"][level]))
+                bucket = self.buckets[level]
+                bucket.count[:] = state["count"][level]
+                bucket.total[:] = state["total"][level]
+                bucket.low[:] = state["low"][level]
+                bucket.high[:] = state["high"][level]
+                start_ns = int(state["starts"][level])
+                if start_ns >= 0:
+                    self._open(level, start_ns)
+            last_ns = int(state["last_ns"])
+        self.last_ns = None if last_ns < 0 else last_ns
+        return True
+
+    def _open(self, level, start_ns):
+        bucket = self.buckets[level]
+        bucket.start_ns = start_ns
+        bucket.end_ns = start_ns + self.tiers[level][1] * 1000000000
+
+    # 时间戳超出当前桶时先关闭它再开新桶；时钟回拨的样本留在当前桶
+    def _advance(self, level, timestamp_ns):
+        bucket = self.buckets[level]
+        if bucket.start_ns is not None and timestamp_ns < bucket.end_ns:
+            return
+        start_ns = bucket_start_ns(timestamp_ns, self.tiers[level][1])
+        if start_ns == bucket.start_ns:
+            # 夏令时结束当天的一天长于 86400 秒
+            return
+        if bucket.start_ns is not None:
+            self._close(level)
+        self._open(level, start_ns)
+
+    def _close(self, level):
+        bucket = self.buckets[level]
+        self._emit(level)
+        if level + 1 < len(self.tiers):
+            self._advance(level + 1, bucket.start_ns)
+            self.buckets[level + 1].merge(bucket.count, bucket.total, bucket.low, bucket.high)
+        bucket.clear()
+
+    def _emit(self, level):
+        bucket = self.buckets[level]
+        if bucket.count.any():
+            row = SensorSample(self.layout, array('d', bucket.row().tolist()), bucket.start_ns)
+            self.archives[level].add_data(row)
+
+    def close(self):
+        with self.lock:
+            if self.buckets[0].start_ns is not None:
+                self._emit(0)
+                self.buckets[0].clear()
+                self.buckets[0].start_ns = None
+        for archive in self.archives:
+            archive.close()
+        self.discard_checkpoint()
+
+
+# 读取聚合层级；data_dir 为 DeviceRecorder 的数据目录（多站点时为 data_dir/<deviceId>）
+class RollupReader:
+    def __init__(self, data_dir, tiers=ROLLUP_TIERS):
+        self.data_dir = data_dir
+        self.tiers = tuple(tiers)
+
+    def tier_names(self):
+        return [name for name, _ in self.tiers]
+
+    # 返回 (时间戳数组, {"<字段>_<统计量>": 数组})，时间范围为 [start_ns, end_ns)，按桶起点判断
+    def query(self, tier, start_ns=None, end_ns=None, fields=None, stats=ROLLUP_STATS):
+        fields = SENSOR_FIELDS if fields is None else tuple(fields)
+        columns = rollup_fields(fields)
+        reader = EnvArchiveReader(os.path.join(self.data_dir, ROLLUP_DIR, tier))
+        timestamps, result = reader.query(start_ns, end_ns, columns)
+        rows = np.column_stack([result[name] for name in columns]) if len(timestamps) else \
+            np.empty((0, len(columns)))
+        timestamps, rows = _merge_duplicates(timestamps, rows)
+        return timestamps, {name: rows[:, i].astype(np.float32) for i, name in enumerate(columns)
+                            if name.rsplit("_", 1)[1] in stats}
+
+    # 点数不超过 max_points 的最细层级，范围太长时取最粗的一层
+    def choose_tier(self, start_ns, end_ns, max_points=2000):
+        span = (end_ns - start_ns) / 1000000000
+        for name, seconds in self.tiers:
+            if span / seconds <= max_points:
+                return name
+        return self.tiers[-1][0]
+
+    # 长时间范围的曲线：范围内的原始样本（按每秒一个估算）不超过 max_points 且原始数据还在时读原始归档，
+    # 否则读点数不超过 max_points 的最细层级
+    # 返回 (层级, 时间戳, mean, min, max)，读原始数据时层级为 "raw"，三组数值相同
+    def history(self, field, start_ns, end_ns, max_points=2000):
+        if (end_ns - start_ns) / 1000000000 <= max_points:
+            raw = EnvArchiveReader(os.path.join(self.data_dir, "archive"))
+            segments = raw.segments()
+            time_range = raw.time_range(segments[0]) if segments else None
+            if time_range is not None and time_range[0] <= start_ns:
+                timestamps, columns = raw.query(start_ns, end_ns, [field])
+                return "raw", timestamps, columns[field], columns[field], columns[field]
+        tier = self.choose_tier(start_ns, end_ns, max_points)
+        timestamps, columns = self.query(tier, start_ns, end_ns, [field], ("mean", "min", "max"))
+        return tier, timestamps, columns[field + "_mean"], columns[field + "_min"], columns[field + "_max"]
+
+
+# 原始数据保留期：定期删除早于 raw_retention_days 天的原始归档日分段、统计快照和 CSV 文件，聚合层级一直保留
+# 删除归档分段前先确认最细一层覆盖了那一天；没有覆盖时（例如启用聚合之前录制的数据）
+# 先从原始数据重建那一天的各层级，再删除原始数据，中途退出时下次检查会重做
+# 删除 env_data_*.csv 前确认最细一层覆盖了其中每一分钟的样本，缺少的分钟从 CSV 补算后重写那一天的各层级
+# data_dir 和其下各站点目录分别处理，后台线程每 check_interval 秒检查一次
+class RetentionManager:
+    def __init__(self, data_dir, raw_retention_days, check_interval=3600, fields=SENSOR_FIELDS, tiers=ROLLUP_TIERS):
+        if raw_retention_days < 1:
+            raise ValueError("原始数据至少保留 1 天")
+        self.data_dir = data_dir
+        self.retention_ns = int(raw_retention_days * 86400 * 1000000000)
+        self.check_interval = check_interval
+        self.fields = tuple(fields)
+        self.tiers = tuple(tiers)
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="RetentionManager", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            # 某一轮失败（比如文件被占用、CSV 损坏）只打印出来，下一轮再试
+            try:
+                self.expire()
+            except Exception:
+                print("清理过期数据发生意外异常:")
+                traceback.print_exc()
+            if self._stop_event.wait(self.check_interval):
+                return
+
+    def close(self):
+        self._stop_event.set()
+
+    def _recorder_dirs(self):
+        if not os.path.isdir(self.data_dir):
+            return []
+        dirs = [self.data_dir]
+        for name in sorted(os.listdir(self.data_dir)):
+            path = os.path.join(self.data_dir, name)
+            if name not in RAW_ARCHIVE_DIRS and name not in (ROLLUP_DIR, JOURNAL_DIR) and os.path.isdir(path):
+                dirs.append(path)
+        return dirs
+
+    # 删除早于 now_ns - 保留期的原始数据，返回删除的分段和文件数
+    def expire(self, now_ns=None):
+        started = time.perf_counter()
+        cutoff_ns = (time.time_ns() if now_ns is None else now_ns) - self.retention_ns
+        removed = 0
+        for path in self._recorder_dirs():
+            removed += self._expire_archive(path, cutoff_ns)
+            removed += self._expire_csv(path, cutoff_ns)
+        _REMOVED.inc(removed)
+        _RETENTION_SECONDS.observe(time.perf_counter() - started)
+        return removed
+
+    def _expire_archive(self, data_dir, cutoff_ns):
+        removed = 0
+        for name in RAW_ARCHIVE_DIRS:
+            reader = EnvArchiveReader(os.path.join(data_dir, name))
+            for segment in reader.segments():
+                time_range = reader.time_range(segment)
+                # 只删除整天都早于保留期的分段
+                if time_range is not None and bucket_start_ns(time_range[1], 86400) + 86400 * 1000000000 > cutoff_ns:
+                    continue
+                if name == "archive" and time_range is not None and not self._covered(data_dir, segment, time_range):
+                    self._rebuild(data_dir, segment)
+                shutil.rmtree(os.path.join(reader.archive_dir, segment))
+                removed += 1
+        return removed
+
+    def _expire_csv(self, data_dir, cutoff_ns):
+        removed = 0
+        for pattern in RAW_CSV_PATTERNS:
+            for filename in glob.glob(os.path.join(glob.escape(data_dir), pattern)):
+                if os.path.getmtime(filename) * 1000000000 >= cutoff_ns:
+                    continue
+                if pattern == RAW_CSV_PATTERNS[0]:
+                    try:
+                        self._rollup_csv(data_dir, filename)
+                    except ValueError as e:
+                        # 无法解析时不能确认已经聚合，保留文件
+                        print("保留无法聚合的 CSV %s:" % filename, e)
+                        continue
+                os.remove(filename)
+                removed += 1
+        return removed
+
+    # 按天比较 CSV 与最细一层每一分钟的样本数：最细一层没有这一分钟或样本数更少（例如聚合中途开始或停止）时，
+    # 用 CSV 算出的行替换这一分钟，再由最细一层推出那一天的其余层级
+    def _rollup_csv(self, data_dir, filename):
+        datetimes, values, _ = read_data_csv(filename, self.fields)
+        if len(datetimes) == 0:
+            return
+        timestamps = local_datetimes_to_ns(datetimes)
+        order = np.argsort(timestamps, kind='stable')
+        timestamps, values = timestamps[order], values[order]
+        name, seconds = self.tiers[0]
+        finest = EnvArchiveReader(os.path.join(data_dir, ROLLUP_DIR, name))
+        columns = rollup_fields(self.fields)
+        days = bucket_starts_ns(timestamps, 86400)
+        for day_ns in np.unique(days):
+            day_ns = int(day_ns)
+            mask = days == day_ns
+            csv_starts, csv_rows = rollup_columns(timestamps[mask], values[mask], seconds)
+            # 下一个本地零点，夏令时切换的一天为 23 或 25 小时
+            next_day_ns = bucket_start_ns(day_ns + 26 * 3600 * 1000000000, 86400)
+            existing, result = finest.query(day_ns, next_day_ns, columns)
+            rows = np.column_stack([result[column] for column in columns]) if len(existing) else \
+                np.empty((0, len(columns)))
+            existing, rows = _merge_duplicates(existing, rows)
+            # 每一分钟的样本数取各字段 count 的最大值
+            covered = dict(zip(existing.tolist(), _split_rows(rows)[0].max(axis=1).tolist())) if len(existing) else {}
+            csv_counts = _split_rows(csv_rows)[0].max(axis=1)
+            replace = np.array([covered.get(start, 0) < count for start, count in zip(csv_starts.tolist(), csv_counts)])
+            if not replace.any():
+                continue
+            keep = ~np.isin(existing, csv_starts[replace])
+            merged = np.concatenate([existing[keep], csv_starts[replace]])
+            rows = np.concatenate([rows[keep], csv_rows[replace]])
+            order = np.argsort(merged, kind='stable')
+            tier_rows = [(merged[order], rows[order])]
+            for _, coarse_seconds in self.tiers[1:]:
+                tier_rows.append(coarsen_rows(tier_rows[-1][0], tier_rows[-1][1], coarse_seconds))
+            segment = time.strftime("%Y-%m-%d", time.localtime(day_ns // 1000000000))
+            self._replace_segments(data_dir, segment, tier_rows)
+
+    # 最细一层在同一天的分段从这一天第一个样本所在的桶开始，说明这一天的聚合是实时写入的
+    def _covered(self, data_dir, segment, time_range):
+        name, seconds = self.tiers[0]
+        finest = EnvArchiveReader(os.path.join(data_dir, ROLLUP_DIR, name))
+        if segment not in finest.segments():
+            return False
+        rollup_range = finest.time_range(segment)
+        return rollup_range is not None and rollup_range[0] <= bucket_start_ns(time_range[0], seconds)
+
+    # 从原始归档的一个日分段重建各层级在这一天的分段
+    def _rebuild(self, data_dir, segment):
+        reader = EnvArchiveReader(os.path.join(data_dir, "archive"))
+        first_ns, last_ns = reader.time_range(segment)
+        timestamps, columns = reader.query(first_ns, last_ns + 1, self.fields)
+        values = np.column_stack([columns[name] for name in self.fields])
+        self._replace_segments(data_dir, segment, [rollup_columns(timestamps, values, seconds)
+                                                   for _, seconds in self.tiers])
+
+    # 用 tier_rows（每层一组 (桶起点, 聚合行)）替换各层级的一个日分段：先写到临时目录，再替换原来的分段
+    def _replace_segments(self, data_dir, segment, tier_rows):
+        rollup_dir = os.path.join(data_dir, ROLLUP_DIR)
+        for (name, _), (starts, rows) in zip(self.tiers, tier_rows):
+            tmp_dir = os.path.join(rollup_dir, ".rebuild", name)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            archive = EnvArchive(tmp_dir, fields=rollup_fields(self.fields))
+            archive.write_columns(starts, rows)
+            archive.close()
+            target = os.path.join(rollup_dir, name, segment)
+            shutil.rmtree(target, ignore_errors=True)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            for rebuilt in os.listdir(tmp_dir):
+                os.replace(os.path.join(tmp_dir, rebuilt), os.path.join(rollup_dir, name, rebuilt))
+        shutil.rmtree(os.path.join(rollup_dir, ".rebuild"), ignore_errors=True)
+
+
+# 聚合数据转 CSV，表头为聚合列加 timestamp（桶起点）
+def export_csv(data_dir, csv_filename, tier, start_ns=None, end_ns=None, fields=None):
+    timestamps, columns = RollupReader(data_dir).query(tier, start_ns, end_ns, fields)
+    names = list(columns.keys())
+    parent_directory = os.path.dirname(csv_filename)
+    if parent_directory:
+        os.makedirs(parent_directory, exist_ok=True)
+    with open(csv_filename, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(names + ['timestamp'])
+        texts = [columns[name].astype(np.int64).astype(str) if name.endswith("_count") else
+                 np.where(np.isfinite(columns[name]), columns[name].astype(str), '') for name in names]
+        stamps = [ns_to_timestamp(ts) for ts in timestamps]
+        writer.writerows(zip(*texts, stamps))
+    return len(timestamps)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="环境数据聚合层级与保留期工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="把聚合数据导出为 CSV")
+    export_parser.add_argument("data_dir", help="站点数据目录，例如 env-data 或 env-data/<deviceId>")
+    export_parser.add_argument("csv_filename")
+    export_parser.add_argument("--tier", choices=[name for name, _ in ROLLUP_TIERS],
+                               help="聚合层级，默认按 --max-points 自动选择")
+    export_parser.add_argument("--start", required=True, help="开始时间，例如 2024-05-01 00:00:00")
+    export_parser.add_argument("--end", help="结束时间（不包含），默认当前时间")
+    export_parser.add_argument("--fields", help="逗号分隔的字段列表，默认全部")
+    export_parser.add_argument("--max-points", type=int, default=2000, help="自动选择层级时的最大行数")
+    compact_parser = subparsers.add_parser("compact", help="立即执行一次原始数据过期清理")
+    compact_parser.add_argument("data_dir")
+    compact_parser.add_argument("--raw-retention-days", type=float, required=True, help="原始数据保留天数")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        start_ns = timestamp_to_ns(args.start)
+        end_ns = timestamp_to_ns(args.end) if args.end else time.time_ns()
+        tier = args.tier or RollupReader(args.data_dir).choose_tier(start_ns, end_ns, args.max_points)
+        fields = args.fields.split(",") if args.fields else None
+        count = export_csv(args.data_dir, args.csv_filename, tier, start_ns, end_ns, fields)
+        print("导出 %s 层级 %d 行到 %s" % (tier, count, args.csv_filename))
+    elif args.command == "compact":
+        removed = RetentionManager(args.data_dir, args.raw_retention_days).expire()
+        print("删除 %d 个原始数据分段/文件" % removed)
+
+
+if __name__ == '__main__':
+    main()
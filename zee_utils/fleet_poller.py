@@ -0,0 +1,166 @@
+import heapq
+import json
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from .sampling_scheduler import SamplingScheduler
+from .sensor_fetcher import FETCH_ERRORS, ChangeDetector, count_fetch_error, fetch_sensor_data, make_session
+
+
+# 单个站点的轮询配置，overrun 为空时使用 FleetPoller 的设置
+class DeviceConfig:
+    def __init__(self, device_id, url, interval=1, timeout=5, max_backoff=60, overrun=None):
+        self.device_id = device_id
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.overrun = overrun
+
+
+# 从 JSON 文件读取站点列表，格式：
+# [{"deviceId": "MT5934453861", "url": "http://.../sensor/getAllSensor",
+#   "interval": 0.5, "timeout": 5, "maxBackoff": 60, "overrun": "skip"}, ...]
+def load_devices(path):
+    with open(path, encoding='utf-8') as f:
+        items = json.load(f)
+    devices = []
+    for item in items:
+        devices.append(DeviceConfig(
+            device_id=item['deviceId'],
+            url=item['url'],
+            interval=item.get('interval', 1),
+            timeout=item.get('timeout', 5),
+            max_backoff=item.get('maxBackoff', 60),
+            overrun=item.get('overrun'),
+        ))
+    return devices
+
+
+# 多站点并发轮询：调度线程按各站点的截止时间排队，把请求交给有界线程池执行，
+# 总耗时取决于最慢的站点而不是所有站点之和
+# 每个站点一个 SamplingScheduler，节拍和超时处理方式与单站点模式相同；
+# suppress_unchanged 为 True 时每个站点一个 ChangeDetector，不发送与上次相同的快照
+class FleetPoller:
+    def __init__(self, devices, max_workers=8, on_data=None, on_error=None, overrun="skip",
+                 suppress_unchanged=False, heartbeat=60):
+        self.devices = list(devices)
+        self.overrun = overrun
+        self.detectors = [ChangeDetector(heartbeat) if suppress_unchanged else None for _ in self.devices]
+        self.max_workers = max_workers
+        self.on_data = on_data
+        self.on_error = on_error
+        # 所有站点共享一个会话，每个主机各自保持 keep-alive 连接
+        self.session = make_session(pool_connections=max(1, len(self.devices)), pool_maxsize=max_workers)
+        self._executor = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._wakeup = threading.Condition()
+        self._heap = []
+        self._failures = {}
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self._stop_event = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="FleetPoller")
+        now = time.monotonic()
+        self._schedulers = [SamplingScheduler(device.interval, device.overrun or self.overrun)
+                            for device in self.devices]
+        for scheduler in self._schedulers:
+            scheduler.reset(now)
+        with self._wakeup:
+            self._heap = [(now, index) for index in range(len(self.devices))]
+            heapq.heapify(self._heap)
+        self._failures = {device.device_id: 0 for device in self.devices}
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event, self._executor),
+                                        name="FleetScheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        self._stop_event.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+        if wait and self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def close(self):
+        self.stop()
+        self.session.close()
+
+    def _run(self, stop_event, executor):
+        while not stop_event.is_set():
+            with self._wakeup:
+                if not self._heap:
+                    self._wakeup.wait()
+                    continue
+                due, index = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+            # 站点在请求完成之前不会重新入队，同一站点不会出现并发请求
+            try:
+                executor.submit(self._poll, stop_event, index)
+            except RuntimeError:
+                return
+
+    def _poll(self, stop_event, index):
+        device = self.devices[index]
+        scheduler = self._schedulers[index]
+        next_due = None
+        try:
+            next_due = self._poll_once(stop_event, index, device, scheduler)
+        except Exception:
+            # 意外的异常（比如 on_data 中抛出）会被线程池的 Future 吞掉，打印出来并按失败退避
+            print("站点 %s 轮询发生意外异常:" % device.device_id)
+            traceback.print_exc()
+        finally:
+            # 无论如何都要重新入队，否则这个站点再也不会被轮询
+            if next_due is None:
+                next_due = self._backoff(device, scheduler)
+            with self._wakeup:
+                if not stop_event.is_set():
+                    heapq.heappush(self._heap, (next_due, index))
+                    self._wakeup.notify()
+
+    # 返回下一次请求的时间
+    def _poll_once(self, stop_event, index, device, scheduler):
+        timestamp = scheduler.begin()
+        try:
+            json_sensor_data = fetch_sensor_data(self.session, device.url, device.timeout, timestamp,
+                                                 self.detectors[index])
+        except FETCH_ERRORS as e:
+            count_fetch_error(e)
+            next_due = self._backoff(device, scheduler)
+            if self.on_error is not None:
+                self.on_error(device.device_id, e)
+            else:
+                print("站点 %s 请求发生异常:" % device.device_id, e)
+            return next_due
+        self._failures[device.device_id] = 0
+        if json_sensor_data is not None:
+            json_sensor_data.device_id = device.device_id
+            json_sensor_data.jitter_ms = round(scheduler.jitter * 1000, 3)
+            if self.on_data is not None and not stop_event.is_set():
+                self.on_data(json_sensor_data)
+        return scheduler.advance()
+
+    # 指数退避，上限为 max_backoff 秒；恢复后从退避结束的时间重新计拍
+    # 指数封顶，连续失败很多次时 float 的 2 ** failures 不会溢出
+    def _backoff(self, device, scheduler):
+        failures = self._failures[device.device_id] + 1
+        self._failures[device.device_id] = failures
+        next_due = time.monotonic() + min(device.interval * (2 ** min(failures, 16)), device.max_backoff)
+        scheduler.reset(next_due)
+        return next_due
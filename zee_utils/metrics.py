@@ -0,0 +1,255 @@
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 耗时直方图的桶上界（秒），覆盖 50 微秒到 10 秒
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels)
+    if extra is not None:
+        items.append(extra)
+    if not items:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for key, value in items)
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, labels):
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name):
+        yield name, self.labels, None, self.value
+
+
+# 当前值；传入 fn 时在读取时调用 fn()，用于队列长度这类随时可取的量
+class Gauge:
+    def __init__(self, labels, fn=None):
+        self.labels = labels
+        self.fn = fn
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.fn() if self.fn is not None else self.value
+
+    def samples(self, name):
+        yield name, self.labels, None, self.get()
+
+
+# 固定桶直方图：observe 只做一次二分查找和几次加法，可以常开
+class Histogram:
+    def __init__(self, labels, buckets=DEFAULT_BUCKETS):
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+    # 在所属的桶内线性插值估计分位数
+    def quantile(self, q):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+            maximum = self.max
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else maximum
+                return min(lower + (upper - lower) * (rank - seen) / count, maximum)
+            seen += count
+        return maximum
+
+    def samples(self, name):
+        with self._lock:
+            counts = list(self.counts)
+            total_sum = self.sum
+            total = self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            yield name + "_bucket", self.labels, ("le", _format_number(bound)), cumulative
+        yield name + "_sum", self.labels, None, total_sum
+        yield name + "_count", self.labels, None, total
+
+
+# 指标注册表：同名同标签的指标只创建一次，热路径上应提前取到指标对象再调用
+class MetricsRegistry:
+    def __init__(self):
+        self.families = {}  # name -> (type, help, {labels: metric})
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, help, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self.families.get(name)
+            if family is None:
+                family = (kind, help, {})
+                self.families[name] = family
+            elif family[0] != kind:
+                raise ValueError("指标 %s 已注册为 %s" % (name, family[0]))
+            metric = family[2].get(key)
+            if metric is None:
+                metric = factory(key)
+                family[2][key] = metric
+            return metric
+
+    def counter(self, name, help="", **labels):
+        return self._get("counter", name, help, labels, Counter)
+
+    def gauge(self, name, help="", fn=None, **labels):
+        gauge = self._get("gauge", name, help, labels, lambda key: Gauge(key, fn))
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS, **labels):
+        return self._get("histogram", name, help, labels, lambda key: Histogram(key, buckets))
+
+    def unregister(self, name, **labels):
+        with self._lock:
+            family = self.families.get(name)
+            if family is not None:
+                family[2].pop(tuple(sorted(labels.items())), None)
+
+    def _families(self):
+        with self._lock:
+            return [(name, kind, help, list(metrics.values()))
+                    for name, (kind, help, metrics) in sorted(self.families.items())]
+
+    # Prometheus 文本格式
+    def render(self):
+        lines = []
+        for name, kind, help, metrics in self._families():
+            if help:
+                lines.append("# HELP %s %s" % (name, help))
+            lines.append("# TYPE %s %s" % (name, kind))
+            for metric in metrics:
+                for sample_name, labels, extra, value in metric.samples(name):
+                    lines.append("%s%s %s" % (sample_name, _format_labels(labels, extra), _format_number(value)))
+        return "\n".join(lines) + "\n"
+
+    # 诊断面板用的简表：直方图显示次数和耗时分位数（毫秒），计数器和仪表显示当前值
+    def summary(self):
+        lines = ["%-40s %8s %8s %8s %8s" % ("stage", "count", "p50ms", "p95ms", "maxms")]
+        others = []
+        for name, kind, help, metrics in self._families():
+            for metric in metrics:
+                title = name + _format_labels(metric.labels)
+                if kind == "histogram":
+                    lines.append("%-40s %8d %8.2f %8.2f %8.2f" % (
+                        title, metric.count, metric.quantile(0.5) * 1000, metric.quantile(0.95) * 1000,
+                        metric.max * 1000))
+                else:
+                    others.append("%-40s %8s" % (title, _format_number(next(metric.samples(name))[3])))
+        return "\n".join(lines + [""] + others)
+
+
+# 进程内共用的注册表
+METRICS = MetricsRegistry()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# 本地 http://<host>:<port>/metrics，供 Prometheus 抓取
+class MetricsServer:
+    def __init__(self, registry=METRICS, host="127.0.0.1", port=9108):
+        self.server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# 定期把指标写入文本文件（先写临时文件再替换，读取方不会读到半个文件），
+# 可以直接交给 node_exporter 的 textfile collector
+class MetricsFileWriter:
+    def __init__(self, filename, registry=METRICS, interval=10):
+        self.filename = filename
+        self.registry = registry
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="MetricsFileWriter", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.write()
+
+    def write(self):
+        parent_directory = os.path.dirname(self.filename)
+        if parent_directory:
+            os.makedirs(parent_directory, exist_ok=True)
+        tmp_filename = "%s.%d.tmp" % (self.filename, os.getpid())
+        with open(tmp_filename, 'w', encoding='utf-8') as f:
+            f.write(self.registry.render())
+        os.replace(tmp_filename, self.filename)
+
+    def close(self):
+        self._stop_event.set()
+        self.write()
+
+
+# 阶段耗时直方图，所有阶段共用一个指标名，以 stage 标签区分
+def stage_timer(stage, registry=METRICS):
+    return registry.histogram("env_stage_seconds", "各处理阶段的耗时（秒）", stage=stage)
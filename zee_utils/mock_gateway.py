@@ -0,0 +1,280 @@
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .push_listener import parse_listen_url
+from .sensor_fields import SENSOR_SCHEMA
+
+# 各字段模拟值的初始值和随机游走步长
+_BASE_VALUES = {
+    "Noise": (45, 1.5), "Temperature": (20, 0.1), "Humidity": (50, 0.3), "Wind_Speed": (3, 0.2),
+    "Wind_Direction": (180, 5), "Rainfall": (0, 0.05), "Radiation": (500, 10), "Illumination": (40000, 500),
+    "AirPressure": (1000, 0.2), "PM2.5": (35, 1), "PM10": (50, 1.5), "Ultraviolet_Ray": (5, 0.2),
+    "CO": (1, 0.05), "SO2": (10, 0.5), "NO2": (30, 1), "O3": (60, 1), "TVOC": (0.5, 0.02),
+    "People_Number": (10, 1), "Car_Sum": (20, 2), "Car_Number_green": (5, 1), "Car_Number_Notgreen": (15, 1),
+}
+
+
+# 一台模拟设备，各字段的值做随机游走
+class MockDevice:
+    def __init__(self, device_id, drift=1.0, seed=None):
+        self.device_id = device_id
+        self.drift = drift
+        self.random = random.Random(seed)
+        self.values = {field.name: _BASE_VALUES[field.name][0] for field in SENSOR_SCHEMA}
+        self.lock = threading.Lock()
+        self.version = 0
+        self.updated = 0.0
+        self.body = None
+        self.snapshot_lock = threading.Lock()
+
+    def sample(self):
+        sensor = {}
+        with self.lock:
+            for field in SENSOR_SCHEMA:
+                step = _BASE_VALUES[field.name][1] * self.drift
+                value = self.values[field.name] + self.random.gauss(0, step)
+                if field.name not in ("Temperature",):
+                    value = max(value, 0)
+                self.values[field.name] = value
+                if field.type is int:
+                    sensor[field.name] = str(int(round(value)))
+                else:
+                    sensor[field.name] = "%.1f" % value
+        # timestamp 使用带小数的秒，便于测量端到端延迟
+        return {
+            "code": 200,
+            "data": {
+                "deviceType": "LY-QX12",
+                "deviceId": self.device_id,
+                "timestamp": "%.6f" % time.time(),
+                "sensor": sensor,
+            },
+        }
+
+    # update_interval 秒内的请求返回同一个快照，模拟站点更新比轮询慢；0 为每次请求都更新
+    # 返回 (版本号, 更新时间, 响应体)
+    def snapshot(self, update_interval=0):
+        with self.snapshot_lock:
+            now = time.time()
+            if self.body is None or now - self.updated >= update_interval:
+                self.body = json.dumps(self.sample()).encode('utf-8')
+                self.updated = now
+                self.version += 1
+            return self.version, self.updated, self.body
+
+
+class _GatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，keep-alive 下不关闭 Nagle 会碰上 40ms 的延迟确认
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        gateway = self.server.gateway
+        device = gateway.route(self.path)
+        if device is None:
+            self._reply(404, b'{"code":404}')
+            return
+        delay = gateway.latency + gateway.random.uniform(-gateway.jitter, gateway.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if gateway.random.random() < gateway.error_rate:
+            gateway.errors += 1
+            self._reply(500, b'{"code":500}')
+            return
+        gateway.requests += 1
+        version, updated, body = device.snapshot(gateway.update_interval)
+        headers = {}
+        if gateway.validators:
+            etag = '"%s-%d"' % (device.device_id, version)
+            headers = {"ETag": etag, "Last-Modified": formatdate(updated, usegmt=True)}
+            if self.headers.get("If-None-Match") == etag or self._not_modified_since(updated):
+                self._reply(304, b"", headers)
+                return
+        self._reply(200, body, headers)
+
+    def _not_modified_since(self, updated):
+        value = self.headers.get("If-Modified-Since")
+        if not value or self.headers.get("If-None-Match"):
+            return False
+        try:
+            return int(updated) <= parsedate_to_datetime(value).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    def _reply(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# 本地模拟网关，替代 http://<设备>:33200/sensor/getAllSensor
+# 设备 i 的地址为 /dev/<i>/sensor/getAllSensor，/sensor/getAllSensor 等同于设备 0
+# latency/jitter 单位为秒，error_rate 为返回 500 的概率，drift 为数值随机游走的幅度倍数
+# update_interval 为设备快照的更新周期（秒），validators 为 True 时返回 ETag/Last-Modified 并支持 304
+class MockGateway:
+    def __init__(self, host="127.0.0.1", port=33200, device_count=1, latency=0.0, jitter=0.0,
+                 error_rate=0.0, drift=1.0, seed=None, update_interval=0.0, validators=False):
+        self.host = host
+        self.update_interval = update_interval
+        self.validators = validators
+        self.random = random.Random(seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.devices = [MockDevice("MOCK%04d" % i, drift, self.random.random()) for i in range(device_count)]
+        self.requests = 0
+        self.errors = 0
+        self.server = ThreadingHTTPServer((host, port), _GatewayHandler)
+        self.server.daemon_threads = True
+        self.server.gateway = self
+        self.port = self.server.server_address[1]
+        self._thread = None
+
+    def route(self, path):
+        path = path.split("?", 1)[0]
+        if path == "/sensor/getAllSensor":
+            return self.devices[0]
+        parts = path.strip("/").split("/")
+        if len(parts) == 4 and parts[0] == "dev" and parts[2:] == ["sensor", "getAllSensor"] and parts[1].isdigit():
+            index = int(parts[1])
+            if index < len(self.devices):
+                return self.devices[index]
+        return None
+
+    def url(self, index=0):
+        return "http://%s:%d/dev/%d/sensor/getAllSensor" % (self.host, self.port, index)
+
+    # 生成 FleetPoller 使用的站点列表
+    def device_list(self, interval=1, timeout=5):
+        return [{"deviceId": device.device_id, "url": self.url(i), "interval": interval, "timeout": timeout}
+                for i, device in enumerate(self.devices)]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="MockGateway", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def serve_forever(self):
+        self.server.serve_forever()
+
+
+# 模拟推送：按 rate（条/秒，所有设备合计）轮流把各设备的样本以一行 JSON 推送到 udp:// 或 tcp:// 地址
+# 消息格式与网关响应的 data 部分相同，timestamp 为生成时间，便于测量端到端延迟
+# 发送落后时一次补发，不因 sleep 的精度降低速率
+class MockPublisher:
+    def __init__(self, url, device_count=1, rate=10, drift=1.0, seed=None):
+        self.protocol, self.host, self.port = parse_listen_url(url)
+        self.rate = rate
+        self.random = random.Random(seed)
+        self.devices = [MockDevice("MOCK%04d" % i, drift, self.random.random()) for i in range(device_count)]
+        self.sent = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _connect(self):
+        if self.protocol == "udp":
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect((self.host, self.port))
+        else:
+            sock = socket.create_connection((self.host, self.port))
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    # 发送 duration 秒，None 为一直发送到 stop()
+    def run(self, duration=None):
+        sock = self._connect()
+        start = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                elapsed = time.monotonic() - start
+                if duration is not None and elapsed >= duration:
+                    break
+                due = int(elapsed * self.rate) - self.sent
+                if due <= 0:
+                    self._stop_event.wait(min(1.0 / self.rate, 0.001))
+                    continue
+                for _ in range(due):
+                    device = self.devices[self.sent % len(self.devices)]
+                    line = json.dumps(device.sample()["data"]).encode('utf-8') + b"\n"
+                    try:
+                        sock.sendall(line)
+                    except ConnectionRefusedError:
+                        if self.protocol == "tcp":
+                            raise
+                        # UDP 接收方尚未启动或已经停止，丢弃这一条
+                    self.sent += 1
+        finally:
+            sock.close()
+
+    def start(self, duration=None):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.run, args=(duration,), name="MockPublisher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟传感器网关")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=33200)
+    parser.add_argument("--devices", type=int, default=1, help="模拟设备数量")
+    parser.add_argument("--latency", type=float, default=0.0, help="响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟抖动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--drift", type=float, default=1.0, help="数值随机游走幅度倍数")
+    parser.add_argument("--update-interval", type=float, default=0.0,
+                        help="设备快照的更新周期（秒），周期内重复请求返回同一个快照，默认每次请求都更新")
+    parser.add_argument("--etag", action="store_true", help="返回 ETag/Last-Modified，支持条件请求（304）")
+    parser.add_argument("--write-devices", help="把站点列表写入 JSON 文件，供 --devices 使用")
+    parser.add_argument("--interval", type=float, default=1, help="写入站点列表时使用的采集周期")
+    parser.add_argument("--publish", help="不启动网关，改为把样本推送到该地址，例如 udp://127.0.0.1:33210")
+    parser.add_argument("--rate", type=float, default=10, help="推送速率（条/秒，所有设备合计）")
+    parser.add_argument("--duration", type=float, help="推送时长（秒），默认一直推送")
+    args = parser.parse_args()
+
+    if args.publish:
+        publisher = MockPublisher(args.publish, args.devices, args.rate, args.drift)
+        print("向 %s 推送（共 %d 台设备，%.0f 条/秒）" % (args.publish, len(publisher.devices), args.rate))
+        try:
+            publisher.run(args.duration)
+        except KeyboardInterrupt:
+            pass
+        print("已发送 %d 条" % publisher.sent)
+        return
+
+    gateway = MockGateway(args.host, args.port, args.devices, args.latency, args.jitter,
+                          args.error_rate, args.drift, update_interval=args.update_interval, validators=args.etag)
+    if args.write_devices:
+        with open(args.write_devices, 'w', encoding='utf-8') as f:
+            json.dump(gateway.device_list(args.interval), f, indent=4)
+    print("模拟网关监听 %s（共 %d 台设备）" % (gateway.url(0), len(gateway.devices)))
+    try:
+        gateway.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import json
+import selectors
+import socket
+import threading
+import time
+import traceback
+from urllib.parse import urlsplit
+
+from .metrics import METRICS, stage_timer
+from .sensor_fields import parse_sensor
+
+PUSH_PROTOCOLS = ("udp", "tcp")
+
+_PARSE_SECONDS = stage_timer("push_parse")
+_MESSAGES = METRICS.counter("env_push_messages_total", "收到的推送样本数")
+
+# 推送消息可能出现的异常：不是 JSON、缺少 sensor 字段、结构不对、数值溢出
+PUSH_ERRORS = (ValueError, KeyError, TypeError, AttributeError, OverflowError)
+
+# 发送方时间戳的合理范围（epoch 秒），超出时（毫秒时间戳、inf、负数）改用收到的时间，
+# 否则转成纳秒后会超出 int64
+_MIN_TIMESTAMP = 0
+_MAX_TIMESTAMP = 4102444800  # 2100-01-01
+
+
+# "udp://0.0.0.0:33210" -> ("udp", "0.0.0.0", 33210)
+def parse_listen_url(url):
+    parts = urlsplit(url)
+    if parts.scheme not in PUSH_PROTOCOLS or parts.port is None:
+        raise ValueError("地址格式应为 udp://主机:端口 或 tcp://主机:端口: %s" % url)
+    return parts.scheme, parts.hostname or "0.0.0.0", parts.port
+
+
+# 一行 JSON 转成 SensorSample：{"deviceId": ..., "timestamp": epoch 秒, "sensor": {...}}，
+# 也接受网关的响应格式 {"data": {...}}；没有 timestamp 或超出合理范围时取收到的时间
+def parse_push_message(line, received_ns):
+    message = json.loads(line)
+    if isinstance(message.get("data"), dict):
+        message = message["data"]
+    timestamp = message.get("timestamp")
+    timestamp = None if timestamp in (None, "") else float(timestamp)
+    if timestamp is None or not _MIN_TIMESTAMP <= timestamp < _MAX_TIMESTAMP:
+        timestamp_ns = received_ns
+    else:
+        timestamp_ns = int(round(timestamp * 1e9))
+    json_sensor_data = parse_sensor(message["sensor"], timestamp_ns)
+    json_sensor_data.device_id = message.get("deviceId")
+    return json_sensor_data
+
+
+def count_push_error(error):
+    METRICS.counter("env_push_errors_total", "无法解析的推送消息数", kind=type(error).__name__).inc()
+
+
+# 推送接收：设备或转发程序主动把样本推过来，不用等下一次轮询，也没有空请求
+# 每条消息一行 JSON（见 parse_push_message）；UDP 一个数据报可以包含多行，TCP 连接上按换行分隔
+# 一个线程用 selectors 同时处理监听套接字和所有 TCP 连接，on_data 在这个线程中被调用
+# 接口与 SensorFetcher/FleetPoller 相同（start/stop/close/set_interval），可以直接作为 Collector 的数据源
+# device_ids 为 None 时是单站点模式，所有样本都归到站点 None；否则只接受列表中的站点，其余计为错误
+# 端口为 0 时由系统分配，start() 之后从 port 读取
+class PushListener:
+    def __init__(self, url, device_ids=None, on_data=None, on_error=None, max_line=65536,
+                 receive_buffer=4 * 1024 * 1024):
+        self.protocol, self.host, self.port = parse_listen_url(url)
+        self.device_ids = None if device_ids is None else set(device_ids)
+        self.on_data = on_data
+        self.on_error = on_error
+        self.max_line = max_line
+        self.receive_buffer = receive_buffer
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop_event.is_set()
+
+    # 推送的节奏由发送方决定
+    def set_interval(self, interval):
+        pass
+
+    # 在调用线程中绑定端口，端口被占用时直接抛出异常
+    def start(self):
+        if self.is_running():
+            return
+        # stop(wait=False) 之后重新开始：等上一个线程关闭套接字再绑定同一个端口
+        if self._thread is not None:
+            self._thread.join()
+        if self.protocol == "udp":
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            # 突发的大量数据报先放在内核缓冲区里
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        if self.protocol == "tcp":
+            sock.listen(128)
+        sock.setblocking(False)
+        self.port = sock.getsockname()[1]
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event, sock), name="PushListener",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        self._stop_event.set()
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def close(self):
+        self.stop()
+
+    def _run(self, stop_event, sock):
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        pending = {}  # TCP 连接 -> 还没有遇到换行的数据
+        try:
+            while not stop_event.is_set():
+                for key, _ in selector.select(timeout=0.2):
+                    if key.fileobj is not sock:
+                        self._read_connection(selector, key.fileobj, pending)
+                    elif self.protocol == "udp":
+                        self._read_datagrams(sock)
+                    else:
+                        self._accept(selector, sock, pending)
+        finally:
+            for connection in pending:
+                connection.close()
+            selector.close()
+            sock.close()
+
+    # 一次把内核缓冲区里的数据报取完
+    def _read_datagrams(self, sock):
+        while True:
+            try:
+                data = sock.recv(65536)
+            except BlockingIOError:
+                return
+            self._handle(data)
+
+    def _accept(self, selector, sock, pending):
+        try:
+            connection, _ = sock.accept()
+        except BlockingIOError:
+            return
+        connection.setblocking(False)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        selector.register(connection, selectors.EVENT_READ)
+        pending[connection] = bytearray()
+
+    def _read_connection(self, selector, connection, pending):
+        try:
+            data = connection.recv(262144)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        buffer = pending[connection]
+        if not data:
+            # 对方关闭连接，最后一行可以没有换行
+            if buffer:
+                self._handle(bytes(buffer))
+            selector.unregister(connection)
+            connection.close()
+            del pending[connection]
+            return
+        buffer += data
+        end = buffer.rfind(b"\n")
+        if end >= 0:
+            self._handle(bytes(buffer[:end]))
+            del buffer[:end + 1]
+        if len(buffer) > self.max_line:
+            buffer.clear()
+            self._error(ValueError("推送消息超过 %d 字节" % self.max_line))
+
+    def _handle(self, data):
+        received_ns = time.time_ns()
+        start = time.perf_counter()
+        samples = []
+        for line in data.split(b"\n"):
+            if not line.strip():
+                continue
+            try:
+                json_sensor_data = parse_push_message(line, received_ns)
+            except PUSH_ERRORS as e:
+                self._error(e)
+                continue
+            if self.device_ids is None:
+                json_sensor_data.device_id = None
+            elif json_sensor_data.device_id not in self.device_ids:
+                self._error(KeyError("未配置的站点 %s" % json_sensor_data.device_id))
+                continue
+            samples.append(json_sensor_data)
+        _PARSE_SECONDS.observe(time.perf_counter() - start)
+        _MESSAGES.inc(len(samples))
+        if self.on_data is not None:
+            for json_sensor_data in samples:
+                # 下游处理一个样本出错不能让接收线程退出
+                try:
+                    self.on_data(json_sensor_data)
+                except Exception:
+                    print("推送样本处理发生意外异常:")
+                    traceback.print_exc()
+
+    def _error(self, error):
+        count_push_error(error)
+        if self.on_error is not None:
+            self.on_error(error)
+        else:
+            print("推送消息无法解析:", error)
@@ -0,0 +1,195 @@
+import math
+import sys
+import threading
+from collections import deque
+
+from .sensor_fields import SENSOR_FIELDS
+from .sensor_sample import record_values
+
+# 默认的滑动窗口：1 分钟、15 分钟、1 小时
+DEFAULT_WINDOWS = (60, 900, 3600)
+STAT_NAMES = ("count", "min", "max", "mean", "std", "p50", "p95")
+
+
+# 对数分桶的分位数草图（DDSketch 的思路），相对误差 relative_accuracy
+# 支持加入和删除，更新 O(1)，查询时按桶遍历
+class QuantileSketch:
+    def __init__(self, relative_accuracy=0.01):
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(gamma)
+        self.gamma = gamma
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+
+    # update 已经过滤了非有限值；这里再把 inf/NaN 归到最大的桶，避免 log/ceil 抛出异常打断采集
+    def _key(self, value):
+        if not math.isfinite(value):
+            value = sys.float_info.max
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def _store(self, value):
+        if value > 0:
+            return self.positive, self._key(value)
+        return self.negative, self._key(-value)
+
+    def add(self, value):
+        self.count += 1
+        if value == 0:
+            self.zero += 1
+            return
+        store, key = self._store(value)
+        store[key] = store.get(key, 0) + 1
+
+    def remove(self, value):
+        self.count -= 1
+        if value == 0:
+            self.zero -= 1
+            return
+        store, key = self._store(value)
+        left = store[key] - 1
+        if left:
+            store[key] = left
+        else:
+            del store[key]
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return math.nan
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+
+# 单个字段在一个时间窗口内的滚动统计，每个样本摊还 O(1)：
+# 单调队列维护最小/最大值（按样本序号出队，时间戳可以重复），Welford 算法（支持删除）维护均值和方差，草图维护分位数
+class RollingWindow:
+    def __init__(self, window_ns, relative_accuracy=0.01):
+        self.window_ns = window_ns
+        self.samples = deque()
+        self.min_queue = deque()
+        self.max_queue = deque()
+        # 下一个加入的样本和 samples[0] 的序号
+        self.next_seq = 0
+        self.head_seq = 0
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, timestamp_ns, value):
+        seq = self.next_seq
+        self.next_seq += 1
+        self.samples.append((timestamp_ns, value))
+        while self.min_queue and self.min_queue[-1][1] >= value:
+            self.min_queue.pop()
+        self.min_queue.append((seq, value))
+        while self.max_queue and self.max_queue[-1][1] <= value:
+            self.max_queue.pop()
+        self.max_queue.append((seq, value))
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.sketch.add(value)
+        self.expire(timestamp_ns)
+
+    # 移除早于 now_ns - window_ns 的样本
+    def expire(self, now_ns):
+        limit = now_ns - self.window_ns
+        samples = self.samples
+        while samples and samples[0][0] <= limit:
+            value = samples.popleft()[1]
+            seq = self.head_seq
+            self.head_seq += 1
+            if self.min_queue and self.min_queue[0][0] == seq:
+                self.min_queue.popleft()
+            if self.max_queue and self.max_queue[0][0] == seq:
+                self.max_queue.popleft()
+            self._remove(value)
+
+    def _remove(self, value):
+        self.sketch.remove(value)
+        self.count -= 1
+        if self.count == 0:
+            self.mean = 0.0
+            self.m2 = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self.m2 -= delta * (value - self.mean)
+
+    def stats(self):
+        if self.count == 0:
+            return dict.fromkeys(STAT_NAMES, math.nan) | {"count": 0}
+        variance = max(self.m2, 0.0) / (self.count - 1) if self.count > 1 else 0.0
+        return {
+            "count": self.count,
+            "min": self.min_queue[0][1],
+            "max": self.max_queue[0][1],
+            "mean": self.mean,
+            "std": math.sqrt(variance),
+            "p50": self.sketch.quantile(0.5),
+            "p95": self.sketch.quantile(0.95),
+        }
+
+
+# 所有字段、所有窗口的滚动统计，每来一个样本更新一次
+# 采集线程更新，界面和存储线程读取，用一把锁保护
+class RollingStatsEngine:
+    def __init__(self, fields=SENSOR_FIELDS, windows=DEFAULT_WINDOWS, relative_accuracy=0.01):
+        self.fields = tuple(fields)
+        self.windows = tuple(windows)
+        self.channels = {
+            name: [RollingWindow(int(seconds * 1000000000), relative_accuracy) for seconds in self.windows]
+            for name in self.fields
+        }
+        self.last_timestamp_ns = None
+        self.lock = threading.Lock()
+
+    # record 为 SensorSample 或字典记录，值为 None、NaN 或 ±inf 的字段跳过
+    def update(self, record, timestamp_ns):
+        values = record_values(record, self.fields)
+        with self.lock:
+            self.last_timestamp_ns = timestamp_ns
+            for value, windows in zip(values, self.channels.values()):
+                if value is None or not math.isfinite(value):
+                    for window in windows:
+                        window.expire(timestamp_ns)
+                    continue
+                for window in windows:
+                    window.add(timestamp_ns, value)
+
+    # {窗口秒数: {统计量: 值}}
+    def stats(self, field):
+        with self.lock:
+            return {seconds: window.stats() for seconds, window in zip(self.windows, self.channels[field])}
+
+    # 展开成一行，列名形如 Noise_60s_mean，供 CSV/归档写入
+    def snapshot(self):
+        row = {}
+        with self.lock:
+            for name, windows in self.channels.items():
+                for seconds, window in zip(self.windows, windows):
+                    for stat, value in window.stats().items():
+                        row["%s_%ds_%s" % (name, seconds, stat)] = value
+        return row
+
+    def snapshot_fields(self):
+        return tuple("%s_%ds_%s" % (name, seconds, stat)
+                     for name in self.fields for seconds in self.windows for stat in STAT_NAMES)
@@ -0,0 +1,246 @@
+import glob
+import json
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+
+from .metrics import METRICS, stage_timer
+from .sensor_fields import SENSOR_FIELDS, SENSOR_SCHEMA, SensorField
+from .sensor_sample import NAN, SampleLayout, SensorSample, record_timestamp_ns, record_values
+
+JOURNAL_DIR = "journal"
+CHECKPOINT_FILE = "checkpoint"
+SEGMENT_SUFFIX = ".wal"
+MAGIC = b"ENVWAL01"
+# 每条记录：载荷长度、载荷的 crc32，然后是载荷
+_RECORD_HEADER = struct.Struct("<II")
+# 样本载荷：时间戳（纳秒）、jitter_ms（NaN 为没有）、deviceId 的字节数，然后是 deviceId 和 float64 数值
+_SAMPLE_HEADER = struct.Struct("<qdH")
+
+_COMMIT_SECONDS = stage_timer("journal_commit")
+_RECORDS = METRICS.counter("env_journal_records_total", "写入日志的样本数")
+_COMMITS = METRICS.counter("env_journal_commits_total", "日志 fsync 次数")
+_REPLAYED = METRICS.counter("env_journal_replayed_total", "启动时从日志回放的样本数")
+_TORN = METRICS.counter("env_journal_torn_total", "回放时丢弃的不完整或校验失败的日志分段尾部")
+
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+
+def encode_record(payload):
+    return _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def encode_sample(record, fields=SENSOR_FIELDS, timestamp_ns=None):
+    if timestamp_ns is None:
+        timestamp_ns = record_timestamp_ns(record)
+    values = record_values(record, fields)
+    if not isinstance(values, array):
+        values = array('d', [NAN if value is None else value for value in values])
+    device_id = record.get('deviceId')
+    device = b"" if device_id is None else str(device_id).encode('utf-8')
+    jitter_ms = record.get('jitter_ms')
+    header = _SAMPLE_HEADER.pack(timestamp_ns, NAN if jitter_ms is None else jitter_ms, len(device))
+    return encode_record(header + device + values.tobytes())
+
+
+def decode_sample(payload, layout):
+    timestamp_ns, jitter_ms, device_length = _SAMPLE_HEADER.unpack_from(payload)
+    start = _SAMPLE_HEADER.size
+    device = payload[start:start + device_length].decode('utf-8') if device_length else None
+    values = array('d')
+    values.frombytes(payload[start + device_length:])
+    return SensorSample(layout, values, timestamp_ns, device, None if math.isnan(jitter_ms) else jitter_ms)
+
+
+# 读取一个日志分段：返回 (字段, [载荷], 完整记录结束的位置)
+# 记录不完整或校验失败时停在该处，之后的内容视为崩溃时没有写完的尾部
+def read_segment(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        return None, [], 0
+    offset = len(MAGIC)
+    fields = None
+    payloads = []
+    while offset + _RECORD_HEADER.size <= len(data):
+        length, crc = _RECORD_HEADER.unpack_from(data, offset)
+        end = offset + _RECORD_HEADER.size + length
+        payload = data[offset + _RECORD_HEADER.size:end]
+        if end > len(data) or zlib.crc32(payload) != crc:
+            break
+        if fields is None:
+            # 第一条记录是字段列表
+            fields = tuple(json.loads(payload)['fields'])
+        else:
+            payloads.append(payload)
+        offset = end
+    return fields, payloads, offset
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# 写前日志：样本交给存储的同时追加到 journal/ 下的日志分段，崩溃、断电或被杀掉后启动时回放
+# append 直接 write 到日志文件，进程崩溃或被杀掉不会丢失；
+# 组提交：后台线程每 commit_interval 秒（或未同步的数据超过 max_batch_bytes 时）fdatasync 一次，
+# 不需要每个样本一次 fsync，断电时最多丢失最近 commit_interval 秒的样本
+# 每条记录带长度前缀和 crc32，写到一半的尾部在回放时丢弃
+# 检查点：每 checkpoint_interval 秒切换到新分段，调用 sync（把存储落盘），再删除之前的分段；
+# 回放是至少一次的：检查点前崩溃时存储可能已经写入了部分样本，由调用方去重（见 DeviceRecorder._replay_into）
+class SampleJournal:
+    def __init__(self, journal_dir, fields=SENSOR_FIELDS, commit_interval=0.5, checkpoint_interval=30,
+                 max_batch_bytes=256 * 1024, sync=None):
+        self.journal_dir = journal_dir
+        self.fields = tuple(fields)
+        self.commit_interval = commit_interval
+        self.checkpoint_interval = checkpoint_interval
+        self.max_batch_bytes = max_batch_bytes
+        self.sync = sync
+        schema = {field.name: field for field in SENSOR_SCHEMA}
+        self.layout = SampleLayout([schema.get(name, SensorField(name, float, "", name)) for name in self.fields])
+        self.lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._unsynced = 0  # 上次 fdatasync 之后写入的字节数
+        self._fd = None
+        os.makedirs(journal_dir, exist_ok=True)
+        self._sequence = max(self.segments() + [self.checkpoint_sequence()])
+        self._new_segment = False
+        self._last_checkpoint = time.monotonic()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._closed = False
+
+    def _segment_path(self, sequence):
+        return os.path.join(self.journal_dir, "%016d%s" % (sequence, SEGMENT_SUFFIX))
+
+    def segments(self):
+        paths = glob.glob(os.path.join(self.journal_dir, "*" + SEGMENT_SUFFIX))
+        return sorted(int(os.path.basename(path)[:-len(SEGMENT_SUFFIX)]) for path in paths)
+
+    def checkpoint_sequence(self):
+        try:
+            with open(os.path.join(self.journal_dir, CHECKPOINT_FILE), encoding='utf-8') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    # 上次运行留下的、检查点之后的样本，不完整的尾部丢弃
+    # 返回 (样本列表, 最后一个分段的序号)，回放写入存储并落盘后调用 discard_through(序号)
+    def recover(self):
+        checkpoint = self.checkpoint_sequence()
+        samples = []
+        last = checkpoint
+        for sequence in self.segments():
+            path = self._segment_path(sequence)
+            if sequence <= checkpoint:
+                os.remove(path)
+                continue
+            last = sequence
+            fields, payloads, valid_bytes = read_segment(path)
+            if valid_bytes < os.path.getsize(path):
+                _TORN.inc()
+            if fields is None:
+                continue
+            if fields != self.fields:
+                raise ValueError("日志分段 %s 的字段与当前配置不一致" % path)
+            samples.extend(decode_sample(payload, self.layout) for payload in payloads)
+        _REPLAYED.inc(len(samples))
+        return samples, last
+
+    # 之前的分段都已经写入存储并落盘：先持久化检查点再删除分段，中途崩溃时回放会跳过它们
+    def discard_through(self, sequence):
+        checkpoint_path = os.path.join(self.journal_dir, CHECKPOINT_FILE)
+        with open(checkpoint_path + ".tmp", 'w', encoding='utf-8') as f:
+            f.write(str(sequence))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(checkpoint_path + ".tmp", checkpoint_path)
+        _fsync_dir(self.journal_dir)
+        for existing in self.segments():
+            if existing <= sequence:
+                os.remove(self._segment_path(existing))
+
+    def _open_segment(self):
+        self._sequence += 1
+        self._fd = os.open(self._segment_path(self._sequence), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.write(self._fd, MAGIC + encode_record(json.dumps({'fields': list(self.fields)}).encode('utf-8')))
+        self._new_segment = True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="SampleJournal", daemon=True)
+            self._thread.start()
+        return self
+
+    def append(self, record, timestamp_ns=None):
+        encoded = encode_sample(record, self.fields, timestamp_ns)
+        with self.lock:
+            if self._fd is None:
+                self._open_segment()
+            os.write(self._fd, encoded)
+            self._unsynced += len(encoded)
+            full = self._unsynced >= self.max_batch_bytes
+        _RECORDS.inc()
+        if full:
+            self._wake.set()
+
+    # fdatasync 上次提交之后写入的记录，期间 append 不需要等待
+    def commit(self):
+        with self._commit_lock:
+            with self.lock:
+                if not self._unsynced:
+                    return
+                fd, new_segment = self._fd, self._new_segment
+                self._unsynced = 0
+                self._new_segment = False
+            started = time.perf_counter()
+            _fdatasync(fd)
+            if new_segment:
+                _fsync_dir(self.journal_dir)
+            _COMMITS.inc()
+            _COMMIT_SECONDS.observe(time.perf_counter() - started)
+
+    # 切换分段并让存储落盘，然后删除旧分段
+    # 调用方必须先把样本交给存储再 append，这样旧分段中的样本都已经在存储的队列里
+    def checkpoint(self):
+        with self._commit_lock:
+            with self.lock:
+                fd, sequence = self._fd, self._sequence
+                self._fd = None
+                self._unsynced = 0
+            if fd is None:
+                return
+            os.close(fd)
+            if self.sync is not None:
+                self.sync()
+            self.discard_through(sequence)
+        self._last_checkpoint = time.monotonic()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.commit_interval)
+            self._wake.clear()
+            self.commit()
+            if time.monotonic() - self._last_checkpoint >= self.checkpoint_interval:
+                self.checkpoint()
+
+    # 存储关闭之后调用：最后一次检查点，正常退出时日志为空
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.checkpoint()
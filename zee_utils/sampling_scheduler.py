@@ -0,0 +1,79 @@
+import math
+import time
+
+from .metrics import METRICS
+
+# 请求耗时超过周期时的处理方式：
+# skip     丢弃错过的节拍，等到下一个整拍再采样
+# coalesce 错过的节拍合并成一次，立即采样，之后回到整拍
+# catch_up 错过的节拍逐个补采，直到追上
+OVERRUN_POLICIES = ("skip", "coalesce", "catch_up")
+
+_JITTER_SECONDS = METRICS.histogram("env_schedule_jitter_seconds", "实际开始采样时间与计划时间之差（秒）")
+_MISSED_TICKS = METRICS.counter("env_missed_ticks_total", "请求超时导致被丢弃的采集节拍数")
+
+
+# 采样节拍：第 k 拍的计划时间为 origin + k * interval（单调时钟），
+# 每拍都从起点直接算出，不会因为等待误差或请求耗时而累积漂移
+# 样本时间戳取计划时间对应的墙上时间，间隔均匀；实际开始时间与计划时间之差记为抖动
+# interval 为 0 时连续采样，不做对齐
+class SamplingScheduler:
+    def __init__(self, interval, policy="skip"):
+        if policy not in OVERRUN_POLICIES:
+            raise ValueError("不支持的超时处理方式: %s" % policy)
+        self.interval = interval
+        self.policy = policy
+        self.missed = 0
+        self.jitter = 0.0
+        self._reanchor = False
+        self.reset()
+
+    # 从 now（单调时钟，默认当前时间）重新开始计拍
+    def reset(self, now=None):
+        monotonic_now = time.monotonic()
+        self.origin = monotonic_now if now is None else now
+        self.wall_origin = time.time() + (self.origin - monotonic_now)
+        self.tick = 0
+
+    # 新周期从下一次采样后开始生效
+    def set_interval(self, interval):
+        self.interval = interval
+        self._reanchor = True
+
+    # 当前节拍的计划时间（单调时钟）
+    def deadline(self):
+        return self.origin + self.tick * self.interval
+
+    # 开始采样时调用：记录抖动，返回当前节拍的计划时间（epoch 秒）
+    def begin(self, now=None):
+        now = time.monotonic() if now is None else now
+        self.jitter = max(now - self.deadline(), 0.0)
+        _JITTER_SECONDS.observe(self.jitter)
+        if self.interval <= 0:
+            return self.wall_origin + (now - self.origin)
+        return self.wall_origin + self.tick * self.interval
+
+    # 采样完成后调用：按超时处理方式推进到下一拍，返回下一拍的计划时间
+    def advance(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.interval <= 0:
+            self.reset(now)
+            return now
+        if self._reanchor:
+            self._reanchor = False
+            self.reset(now)
+            self.tick = 1
+            return self.deadline()
+        next_tick = self.tick + 1
+        due = math.floor((now - self.origin) / self.interval)  # 已经到期的最后一拍
+        if due >= next_tick and self.policy != "catch_up":
+            if self.policy == "skip":
+                missed = due - self.tick
+                next_tick = due + 1
+            else:
+                missed = due - next_tick
+                next_tick = due
+            self.missed += missed
+            _MISSED_TICKS.inc(missed)
+        self.tick = next_tick
+        return self.deadline()
@@ -0,0 +1,191 @@
+import threading
+import time
+import traceback
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import METRICS, stage_timer
+from .sampling_scheduler import SamplingScheduler
+from .sensor_fields import parse_sensor
+from .sensor_sample import SensorSample
+
+_HTTP_SECONDS = stage_timer("http")
+_PARSE_SECONDS = stage_timer("parse")
+_POLLS_OK = METRICS.counter("env_polls_total", "成功的拉取次数")
+_UNCHANGED = METRICS.counter("env_unchanged_polls_total", "快照与上次相同、没有向下游发送的拉取次数")
+_HEARTBEATS = METRICS.counter("env_heartbeat_rows_total", "快照未变化时补发的心跳行数")
+
+
+def make_session(pool_connections=1, pool_maxsize=2):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# 变化检测：站点的更新比轮询慢时，连续几次拉到的是同一个快照
+# 网关返回 ETag / Last-Modified 时下次带上 If-None-Match / If-Modified-Since，304 响应不传输也不解析响应体；
+# 否则先逐字节比较响应体（比算摘要还省），不同再比较解析出的数值（响应里可能带有每次都变的时间字段）
+# 未变化的快照不向下游发送，存储、统计、告警、界面和图表都不处理；
+# 但距离上次发送超过 heartbeat 秒时补发一行心跳（上一个快照的数值、当前时间戳），
+# 这样数据中的空白只代表采集中断，而不是数值没变；heartbeat 为 0 时不发心跳
+class ChangeDetector:
+    def __init__(self, heartbeat=60):
+        self.heartbeat_ns = int(heartbeat * 1000000000)
+        self.etag = None
+        self.last_modified = None
+        self.content = None
+        self.sample = None
+        self.emitted_ns = None
+
+    def request_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def update_validators(self, response):
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+
+    def same_content(self, content):
+        return self.sample is not None and content == self.content
+
+    # 解析后的数值与上一个快照相同（NaN 按位比较）
+    def same_values(self, sample):
+        return self.sample is not None and sample.values.tobytes() == self.sample.values.tobytes()
+
+    def changed(self, content, sample):
+        self.content = content
+        self.sample = sample
+        self.emitted_ns = sample.timestamp_ns
+        return sample
+
+    # 快照未变化：到了心跳时间返回上一个快照的数值加当前时间戳，否则返回 None
+    def unchanged(self, timestamp_ns):
+        _UNCHANGED.inc()
+        if self.heartbeat_ns <= 0 or self.sample is None or timestamp_ns - self.emitted_ns < self.heartbeat_ns:
+            return None
+        self.emitted_ns = timestamp_ns
+        _HEARTBEATS.inc()
+        return SensorSample(self.sample.layout, self.sample.values, timestamp_ns)
+
+
+# timestamp 为样本时间（epoch 秒），默认取响应到达的时间
+# 传入 detector 时做变化检测，快照未变化且不需要心跳时返回 None
+def fetch_sensor_data(session, url, timeout, timestamp=None, detector=None):
+    start = time.perf_counter()
+    headers = detector.request_headers() if detector is not None else None
+    response = session.get(url, timeout=timeout, headers=headers)
+    received = time.perf_counter()
+    _HTTP_SECONDS.observe(received - start)
+    timestamp_ns = time.time_ns() if timestamp is None else int(round(timestamp * 1e9))
+    if response.status_code == 304 and detector is not None:
+        _POLLS_OK.inc()
+        return detector.unchanged(timestamp_ns)
+    if response.status_code != 200:
+        raise requests.HTTPError("请求失败，状态码：%s" % response.status_code, response=response)
+    if detector is not None:
+        detector.update_validators(response)
+        if detector.same_content(response.content):
+            _POLLS_OK.inc()
+            return detector.unchanged(timestamp_ns)
+    # 按字段定义一次性转换为紧凑的样本，时间戳为 epoch 纳秒，导出时才格式化
+    json_sensor_data = parse_sensor(response.json()['data']['sensor'], timestamp_ns)
+    _PARSE_SECONDS.observe(time.perf_counter() - received)
+    _POLLS_OK.inc()
+    if detector is not None:
+        if detector.same_values(json_sensor_data):
+            detector.content = response.content
+            return detector.unchanged(timestamp_ns)
+        return detector.changed(response.content, json_sensor_data)
+    return json_sensor_data
+
+
+# 失败的拉取按异常类型计数
+def count_fetch_error(error):
+    METRICS.counter("env_poll_errors_total", "失败的拉取次数", kind=type(error).__name__).inc()
+
+
+# 拉取过程中可能出现的异常：网络错误、非 JSON 响应、缺少 data.sensor 字段
+FETCH_ERRORS = (requests.RequestException, ValueError, KeyError, TypeError)
+
+
+# 后台拉取线程：持久的 keep-alive 会话 + 连接池，
+# 慢速网关只会拖慢这个线程，不会卡住 GUI 事件循环
+# 按 SamplingScheduler 的节拍采样，interval 可以小于 1 秒；overrun 为请求超过周期时的处理方式
+# 样本的 timestamp 为计划时间，jitter_ms 为实际开始请求的时间比计划晚了多少毫秒
+# suppress_unchanged 为 True 时不发送与上次相同的快照，heartbeat 见 ChangeDetector
+class SensorFetcher:
+    def __init__(self, url, interval=1, timeout=5, on_data=None, on_error=None, overrun="skip",
+                 suppress_unchanged=False, heartbeat=60):
+        self.url = url
+        self.interval = interval
+        self.timeout = timeout
+        self.scheduler = SamplingScheduler(interval, overrun)
+        self.detector = ChangeDetector(heartbeat) if suppress_unchanged else None
+        self.on_data = on_data
+        self.on_error = on_error
+        self.session = make_session()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def set_interval(self, interval):
+        self.interval = interval
+        self.scheduler.set_interval(interval)
+
+    def start(self):
+        if self.is_running():
+            return
+        # 每次启动使用独立的停止事件，避免未退出的旧线程被重新唤醒
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event,), name="SensorFetcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait=True):
+        self._stop_event.set()
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(self.timeout + 1)
+        self._thread = None
+
+    def close(self):
+        self.stop()
+        self.session.close()
+
+    def fetch_once(self):
+        return fetch_sensor_data(self.session, self.url, self.timeout)
+
+    def _run(self, stop_event):
+        scheduler = self.scheduler
+        scheduler.reset()
+        while not stop_event.is_set():
+            delay = scheduler.deadline() - time.monotonic()
+            if delay > 0 and stop_event.wait(delay):
+                break
+            timestamp = scheduler.begin()
+            try:
+                json_sensor_data = fetch_sensor_data(self.session, self.url, self.timeout, timestamp, self.detector)
+            except FETCH_ERRORS as e:
+                count_fetch_error(e)
+                if self.on_error is not None:
+                    self.on_error(e)
+                else:
+                    print("请求发生异常:", e)
+            else:
+                if json_sensor_data is not None:
+                    json_sensor_data.jitter_ms = round(scheduler.jitter * 1000, 3)
+                    if self.on_data is not None and not stop_event.is_set():
+                        # 下游的异常不能让采样线程退出，也不能打乱采样节拍
+                        try:
+                            self.on_data(json_sensor_data)
+                        except Exception:
+                            print("采样数据处理发生意外异常:")
+                            traceback.print_exc()
+            scheduler.advance()
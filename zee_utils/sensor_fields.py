@@ -0,0 +1,92 @@
+import math
+from array import array
+from collections import namedtuple
+
+from .sensor_sample import NAN, SampleLayout, SensorSample
+
+# 传感器字段定义：网关 data.sensor 中的字段名、类型、单位、界面显示名
+SensorField = namedtuple('SensorField', ['name', 'type', 'unit', 'label'])
+
+# 网关返回的 21 个传感器字段，顺序与界面网格一致
+SENSOR_SCHEMA = (
+    SensorField("Noise", float, "dB", "噪声"),
+    SensorField("Temperature", float, "℃", "温度"),
+    SensorField("Humidity", float, "%", "湿度"),
+    SensorField("Wind_Speed", float, "m/s", "风速"),
+    SensorField("Wind_Direction", float, "°", "风向"),
+    SensorField("Rainfall", float, "mm", "降雨量"),
+    SensorField("Radiation", float, "W/m2", "辐射"),
+    SensorField("Illumination", float, "Lux", "光照"),
+    SensorField("AirPressure", float, "hPa", "气压"),
+    SensorField("PM2.5", float, "μg/m3", "PM2.5"),
+    SensorField("PM10", float, "μg/m3", "PM10"),
+    SensorField("Ultraviolet_Ray", float, "μg/m3", "紫外线"),
+    SensorField("CO", float, "μg/m3", "CO"),
+    SensorField("SO2", float, "μg/m3", "SO2"),
+    SensorField("NO2", float, "μg/m3", "NO2"),
+    SensorField("O3", float, "μg/m3", "O3"),
+    SensorField("TVOC", float, "μg/m3", "TVOC"),
+    SensorField("People_Number", int, "人", "人数"),
+    SensorField("Car_Sum", int, "辆", "车辆数"),
+    SensorField("Car_Number_green", int, "辆", "新能源车辆数"),
+    SensorField("Car_Number_Notgreen", int, "辆", "燃油车辆数"),
+)
+
+SENSOR_FIELDS = tuple(field.name for field in SENSOR_SCHEMA)
+SENSOR_FIELD_MAP = {field.name: field for field in SENSOR_SCHEMA}
+
+
+def _to_int(value):
+    # 网关偶尔把计数写成 "3.0"
+    try:
+        number = int(value)
+    except ValueError:
+        number = int(float(value))
+    # 超出 float 范围的整数放进 array('d') 时才会溢出，在这里转换，由 parse 记为 NaN
+    return float(number)
+
+
+def _to_float(value):
+    number = float(value)
+    # "inf"、"nan"、"1e999" 都能被 float() 解析，统一按无法解析处理，由 parse 记为 NaN
+    if not math.isfinite(number):
+        raise ValueError("非有限数值: %r" % (value,))
+    return number
+
+
+_CONVERTERS = {
+    float: _to_float,
+    int: _to_int,
+}
+
+
+# 根据字段定义生成解析函数，只在启动时生成一次
+# 返回的函数一次遍历就把网关的字符串字典转换为 SensorSample，缺失或无法解析的值为 NaN
+def compile_parser(schema=SENSOR_SCHEMA):
+    layout = SampleLayout(schema)
+    converters = tuple((field.name, _CONVERTERS[field.type]) for field in schema)
+
+    def parse(raw, timestamp_ns=0):
+        values = []
+        get = raw.get
+        for name, convert in converters:
+            try:
+                values.append(convert(get(name)))
+            except (TypeError, ValueError, OverflowError):
+                # "inf" 之类的计数值 int() 会抛出 OverflowError
+                values.append(NAN)
+        return SensorSample(layout, array('d', values), timestamp_ns)
+
+    return parse
+
+
+parse_sensor = compile_parser()
+
+
+# 界面显示用，整数值不带小数点
+def format_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
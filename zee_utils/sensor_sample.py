@@ -0,0 +1,130 @@
+import time
+from array import array
+from datetime import datetime
+
+NAN = float('nan')
+# 最近一次格式化的 (秒, "年-月-日 时:分:秒")，同一秒内的样本只拼接微秒部分
+_second_cache = (None, "")
+
+
+def timestamp_to_ns(value):
+    dt = datetime.fromisoformat(value)
+    return int(dt.timestamp()) * 1000000000 + dt.microsecond * 1000
+
+
+def ns_to_timestamp(value):
+    global _second_cache
+    seconds, ns = divmod(int(value), 1000000000)
+    cached_seconds, prefix = _second_cache
+    if seconds != cached_seconds:
+        prefix = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(seconds))
+        _second_cache = (seconds, prefix)
+    return "%s.%06d" % (prefix, ns // 1000)
+
+
+# 一组字段定义对应的样本布局，同一 schema 的所有样本共用一个
+class SampleLayout:
+    def __init__(self, schema):
+        self.fields = tuple(field.name for field in schema)
+        self.index = {name: i for i, name in enumerate(self.fields)}
+        self.is_int = tuple(field.type is int for field in schema)
+        self.int_columns = tuple(i for i, is_int in enumerate(self.is_int) if is_int)
+        # 导出时的列顺序，与原来的字典记录一致：字段、timestamp、[deviceId]、[jitter_ms]
+        self._keys = {}
+        for has_device in (False, True):
+            for has_jitter in (False, True):
+                self._keys[has_device, has_jitter] = (list(self.fields) + ['timestamp']
+                                                      + ['deviceId'] * has_device + ['jitter_ms'] * has_jitter)
+
+    def columns(self, has_device=False, has_jitter=False):
+        return self._keys[has_device, has_jitter]
+
+
+# 一个采样：数值按 schema 顺序存放在 array('d') 里（缺失为 NaN），时间戳为 epoch 纳秒整数，
+# 比逐字段的字典小得多，数值数组可以直接写入环形缓冲区和归档
+# 时间戳只在显示或导出时格式化；get()、[] 和 keys() 与原来的字典记录用法相同，计数字段取出时为 int
+class SensorSample:
+    __slots__ = ('layout', 'values', 'timestamp_ns', 'device_id', 'jitter_ms')
+
+    def __init__(self, layout, values, timestamp_ns=0, device_id=None, jitter_ms=None):
+        self.layout = layout
+        self.values = values
+        self.timestamp_ns = timestamp_ns
+        self.device_id = device_id
+        self.jitter_ms = jitter_ms
+
+    @property
+    def timestamp(self):
+        return ns_to_timestamp(self.timestamp_ns)
+
+    def _value(self, i):
+        value = self.values[i]
+        if value != value:
+            return None
+        return int(value) if self.layout.is_int[i] else value
+
+    def get(self, name, default=None):
+        i = self.layout.index.get(name)
+        if i is not None:
+            value = self._value(i)
+        elif name == 'timestamp':
+            value = self.timestamp
+        elif name == 'deviceId':
+            value = self.device_id
+        elif name == 'jitter_ms':
+            value = self.jitter_ms
+        else:
+            value = None
+        return default if value is None else value
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None and name not in self.keys():
+            raise KeyError(name)
+        return value
+
+    def keys(self):
+        return self.layout._keys[self.device_id is not None, self.jitter_ms is not None]
+
+    # 按 keys() 的顺序导出一行，缺失值为 ''
+    def row(self):
+        row = self.values.tolist()
+        total = sum(row)
+        if total != total:
+            # 只有存在缺失值时才逐个检查
+            row = ['' if value != value else value for value in row]
+        for i in self.layout.int_columns:
+            if row[i] != '':
+                row[i] = int(row[i])
+        row.append(self.timestamp)
+        if self.device_id is not None:
+            row.append(self.device_id)
+        if self.jitter_ms is not None:
+            row.append(self.jitter_ms)
+        return row
+
+    def to_dict(self):
+        return {name: self.get(name) for name in self.keys()}
+
+    # 按 fields 的顺序取数值（缺失为 NaN），字段顺序与布局一致时直接返回数值数组
+    def values_for(self, fields):
+        if fields == self.layout.fields:
+            return self.values
+        index = self.layout.index
+        return array('d', [self.values[index[name]] if name in index else NAN for name in fields])
+
+    def __repr__(self):
+        return "SensorSample(%r)" % self.to_dict()
+
+
+# 样本或字典记录中按 fields 顺序排列的数值，字典中缺失的值为 None
+def record_values(record, fields):
+    if isinstance(record, SensorSample):
+        return record.values_for(fields)
+    return [record.get(name) for name in fields]
+
+
+def record_timestamp_ns(record):
+    if isinstance(record, SensorSample):
+        return record.timestamp_ns
+    return timestamp_to_ns(record['timestamp'])
@@ -0,0 +1,94 @@
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .decimation import MinMaxDecimator
+from .env_ring_buffer import EnvRingBuffer
+from .sensor_fields import SENSOR_FIELDS
+
+# 共享内存布局：头部 8 个 int64（容量、字段数、写入总数、保留），
+# 然后是时间戳列 int64[2 * 容量]，最后是数据 float32[字段数, 2 * 容量]，与 EnvRingBuffer 的镜像布局相同
+_HEADER_WORDS = 8
+_CAPACITY, _FIELD_COUNT, _COUNT = 0, 1, 2
+
+
+def _layout_size(capacity, field_count):
+    return _HEADER_WORDS * 8 + 2 * capacity * 8 + field_count * 2 * capacity * 4
+
+
+# 只连接已有的共享内存时不登记到 resource_tracker（Python 3.13+）；
+# 旧版本会登记，但 multiprocessing 启动的子进程与创建者共用同一个 resource_tracker，重复登记没有影响
+def _attach(name):
+    try:
+        return SharedMemory(name=name, track=False)
+    except TypeError:
+        return SharedMemory(name=name)
+
+
+# 放在 multiprocessing.shared_memory 里的 EnvRingBuffer：采集进程写入，界面进程按名字映射后直接读取，
+# 不经过序列化也不复制；读写接口（window/columns/range/channel/decimator）与 EnvRingBuffer 相同
+# 写入总数放在共享内存头部，写入方先写数据再加一，读取方读到的总数对应的数据已经写好
+# 只读映射（writable=False）的数组不可写，append 会抛出 ValueError
+# 创建者（owner）负责 unlink；close() 之后不能再使用
+class SharedRingBuffer(EnvRingBuffer):
+    def __init__(self, shm, fields=SENSOR_FIELDS, writable=False, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self._header = np.ndarray((_HEADER_WORDS,), dtype=np.int64, buffer=shm.buf)
+        self.capacity = int(self._header[_CAPACITY])
+        self.fields = tuple(fields)
+        if int(self._header[_FIELD_COUNT]) != len(self.fields):
+            raise ValueError("共享环形缓冲区 %s 的字段数与当前配置不一致" % shm.name)
+        self.field_index = {name: i for i, name in enumerate(self.fields)}
+        offset = _HEADER_WORDS * 8
+        self._timestamps = np.ndarray((2 * self.capacity,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += 2 * self.capacity * 8
+        self._data = np.ndarray((len(self.fields), 2 * self.capacity), dtype=np.float32, buffer=shm.buf,
+                                offset=offset)
+        if not writable:
+            self._header.flags.writeable = False
+            self._timestamps.flags.writeable = False
+            self._data.flags.writeable = False
+        self.decimator = MinMaxDecimator(self)
+
+    @classmethod
+    def create(cls, capacity, fields=SENSOR_FIELDS, writable=False):
+        fields = tuple(fields)
+        shm = SharedMemory(create=True, size=_layout_size(capacity, len(fields)))
+        header = np.ndarray((_HEADER_WORDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[_CAPACITY] = capacity
+        header[_FIELD_COUNT] = len(fields)
+        del header
+        data = np.ndarray((len(fields), 2 * capacity), dtype=np.float32, buffer=shm.buf,
+                          offset=_HEADER_WORDS * 8 + 2 * capacity * 8)
+        data.fill(np.nan)
+        del data
+        return cls(shm, fields, writable=writable, owner=True)
+
+    @classmethod
+    def attach(cls, name, fields=SENSOR_FIELDS, writable=False):
+        return cls(_attach(name), fields, writable=writable)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def _count(self):
+        return int(self._header[_COUNT])
+
+    @_count.setter
+    def _count(self, value):
+        self._header[_COUNT] = value
+
+    def close(self):
+        self.decimator.clear()
+        self._header = self._timestamps = self._data = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # 图表还持有视图时无法解除映射，进程退出时会自动释放
+            pass
+        if self.owner:
+            self.shm.unlink()
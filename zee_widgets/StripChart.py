@@ -0,0 +1,250 @@
+import numpy as np
+from PyQt5.QtCore import pyqtSignal, Qt, QRectF
+from PyQt5.QtGui import QColor, QFont, QPainter, QPen, QPixmap, QPolygonF
+from PyQt5.QtWidgets import QGridLayout, QWidget
+
+from .chart_bounds import calc_bounds, nice_ticks
+
+# 与 matplotlib 默认配色一致
+SERIES_COLORS = ("#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b", "#e377c2", "#7f7f7f")
+
+
+# 把 x、y 数组直接写进 QPolygonF 的内存，不逐点创建 QPointF
+def _polygon(x, y):
+    polygon = QPolygonF(len(x))
+    pointer = polygon.data()
+    pointer.setsize(len(x) * 16)
+    points = np.frombuffer(pointer, dtype=np.float64).reshape(len(x), 2)
+    points[:, 0] = x
+    points[:, 1] = y
+    return polygon
+
+
+# 按 NaN 拆分成连续的几段，缺失的样本处断开
+def _segments(x, y):
+    finite = np.isfinite(y)
+    if finite.all():
+        return [(x, y)]
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], finite, [False])).astype(np.int8)))
+    return [(x[start:end], y[start:end]) for start, end in zip(edges[::2], edges[1::2])]
+
+
+# QPainter 实时曲线，不依赖 matplotlib，接口与 LineChartWidget 相同（update_data / setTitle / plot_width）
+# 坐标轴、网格和标题画在缓存的 QPixmap 里，只有尺寸、范围或标题变化时才重画；
+# 每帧只把折线换算成像素坐标后用 drawPolyline 画出
+# compact=True 时只保留标题和纵轴上下限，用于多通道小图
+class StripChartWidget(QWidget):
+    data_updated = pyqtSignal(list)
+    zoom_requested = pyqtSignal(float)
+    scroll_requested = pyqtSignal(float)
+    clicked = pyqtSignal()
+
+    def __init__(self, parent=None, compact=False):
+        super().__init__(parent)
+        self.compact = compact
+        self.gramTitle = 'History Data'
+        self.series = {}  # 名称 -> [x, y, 画笔]
+        self.bounds = None
+        self.version = None
+        self.highlighted = False
+        self.background = None
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        if compact:
+            self.setMinimumSize(120, 60)
+        else:
+            self.setMinimumHeight(200)
+        self.add_series('data')
+
+        # 初始化数据
+        self.data = [1, 1, 1, 1, 11, 11, 1, 1, 1, 2]
+        self.plot_data()
+
+    def add_series(self, name, color=None):
+        color = QColor(color or SERIES_COLORS[len(self.series) % len(SERIES_COLORS)])
+        # 线宽超过 1 像素时 Qt 要先描边成多边形，抽稀后的锯齿折线会慢上百倍
+        pen = QPen(color, 1)
+        pen.setCosmetic(True)
+        self.series[name] = [np.empty(0), np.empty(0), pen]
+
+    def _margins(self):
+        if self.compact:
+            return 4, 16, 4, 4  # 左、上、右、下
+        metrics = self.fontMetrics()
+        return metrics.width("-0000.00") + 24, metrics.height() * 2, 16, metrics.height() * 2 + 8
+
+    def plot_rect(self):
+        left, top, right, bottom = self._margins()
+        return QRectF(left, top, max(self.width() - left - right, 1), max(self.height() - top - bottom, 1))
+
+    # 绘图区的像素宽度，用于决定抽稀后的点数
+    def plot_width(self):
+        return max(int(self.plot_rect().width()), 1)
+
+    # 完整重绘
+    def plot_data(self):
+        self.update_series('data', self.data)
+        self.bounds = self._calc_bounds(None, len(self.data) - 1)
+        self.background = None
+        self.update()
+
+    def setTitle(self, title):
+        self.gramTitle = title
+        self.version = None
+        self.background = None
+        self.update()
+
+    def set_highlighted(self, highlighted):
+        if highlighted != self.highlighted:
+            self.highlighted = highlighted
+            self.background = None
+            self.update()
+
+    def update_series(self, name, y, x=None):
+        y = np.asarray(y, dtype=float)
+        series = self.series[name]
+        series[0] = np.arange(len(y), dtype=float) if x is None else np.asarray(x, dtype=float)
+        series[1] = y
+
+    def _calc_bounds(self, bounds, x_max):
+        values = [series[1] for series in self.series.values() if len(series[1])]
+        return calc_bounds(np.concatenate(values) if values else [], bounds, x_max)
+
+    # version 与上次相同则跳过；范围变化时才重画坐标轴缓存
+    # x 为抽稀后各点的横坐标，x_max 为窗口的横向范围
+    def update_data(self, new_data, version=None, x=None, x_max=None):
+        if version is not None and version == self.version:
+            return
+        self.version = version
+        self.data = new_data
+        if x_max is None:
+            x_max = len(new_data) - 1
+        self.update_series('data', new_data, x)
+        bounds = self._calc_bounds(self.bounds, x_max)
+        if bounds != self.bounds:
+            self.bounds = bounds
+            self.background = None
+        self.update()
+
+    def resizeEvent(self, event):
+        self.background = None
+        super().resizeEvent(event)
+
+    def _render_background(self):
+        ratio = self.devicePixelRatioF()
+        pixmap = QPixmap(int(self.width() * ratio), int(self.height() * ratio))
+        pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(Qt.white)
+        painter = QPainter(pixmap)
+        rect = self.plot_rect()
+        x_min, x_max, y_min, y_max = self.bounds
+        grid_pen = QPen(QColor("#e0e0e0"))
+        grid_pen.setCosmetic(True)
+        if self.compact:
+            painter.setPen(grid_pen)
+            painter.drawRect(rect)
+            font = QFont(self.font())
+            font.setPointSizeF(max(font.pointSizeF() * 0.8, 6))
+            painter.setFont(font)
+            painter.setPen(QColor("#d62728") if self.highlighted else Qt.black)
+            painter.drawText(QRectF(rect.left(), 0, rect.width(), rect.top()), Qt.AlignLeft | Qt.AlignVCenter,
+                             self.gramTitle)
+            painter.setPen(QColor("#606060"))
+            painter.drawText(QRectF(rect.left(), 0, rect.width(), rect.top()), Qt.AlignRight | Qt.AlignVCenter,
+                             "%.4g ~ %.4g" % (y_min, y_max))
+            painter.end()
+            return pixmap
+        metrics = self.fontMetrics()
+        for value in nice_ticks(y_min, y_max):
+            y = rect.bottom() - (value - y_min) / (y_max - y_min) * rect.height()
+            painter.setPen(grid_pen)
+            painter.drawLine(int(rect.left()), int(y), int(rect.right()), int(y))
+            painter.setPen(Qt.black)
+            painter.drawText(QRectF(0, y - metrics.height() / 2, rect.left() - 6, metrics.height()),
+                             Qt.AlignRight | Qt.AlignVCenter, "%g" % round(value, 10))
+        for value in nice_ticks(x_min, x_max):
+            x = rect.left() + (value - x_min) / ((x_max - x_min) or 1) * rect.width()
+            painter.setPen(grid_pen)
+            painter.drawLine(int(x), int(rect.top()), int(x), int(rect.bottom()))
+            painter.setPen(Qt.black)
+            painter.drawText(QRectF(x - 40, rect.bottom() + 4, 80, metrics.height()), Qt.AlignHCenter | Qt.AlignTop,
+                             "%g" % round(value, 10))
+        painter.setPen(Qt.black)
+        painter.drawRect(rect)
+        painter.drawText(QRectF(rect.left(), 0, rect.width(), rect.top()), Qt.AlignCenter, self.gramTitle)
+        painter.drawText(QRectF(rect.left(), self.height() - metrics.height() - 4, rect.width(), metrics.height()),
+                         Qt.AlignCenter, 'Time')
+        painter.save()
+        painter.translate(metrics.height() / 2 + 2, rect.center().y())
+        painter.rotate(-90)
+        painter.drawText(QRectF(-rect.height() / 2, -metrics.height() / 2, rect.height(), metrics.height()),
+                         Qt.AlignCenter, 'Value')
+        painter.restore()
+        painter.end()
+        return pixmap
+
+    def paintEvent(self, event):
+        if self.bounds is None:
+            return
+        if self.background is None:
+            self.background = self._render_background()
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.background)
+        rect = self.plot_rect()
+        painter.setClipRect(rect)
+        painter.setRenderHint(QPainter.Antialiasing, not self.compact)
+        x_min, x_max, y_min, y_max = self.bounds
+        x_scale = rect.width() / ((x_max - x_min) or 1)
+        y_scale = rect.height() / ((y_max - y_min) or 1)
+        for x, y, pen in self.series.values():
+            if len(y) == 0:
+                continue
+            painter.setPen(pen)
+            px = rect.left() + (x - x_min) * x_scale
+            py = rect.bottom() - (y - y_min) * y_scale
+            for segment_x, segment_y in _segments(px, py):
+                if len(segment_x) > 1:
+                    painter.drawPolyline(_polygon(segment_x, segment_y))
+        painter.end()
+
+    def wheelEvent(self, event):
+        steps = event.angleDelta().y() / 120
+        if steps == 0:
+            return
+        if event.modifiers() & Qt.ShiftModifier:
+            self.scroll_requested.emit(steps * 0.25)
+        else:
+            self.zoom_requested.emit(0.8 ** steps)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.clicked.emit()
+
+
+# 多通道小图：每个字段一个紧凑的 StripChartWidget，点击小图发出 field_selected
+# 任意小图上的滚轮缩放/平移统一转发，所有小图使用同一个窗口
+class SmallMultiplesWidget(QWidget):
+    field_selected = pyqtSignal(str)
+    zoom_requested = pyqtSignal(float)
+    scroll_requested = pyqtSignal(float)
+
+    def __init__(self, fields, columns=3, parent=None):
+        super().__init__(parent)
+        self.panels = {}
+        layout = QGridLayout()
+        layout.setSpacing(2)
+        layout.setContentsMargins(0, 0, 0, 0)
+        for i, field in enumerate(fields):
+            panel = StripChartWidget(compact=True)
+            panel.setTitle(field)
+            panel.clicked.connect(lambda field=field: self.field_selected.emit(field))
+            panel.zoom_requested.connect(self.zoom_requested)
+            panel.scroll_requested.connect(self.scroll_requested)
+            layout.addWidget(panel, i // columns, i % columns)
+            self.panels[field] = panel
+        self.setLayout(layout)
+
+    # 切换数据源或选中字段时调用，所有小图在下一帧重画
+    def select(self, field):
+        for name, panel in self.panels.items():
+            panel.set_highlighted(name == field)
+            panel.version = None
@@ -1,12 +1,19 @@
 
 from PyQt5.QtCore import pyqtSignal, Qt
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLineEdit
-from PyQt5.QtGui import QMouseEvent
+from PyQt5.QtWidgets import QWidget, QVBoxLayout
+from .chart_bounds import calc_bounds
+from .ZeeInputs import ClickableLineEdit
 # 实时数据监测
+# 折线保持为同一个 Line2D，每帧只更新数据；坐标范围不变时用缓存的背景做 blit，
+# 数据版本号没有变化时直接跳过重绘
 class LineChartWidget(QWidget):
     data_updated = pyqtSignal(list)
+    # 滚轮缩放（参数为缩放倍数）和 Shift+滚轮平移（参数为平移的窗口比例）
+    zoom_requested = pyqtSignal(float)
+    scroll_requested = pyqtSignal(float)
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -17,36 +24,82 @@ class LineChartWidget(QWidget):
         self.setLayout(self.layout)
         self.gramTitle = 'History Data'
 
+        # 折线设为 animated，完整重绘时不画它，背景缓存里只有坐标轴、网格和标题
+        self.line, = self.ax.plot([], [], animated=True)
+        self.ax.set_xlabel('Time')
+        self.ax.set_ylabel('Value')
+        self.ax.set_title(self.gramTitle)
+        self.background = None
+        self.bounds = None
+        self.version = None
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
         # 初始化数据
         self.data = [1, 1, 1, 1, 11, 11, 1, 1, 1, 2]
         self.plot_data()
 
+    # 每次完整重绘（包括窗口缩放）之后重新缓存背景，再把折线画上去
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+
+    # 完整重绘
     def plot_data(self):
-        self.ax.clear()
-        self.ax.plot(self.data)
-        self.ax.set_xlabel('Time')
-        self.ax.set_ylabel('Value')
+        self.line.set_data(np.arange(len(self.data)), self.data)
+        self.bounds = self.calc_bounds(self.data, None, len(self.data) - 1)
+        self.apply_bounds()
         self.ax.set_title(self.gramTitle)
         self.canvas.draw()
 
+    def calc_bounds(self, data, bounds, x_max):
+        return calc_bounds(data, bounds, x_max)
+
+    def apply_bounds(self):
+        self.ax.set_xlim(self.bounds[0], self.bounds[1])
+        self.ax.set_ylim(self.bounds[2], self.bounds[3])
+
     def setTitle(self, title):
         self.gramTitle = title
+        self.ax.set_title(self.gramTitle)
+        self.version = None
         self.canvas.draw()
 
-    def update_data(self, new_data):
+    # 绘图区的像素宽度，用于决定抽稀后的点数
+    def plot_width(self):
+        return max(int(self.ax.bbox.width), 1)
+
+    # version 与上次相同则跳过；范围不变时只 blit 折线
+    # x 为抽稀后各点的横坐标，x_max 为窗口的横向范围
+    def update_data(self, new_data, version=None, x=None, x_max=None):
+        if version is not None and version == self.version:
+            return
+        self.version = version
         self.data = new_data
-        self.plot_data()
+        if x is None:
+            x = np.arange(len(new_data))
+        if x_max is None:
+            x_max = len(new_data) - 1
+        self.line.set_data(x, new_data)
+        bounds = self.calc_bounds(new_data, self.bounds, x_max)
+        if bounds != self.bounds or self.background is None:
+            self.bounds = bounds
+            self.apply_bounds()
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.ax.draw_artist(self.line)
+        self.canvas.blit(self.ax.bbox)
+
+    def wheelEvent(self, event):
+        steps = event.angleDelta().y() / 120
+        if steps == 0:
+            return
+        if event.modifiers() & Qt.ShiftModifier:
+            self.scroll_requested.emit(steps * 0.25)
+        else:
+            self.zoom_requested.emit(0.8 ** steps)
 
     def mousePressEvent(self, event):
         # 模拟数据更新
         self.data = [10, 8, 6, 4, 2, 4, 6, 8, 10, 12]
         self.data_updated.emit(self.data)
-
-
-class ClickableLineEdit(QLineEdit):
-    clicked = pyqtSignal(QLineEdit)
-    def mousePressEvent(self, event: QMouseEvent):
-        if event.button() == Qt.LeftButton:
-            self.clicked.emit(self)
-
-        super().mousePressEvent(event) 
\ No newline at end of file
@@ -0,0 +1,12 @@
+from PyQt5.QtCore import pyqtSignal, Qt
+from PyQt5.QtWidgets import QLineEdit
+from PyQt5.QtGui import QMouseEvent
+
+
+class ClickableLineEdit(QLineEdit):
+    clicked = pyqtSignal(QLineEdit)
+    def mousePressEvent(self, event: QMouseEvent):
+        if event.button() == Qt.LeftButton:
+            self.clicked.emit(self)
+
+        super().mousePressEvent(event) 
@@ -1,2 +1,20 @@
-from .ZeeCores import LineChartWidget
-from .ZeeCores import ClickableLineEdit
\ No newline at end of file
+import importlib
+
+# 按需导入：用到控件时才加载 matplotlib 和 Qt
+_EXPORTS = {
+    "LineChartWidget": ".ZeeCores",
+    "ClickableLineEdit": ".ZeeInputs",
+    "StripChartWidget": ".StripChart",
+    "SmallMultiplesWidget": ".StripChart",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
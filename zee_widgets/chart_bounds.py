@@ -0,0 +1,39 @@
+import math
+
+import numpy as np
+
+
+# 坐标范围 (x_min, x_max, y_min, y_max)：留出 10% 余量，
+# 只有数据超出当前范围或明显收缩时才返回新的范围，避免每帧重画坐标轴
+def calc_bounds(data, bounds, x_max):
+    data = np.asarray(data, dtype=float)
+    finite = data[np.isfinite(data)]
+    if len(finite) == 0:
+        return bounds if bounds is not None else (0, 10, 0, 1)
+    x_max = max(x_max, 1)
+    y_min = float(finite.min())
+    y_max = float(finite.max())
+    if bounds is not None:
+        old_x_max, old_y_min, old_y_max = bounds[1], bounds[2], bounds[3]
+        y_span = old_y_max - old_y_min
+        x_ok = x_max == old_x_max
+        y_ok = old_y_min <= y_min and y_max <= old_y_max and (y_max - y_min) >= y_span * 0.5
+        if x_ok and y_ok:
+            return bounds
+    margin = (y_max - y_min) * 0.1 or abs(y_max) * 0.1 or 1
+    return (0, x_max, y_min - margin, y_max + margin)
+
+
+# 取 1/2/5×10^n 的整齐刻度
+def nice_ticks(low, high, count=5):
+    span = high - low
+    if not span > 0:
+        return [low]
+    raw_step = span / count
+    magnitude = 10 ** math.floor(math.log10(raw_step))
+    for factor in (1, 2, 5, 10):
+        step = factor * magnitude
+        if step >= raw_step:
+            break
+    first = math.ceil(low / step) * step
+    return [first + i * step for i in range(int((high - first) / step + 1e-9) + 1)]